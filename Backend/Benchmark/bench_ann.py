@@ -0,0 +1,103 @@
+"""
+Rapport rappel@k / latence de l'index IVF-flat contre la recherche exacte.
+
+Usage (depuis Backend/) :
+    python Benchmark/bench_ann.py --size 50000 --dim 256
+    python Benchmark/bench_ann.py --index-dir data/vector_index   # vecteurs réels
+
+Les vecteurs synthétiques sont tirés autour de centres aléatoires (mélange
+gaussien), ce qui ressemble davantage à des embeddings de textes qu'un
+bruit uniforme ; les requêtes sont des vecteurs bruités du corpus.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import IVFIndex
+from vector_store import MmapVectorStore, normalize_rows
+
+
+def synthetic_store(size, dim, n_topics, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_topics, dim), dtype=np.float32)
+    topics = rng.integers(0, n_topics, size=size)
+    vectors = centers[topics] + 0.6 * rng.standard_normal((size, dim), dtype=np.float32)
+    store = MmapVectorStore()
+    store.add_embeddings(
+        [f"node-{i}" for i in range(size)],
+        vectors,
+        [f"doc-{topic}" for topic in topics],
+    )
+    return store
+
+
+def make_queries(store, n_queries, seed):
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.choice(len(store), size=n_queries, replace=False)
+    base = np.asarray(store.matrix[rows], dtype=np.float32)
+    noise = 0.05 * rng.standard_normal(base.shape, dtype=np.float32)
+    return normalize_rows(base + noise)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index-dir", help="Utiliser le vector store persisté de ce dossier")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--nlist", type=int, default=0, help="0 = automatique (~4·sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.index_dir:
+        store = MmapVectorStore.from_persist_dir(args.index_dir)
+    else:
+        store = synthetic_store(args.size, args.dim, args.topics, args.seed)
+    queries = make_queries(store, min(args.queries, len(store)), args.seed)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(store, nlist=args.nlist or None, seed=args.seed)
+    build_seconds = time.perf_counter() - start
+    print(f"📦 {len(store)} vecteurs, dimension {store.matrix.shape[1]}, "
+          f"{ivf.nlist} listes IVF (construction : {build_seconds:.1f} s)")
+
+    exact_latencies = []
+    exact_results = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = store.search(query, args.top_k)
+        exact_latencies.append(time.perf_counter() - start)
+        exact_results.append(set(rows.tolist()))
+    exact_p50 = np.percentile(exact_latencies, 50) * 1000
+
+    print(f"\n{'mode':>12} | {'rappel@' + str(args.top_k):>9} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | {'lignes scorées':>14}")
+    print("-" * 66)
+    print(f"{'exact':>12} | {1.0:>9.3f} | {exact_p50:>9.3f} | "
+          f"{np.percentile(exact_latencies, 99) * 1000:>9.3f} | {len(store):>14}")
+    for nprobe in args.nprobe:
+        if nprobe > ivf.nlist:
+            break
+        latencies = []
+        hits = 0
+        scanned = 0
+        for query, expected in zip(queries, exact_results):
+            start = time.perf_counter()
+            rows, _ = ivf.search(store, query, args.top_k, nprobe)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & set(rows.tolist()))
+            scanned += ivf.candidates(query, nprobe).shape[0]
+        recall = hits / (len(queries) * args.top_k)
+        print(f"{'ivf/' + str(nprobe):>12} | {recall:>9.3f} | {np.percentile(latencies, 50) * 1000:>9.3f} | "
+              f"{np.percentile(latencies, 99) * 1000:>9.3f} | {scanned // len(queries):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Débit et latence des embeddings de questions concurrentes, avec et sans
+micro-batching (embed_batcher.py).
+
+Usage (depuis Backend/) :
+    python Benchmark/bench_embed_batch.py
+    python Benchmark/bench_embed_batch.py --concurrency 1 8 32 128 --window-ms 2 --max-batch 64
+    python Benchmark/bench_embed_batch.py --host http://localhost:11434   # vrai serveur Ollama
+
+Sans --host, un FakeUpstreamServer local imite un Ollama dont chaque
+passe coûte `--latency` secondes plus `--item-latency` par texte, et qui
+ne traite que `--parallel` requêtes à la fois. Pour chaque niveau de
+concurrence, `--queries` questions distinctes sont embeddées par
+aget_query_embedding, une requête /api/embed par question ou regroupées
+par MicroBatchEmbedding. « requêtes » compte les appels reçus par le
+serveur.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+from llama_index.embeddings.ollama import OllamaEmbedding
+from ollama import AsyncClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embed_batcher import MicroBatchEmbedding
+from fakes import FakeUpstreamServer
+from upstream import transports
+
+
+def embed_model(host, model, pool_size):
+    embed = OllamaEmbedding(model_name=model, base_url=host)
+    _, transport = transports("ollama", pool_size=pool_size, failure_threshold=0, deadline=60.0)
+    embed._async_client = AsyncClient(host=host, transport=transport)
+    return embed
+
+
+async def run(embed, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            await embed.aget_query_embedding(query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", help="Serveur Ollama à interroger (sinon serveur factice)")
+    parser.add_argument("--model", default="bge-m3")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--latency", type=float, default=0.015)
+    parser.add_argument("--item-latency", type=float, default=0.002)
+    parser.add_argument("--parallel", type=int, default=2)
+    parser.add_argument("--window-ms", type=float, default=3.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    args = parser.parse_args()
+
+    server = None
+    host = args.host
+    if host is None:
+        server = FakeUpstreamServer(latency=args.latency, item_latency=args.item_latency,
+                                    parallel=args.parallel).start()
+        host = server.url
+        print(f"🧪 Serveur factice : {args.latency * 1000:.0f} ms par passe + {args.item_latency * 1000:.0f} ms "
+              f"par texte, {args.parallel} requêtes traitées à la fois")
+
+    configs = [
+        ("sans regroupement", lambda: embed_model(host, args.model, max(args.concurrency))),
+        (f"fenêtre {args.window_ms:g} ms, lots ≤ {args.max_batch}",
+         lambda: MicroBatchEmbedding(embed_model(host, args.model, max(args.concurrency)),
+                                     window=args.window_ms / 1000, max_batch=args.max_batch)),
+    ]
+    header = (f"{'configuration':>26} | {'conc.':>5} | {'débit (q/s)':>11} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | "
+              f"{'requêtes':>8} | {'lot moyen':>9}")
+    print("\n" + header)
+    print("-" * len(header))
+    for concurrency in args.concurrency:
+        for name, factory in configs:
+            embed = factory()
+            # Questions distinctes à chaque passe : aucun doublon regroupé
+            queries = [f"Quels sont les symptômes du diabète ? ({concurrency}, {i})" for i in range(args.queries)]
+            before = server.requests if server else 0
+            latencies, elapsed = asyncio.run(run(embed, queries, concurrency))
+            sent = (server.requests - before) if server else 0
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            mean_batch = embed.batcher.stats()["mean_batch_size"] if isinstance(embed, MicroBatchEmbedding) else 1.0
+            print(f"{name:>26} | {concurrency:>5} | {len(queries) / elapsed:>11.0f} | {p50:>9.1f} | {p99:>9.1f} | "
+                  f"{sent if server else '-':>8} | {mean_batch:>9.1f}")
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Rapport mémoire / latence / rappel@k des codes quantifiés contre la recherche exacte.
+
+Usage (depuis Backend/) :
+    python Benchmark/bench_quant.py --size 50000 --dim 1024
+    python Benchmark/bench_quant.py --index-dir data/vector_index   # vecteurs réels
+    python Benchmark/bench_quant.py --pca-dim 0 256 --rescore 0 4 10
+
+Chaque configuration (int8 / pq, avec ou sans PCA) est mesurée sans
+rescoring (scores des codes seuls) puis avec rescoring des top_k × facteur
+candidats sur la matrice float32. La mémoire compte les codes et les
+paramètres gardés en RAM, à comparer à la matrice pleine précision.
+Les vecteurs synthétiques sont ceux de bench_ann.py (mélange gaussien).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ann import make_queries, synthetic_store
+from quantization import QuantizedIndex
+from vector_store import MmapVectorStore
+
+
+def _format_bytes(size):
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if size < 1024 or unit == "Go":
+            return f"{size:.1f} {unit}" if unit != "o" else f"{size} o"
+        size /= 1024
+
+
+def run(search, queries, expected, top_k):
+    latencies = []
+    hits = 0
+    for query, reference in zip(queries, expected):
+        start = time.perf_counter()
+        rows, _ = search(query)
+        latencies.append(time.perf_counter() - start)
+        hits += len(reference & set(np.asarray(rows).tolist()))
+    return hits / (len(queries) * top_k), np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index-dir", help="Utiliser le vector store persisté de ce dossier")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--kinds", nargs="+", default=["int8", "pq"], choices=["int8", "pq"])
+    parser.add_argument("--pca-dim", type=int, nargs="+", default=[0, 256], help="0 = sans PCA")
+    parser.add_argument("--pq-m", type=int, default=0, help="Sous-vecteurs PQ (0 = automatique)")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 10],
+                        help="Facteurs de sur-échantillonnage (0 = sans rescoring)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.index_dir:
+        store = MmapVectorStore.from_persist_dir(args.index_dir)
+    else:
+        store = synthetic_store(args.size, args.dim, args.topics, args.seed)
+    queries = make_queries(store, min(args.queries, len(store)), args.seed)
+    matrix_bytes = store.matrix.nbytes
+    print(f"📦 {len(store)} vecteurs, dimension {store.matrix.shape[1]}, "
+          f"matrice {store.matrix.dtype} : {_format_bytes(matrix_bytes)}")
+
+    expected = [set(store.search(query, args.top_k)[0].tolist()) for query in queries]
+    recall, p50, p99 = run(lambda q: store.search(q, args.top_k), queries, expected, args.top_k)
+
+    header = (f"{'mode':>16} | {'mémoire':>10} | {'ratio':>6} | {'rappel@' + str(args.top_k):>9} | "
+              f"{'p50 (ms)':>9} | {'p99 (ms)':>9} | {'encodage':>9}")
+    print("\n" + header)
+    print("-" * len(header))
+    print(f"{'exact':>16} | {_format_bytes(matrix_bytes):>10} | {1.0:>6.1f} | {recall:>9.3f} | "
+          f"{p50:>9.3f} | {p99:>9.3f} | {'-':>9}")
+
+    for kind in args.kinds:
+        for pca_dim in args.pca_dim:
+            if pca_dim >= store.matrix.shape[1] or pca_dim > len(store):
+                continue
+            start = time.perf_counter()
+            index = QuantizedIndex.build(store, kind=kind, pca_dim=pca_dim, subspaces=args.pq_m, seed=args.seed)
+            build_seconds = time.perf_counter() - start
+            name = kind + (f"/pca{pca_dim}" if pca_dim else "")
+            if kind == "pq":
+                name += f"/m{index.subspaces}"
+            for rescore in args.rescore:
+                recall, p50, p99 = run(
+                    lambda q: index.search(store, q, args.top_k, rescore), queries, expected, args.top_k
+                )
+                label = f"{name}+r{rescore}" if rescore else name
+                print(f"{label:>16} | {_format_bytes(index.nbytes):>10} | {matrix_bytes / index.nbytes:>6.1f} | "
+                      f"{recall:>9.3f} | {p50:>9.3f} | {p99:>9.3f} | {build_seconds:>8.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Banc d'évaluation hors ligne du pipeline RAG (sans démarrer l'API).
+
+Chaque question d'un jeu JSONL suit le chemin de /query : embedding de la
+question, recherche, génération, puis évaluation (scores de CustomEvaluator),
+avec `--concurrency` questions en parallèle. Le rapport donne les percentiles
+de latence de chaque étape, le débit (QPS), la moyenne des scores et, si le
+jeu indique les URLs attendues, la qualité de la recherche (hit@k, MRR).
+
+Avec --fake, l'embedding et le LLM sont remplacés par les modèles factices
+déterministes de fakes.py et l'index est construit dans un dossier
+temporaire : le banc tourne entièrement hors ligne, par exemple en CI.
+
+Format du jeu de questions (une par ligne, `expected_urls` optionnel) :
+    {"question": "...", "expected_urls": ["https://..."]}
+
+Usage (depuis Backend/) :
+    python Benchmark/bench_rag.py --fake
+    python Benchmark/bench_rag.py --concurrency 16 --output rapport.json
+    python Benchmark/bench_rag.py --fake --min-hit-rate 0.5 --min-score 0.6   # code de sortie 1 en dessous
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import urldefrag
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.jsonl')
+STAGES = ("embed", "retrieve", "llm", "evaluate", "total")
+SCORES = ("answer_relevancy", "context_precision", "context_recall", "global_score")
+
+
+def load_dataset(path):
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    return items
+
+
+def _url_key(url):
+    # Les fragments (#:~:text=...) désignent la même page
+    return urldefrag(url or "")[0].rstrip('/')
+
+
+def retrieval_rank(sources, expected_urls):
+    """Rang (1 = premier) de la première source attendue, ou None."""
+    expected = {_url_key(url) for url in expected_urls}
+    for rank, source in enumerate(sources, start=1):
+        if _url_key(source["url"]) in expected:
+            return rank
+    return None
+
+
+async def run_question(rag, item, semaphore):
+    """Exécute une question étape par étape et mesure chaque étape (ms)."""
+    # Modules déjà chargés par RAGModel : imports locaux, comme dans crud
+    from llama_index.core import QueryBundle
+    from crud import format_sources, global_score
+
+    question = item["question"]
+    timings = {}
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            embedding = await rag.embed_model.aget_query_embedding(question)
+            timings["embed"] = (time.perf_counter() - start) * 1000
+
+            step = time.perf_counter()
+            query_bundle = QueryBundle(question, embedding=embedding)
+            nodes = await rag.retriever.aretrieve(query_bundle)
+            sources = format_sources(nodes)
+            timings["retrieve"] = (time.perf_counter() - step) * 1000
+
+            step = time.perf_counter()
+            answer = str(await rag.query_engine.asynthesize(query_bundle, nodes))
+            timings["llm"] = (time.perf_counter() - step) * 1000
+
+            step = time.perf_counter()
+            scores = await rag.aevaluate_answer(embedding, answer, sources)
+            scores["global_score"] = global_score(scores)
+            timings["evaluate"] = (time.perf_counter() - step) * 1000
+        except Exception as e:
+            return {"question": question, "error": str(e)}
+        timings["total"] = (time.perf_counter() - start) * 1000
+
+    result = {
+        "question": question,
+        "answer": answer,
+        "sources": [source["url"] for source in sources],
+        "scores": scores,
+        "timings_ms": {stage: round(value, 2) for stage, value in timings.items()},
+    }
+    if item.get("expected_urls"):
+        result["rank"] = retrieval_rank(sources, item["expected_urls"])
+    return result
+
+
+async def run_benchmark(rag, items, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_question(rag, item, semaphore) for item in items))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall_time, concurrency):
+    ok = [result for result in results if "error" not in result]
+    latency = {}
+    for stage in STAGES:
+        values = np.array([result["timings_ms"][stage] for result in ok])
+        if values.size:
+            latency[stage] = {
+                "p50": round(float(np.percentile(values, 50)), 2),
+                "p90": round(float(np.percentile(values, 90)), 2),
+                "p99": round(float(np.percentile(values, 99)), 2),
+                "mean": round(float(values.mean()), 2),
+            }
+    ranked = [result for result in ok if "rank" in result]
+    retrieval = None
+    if ranked:
+        retrieval = {
+            "questions": len(ranked),
+            "hit_rate": sum(result["rank"] is not None for result in ranked) / len(ranked),
+            "mrr": sum(1 / result["rank"] for result in ranked if result["rank"]) / len(ranked),
+        }
+    return {
+        "questions": len(results),
+        "errors": len(results) - len(ok),
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_time, 3),
+        "qps": round(len(ok) / wall_time, 2) if wall_time else 0.0,
+        "latency_ms": latency,
+        "scores": {name: float(np.mean([result["scores"][name] for result in ok])) if ok else 0.0
+                   for name in SCORES},
+        "retrieval": retrieval,
+    }
+
+
+def print_report(report):
+    print()
+    print(f"📊 {report['questions']} questions, {report['errors']} erreurs, "
+          f"concurrence {report['concurrency']} : {report['wall_time_s']:.2f} s, {report['qps']:.2f} questions/s")
+    print()
+    print(f"{'étape':>10} | {'p50 (ms)':>10} | {'p90 (ms)':>10} | {'p99 (ms)':>10} | {'moy. (ms)':>10}")
+    for stage, values in report["latency_ms"].items():
+        print(f"{stage:>10} | {values['p50']:>10.1f} | {values['p90']:>10.1f} | "
+              f"{values['p99']:>10.1f} | {values['mean']:>10.1f}")
+    print()
+    for name, value in report["scores"].items():
+        print(f"   • {name} : {value:.3f}")
+    if report["retrieval"]:
+        retrieval = report["retrieval"]
+        print(f"   • hit@k : {retrieval['hit_rate']:.3f}, MRR : {retrieval['mrr']:.3f} "
+              f"({retrieval['questions']} questions avec URLs attendues)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="Questions (JSONL)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions traitées en parallèle")
+    parser.add_argument("--fake", action="store_true",
+                        help="Embedding et LLM factices, index temporaire (hors ligne)")
+    parser.add_argument("--corpus", help="Corpus scrapé (JSON ou JSONL), par défaut celui de l'API")
+    parser.add_argument("--index-dir", help="Dossier de l'index (par défaut : celui de l'API, temporaire avec --fake)")
+    parser.add_argument("--output", help="Écrire le rapport et le détail par question (JSON)")
+    parser.add_argument("--min-hit-rate", type=float, help="Échec si hit@k est inférieur")
+    parser.add_argument("--min-score", type=float, help="Échec si le score global moyen est inférieur")
+    args = parser.parse_args()
+
+    # La configuration est lue à l'import de config : l'environnement est fixé avant
+    tmp_index = None
+    if args.fake:
+        os.environ["RAG_LLM_BACKEND"] = "fake"
+        os.environ["RAG_EMBED_BACKEND"] = "fake"
+        # Un cache d'embeddings partagé fausserait les mesures et mélangerait les modèles
+        os.environ["RAG_EMBED_CACHE"] = "0"
+        if not args.index_dir:
+            tmp_index = tempfile.mkdtemp(prefix="rag-benchmark-")
+            args.index_dir = os.path.join(tmp_index, "vector_index")
+    if args.corpus:
+        os.environ["RAG_SCRAPED_DATA"] = args.corpus
+    if args.index_dir:
+        os.environ["RAG_INDEX_DIR"] = args.index_dir
+    os.environ["RAG_RESPONSE_CACHE"] = "0"
+
+    from model import RAGModel
+
+    items = load_dataset(args.dataset)
+    try:
+        rag = RAGModel()
+        print(f"🚀 {len(items)} questions, {args.concurrency} en parallèle...")
+        results, wall_time = asyncio.run(run_benchmark(rag, items, args.concurrency))
+    finally:
+        if tmp_index:
+            shutil.rmtree(tmp_index, ignore_errors=True)
+
+    report = summarize(results, wall_time, args.concurrency)
+    print_report(report)
+    for result in results:
+        if "error" in result:
+            print(f"❌ {result['question']} : {result['error']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"report": report, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Rapport écrit dans {args.output}")
+
+    failures = []
+    if report["errors"]:
+        failures.append(f"{report['errors']} questions en erreur")
+    if args.min_hit_rate is not None:
+        hit_rate = report["retrieval"]["hit_rate"] if report["retrieval"] else 0.0
+        if hit_rate < args.min_hit_rate:
+            failures.append(f"hit@k {hit_rate:.3f} < {args.min_hit_rate}")
+    if args.min_score is not None and report["scores"]["global_score"] < args.min_score:
+        failures.append(f"score global {report['scores']['global_score']:.3f} < {args.min_score}")
+    if failures:
+        print(f"❌ Régression : {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
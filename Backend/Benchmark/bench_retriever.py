@@ -0,0 +1,91 @@
+"""
+Micro-benchmark : retriever NumPy (MmapVectorStore.search) contre le
+SimpleVectorStore de LlamaIndex, sur des nodes synthétiques.
+
+Usage (depuis Backend/) :
+    python Benchmark/bench_retriever.py --sizes 1000 10000 100000 --dim 256
+
+Attention : le SimpleVectorStore garde les embeddings en listes Python
+(~32 octets par float) ; à 100k nodes en dimension 1024 il faut ~3 Go de RAM.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.simple import SimpleVectorStoreData
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from vector_store import MmapVectorStore
+
+
+def build_stores(size, dim, seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    node_ids = [f"node-{i}" for i in range(size)]
+    doc_codes = np.arange(size, dtype=np.int32) % 50
+
+    numpy_store = MmapVectorStore()
+    numpy_store.add_embeddings(
+        node_ids,
+        vectors,
+        [f"doc-{code}" for code in doc_codes],
+        [{"url": f"https://example.org/{code}", "timestamp": "2025-01-01"} for code in doc_codes],
+    )
+
+    embedding_dict = dict(zip(node_ids, vectors.tolist()))
+    simple_store = SimpleVectorStore(data=SimpleVectorStoreData(
+        embedding_dict=embedding_dict,
+        text_id_to_ref_doc_id={node_id: f"doc-{code}" for node_id, code in zip(node_ids, doc_codes)},
+        metadata_dict={},
+    ))
+    return numpy_store, simple_store
+
+
+def time_queries(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed + 1)
+    print(f"{'nodes':>8} | {'stock (ms)':>12} | {'numpy (ms)':>12} | {'speedup':>8} | top-k identique")
+    print("-" * 66)
+    for size in args.sizes:
+        numpy_store, simple_store = build_stores(size, args.dim, args.seed)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32).tolist()
+
+        stock_queries = queries[:max(1, min(len(queries), 5 if size >= 100000 else len(queries)))]
+        stock = time_queries(
+            lambda q: simple_store.query(VectorStoreQuery(query_embedding=q, similarity_top_k=args.top_k)),
+            stock_queries,
+        )
+        fast = time_queries(lambda q: numpy_store.search(q, args.top_k), queries)
+
+        same = all(
+            simple_store.query(VectorStoreQuery(query_embedding=q, similarity_top_k=args.top_k)).ids
+            == [numpy_store.node_id(row) for row in numpy_store.search(q, args.top_k)[0]]
+            for q in stock_queries[:3]
+        )
+        speedup = np.median(stock) / np.median(fast)
+        print(f"{size:>8} | {np.median(stock):>12.2f} | {np.median(fast):>12.3f} | {speedup:>7.0f}x | {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Taux de succès et latence des embeddings de questions face à un Ollama
+instable, avec et sans la couche résiliente (upstream.py).
+
+Usage (depuis Backend/) :
+    python Benchmark/bench_upstream.py
+    python Benchmark/bench_upstream.py --error-rate 0.1 --slow-rate 0.05 --slow-latency 1.0 --hedge-after 0.05
+    python Benchmark/bench_upstream.py --host http://localhost:11434   # vrai serveur Ollama
+
+Sans --host, un FakeUpstreamServer local injecte la latence, les lenteurs
+occasionnelles et les erreurs demandées. Trois configurations sont
+comparées : client ollama par défaut, tentatives (attente exponentielle
+avec gigue) et tentatives + requêtes couvertes. « requêtes » compte les
+appels reçus par le serveur : le surcoût des tentatives et du hedging.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+from ollama import AsyncClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeUpstreamServer
+from upstream import transports
+
+
+async def run(client, queries, concurrency, model):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(query):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await client.embed(model=model, input=query)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(query) for query in queries))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", help="Serveur Ollama à interroger (sinon serveur factice)")
+    parser.add_argument("--model", default="bge-m3")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--hedge-after", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = None
+    host = args.host
+    if host is None:
+        server = FakeUpstreamServer(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                                    error_rate=args.error_rate, drop_rate=args.drop_rate).start()
+        host = server.url
+        print(f"🧪 Serveur factice : latence {args.latency * 1000:.0f} ms, {args.slow_rate:.0%} de requêtes à "
+              f"{args.slow_latency * 1000:.0f} ms, {args.error_rate:.0%} d'erreurs 503, "
+              f"{args.drop_rate:.0%} de connexions coupées")
+
+    queries = [f"Quels sont les symptômes du diabète de type {i % 2 + 1} ? ({i})" for i in range(args.queries)]
+    configs = [
+        ("client par défaut", None),
+        (f"tentatives ({args.retries})", {"max_retries": args.retries}),
+        (f"+ hedging ({args.hedge_after * 1000:.0f} ms)",
+         {"max_retries": args.retries, "hedge_after": args.hedge_after, "hedge_paths": ("/api/embed",)}),
+    ]
+    header = f"{'configuration':>22} | {'succès':>7} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'p99 (ms)':>9} | {'requêtes':>8}"
+    print("\n" + header)
+    print("-" * len(header))
+    for name, options in configs:
+        if options is None:
+            client = AsyncClient(host=host)
+        else:
+            # Disjoncteur désactivé : on mesure les tentatives et le hedging seuls
+            _, transport = transports("ollama", failure_threshold=0, deadline=30.0, backoff=0.05, **options)
+            client = AsyncClient(host=host, transport=transport)
+        before = server.requests if server else 0
+        latencies, errors = asyncio.run(run(client, queries, args.concurrency, args.model))
+        sent = (server.requests - before) if server else 0
+        p50, p95, p99 = (np.percentile(latencies, [50, 95, 99]) * 1000) if latencies else (0, 0, 0)
+        print(f"{name:>22} | {1 - errors / len(queries):>7.1%} | {p50:>9.1f} | {p95:>9.1f} | {p99:>9.1f} | "
+              f"{sent if server else '-':>8}")
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
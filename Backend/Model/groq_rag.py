@@ -203,9 +203,8 @@ def main():
         index.storage_context.persist(persist_dir=index_dir)
         print("✅ Index créé et sauvegardé !")
 
-    # Créer le query engine et retriever
+    # Créer le query engine (ses source_nodes servent de contextes à l'évaluation)
     query_engine = index.as_query_engine(similarity_top_k=3)
-    retriever = index.as_retriever(similarity_top_k=3)
 
     # Chat interactif avec RAG + évaluation personnalisée
     print("\n" + "="*60)
@@ -237,9 +236,8 @@ def main():
             
             print(f"\n🤖 Réponse: {response_text}")
 
-            # Récupérer les contextes pour l'évaluation
-            retrieved_docs = retriever.retrieve(user_question)
-            contexts = [doc.text for doc in retrieved_docs]
+            # Contextes de l'évaluation : les chunks déjà retrouvés pour la réponse
+            contexts = [node.node.get_content() for node in response.source_nodes]
 
             # Évaluation personnalisée - RAPIDE ET FIABLE
             print("\n📊 Évaluation en cours...")
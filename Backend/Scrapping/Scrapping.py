@@ -1,7 +1,24 @@
 import trafilatura
 import os
-import json
+import sys
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from corpus import CorpusStore, load_corpus, text_hash
+
+DEFAULT_STORE = os.path.join(BACKEND_DIR, 'data', 'scraped_data.jsonl')
+LEGACY_JSON = os.path.join(BACKEND_DIR, 'data', 'scraped_data.json')
+USER_AGENT = "Mozilla/5.0 (compatible; Chat-IA-Rag scraper)"
 
 def scrape_text_from_url(url):
     """
@@ -31,6 +48,175 @@ def scrape_text_from_url(url):
         print(f"Error scraping {url}: {e}")
         return None
 
+class HostLimiter:
+    """
+    Politeness limits: at most `per_host` concurrent requests per host,
+    and at least `delay` seconds between two requests to the same host.
+    """
+    def __init__(self, per_host=1, delay=1.0):
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_slot.get(host, 0.0))
+                self._next_slot[host] = start + self.delay
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+_thread_local = threading.local()
+
+
+def _session():
+    # One HTTP session (connection pool) per worker thread
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+        _thread_local.session.headers["User-Agent"] = USER_AGENT
+    return _thread_local.session
+
+
+def fetch_page(url, validators=None, timeout=30):
+    """
+    Conditional GET of a page.
+
+    Args:
+        url (str): The URL to fetch.
+        validators (dict): Previous {"etag", "last_modified"} of the page, if any.
+        timeout (float): Request timeout in seconds.
+
+    Returns:
+        requests.Response: The response (status 304 if the page has not changed).
+    """
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return _session().get(url, headers=headers, timeout=timeout, allow_redirects=True)
+
+
+def scrape_page(url, limiter, validators=None, previous_hash=None, timeout=30):
+    """
+    Fetch and extract a page, skipping it when it has not changed.
+
+    Returns:
+        tuple: (status, record) where status is "new", "updated", "unchanged",
+        "not_modified" or "failed", and record is the dict to append to the
+        store (None when nothing has to be written).
+    """
+    try:
+        with limiter.slot(url):
+            response = fetch_page(url, validators, timeout)
+    except requests.RequestException as e:
+        print(f"Error scraping {url}: {e}")
+        return "failed", None
+
+    if response.status_code == 304:
+        return "not_modified", None
+    if response.status_code >= 400:
+        print(f"Failed to fetch content from {url} (HTTP {response.status_code})")
+        return "failed", None
+
+    text = trafilatura.extract(response.text)
+    if text is None:
+        print(f"Failed to extract text from {url}")
+        return "failed", None
+
+    record = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    digest = text_hash(text)
+    if digest == previous_hash:
+        # Same content: only refresh the HTTP validators
+        if validators != {"etag": record["etag"], "last_modified": record["last_modified"]}:
+            return "unchanged", record
+        return "unchanged", None
+
+    record.update({
+        "content": text,
+        "timestamp": datetime.now().isoformat(),
+        "content_hash": digest,
+    })
+    return ("updated" if previous_hash else "new"), record
+
+
+def scrape_all(urls, store, workers=8, per_host=1, delay=1.0, timeout=30, force=False):
+    """
+    Scrape the URLs concurrently and append new or changed pages to the store.
+    Only the calling thread writes to the store.
+
+    Returns:
+        dict: Number of URLs per status.
+    """
+    limiter = HostLimiter(per_host=per_host, delay=delay)
+    counts = {"new": 0, "updated": 0, "unchanged": 0, "not_modified": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                scrape_page,
+                url,
+                limiter,
+                None if force else store.validators.get(url),
+                None if force else store.content_hash(url),
+                timeout,
+            ): url
+            for url in dict.fromkeys(urls)
+        }
+        for future in as_completed(futures):
+            url = futures[future]
+            status, record = future.result()
+            if record is not None:
+                store.append(record)
+            counts[status] += 1
+            print(f"[{status}] {url}")
+    return counts
+
+
+def open_store(path):
+    """Open the JSONL store, seeding it from the legacy scraped_data.json on first run."""
+    seed = not os.path.exists(path) and os.path.exists(LEGACY_JSON)
+    store = CorpusStore(path)
+    if seed:
+        for item in load_corpus(LEGACY_JSON):
+            store.append({
+                "url": item["url"],
+                "content": item["content"],
+                "timestamp": item["timestamp"],
+                "content_hash": text_hash(item["content"]),
+            })
+        print(f"Seeded {path} with {len(store.documents)} pages from {LEGACY_JSON}")
+    return store
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent, incremental scraper")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="Append-only JSONL store")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent fetches")
+    parser.add_argument("--per-host", type=int, default=1, help="Concurrent fetches per host")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds between two requests to the same host")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--force", action="store_true", help="Ignore ETag/Last-Modified and content hashes")
+    parser.add_argument("--compact", action="store_true",
+                        help="Rewrite the store with one record per URL, dropping URLs no longer listed")
+    parser.add_argument("--export-json", metavar="PATH",
+                        help="Also write the current corpus in the legacy scraped_data.json format")
+    return parser.parse_args()
+
+
 # Example usage
 if __name__ == "__main__":
     urls = [
@@ -201,30 +387,27 @@ if __name__ == "__main__":
             "contenu": "Synthèses d’études, vulgarisation, articles accessibles destinés au grand public."
         }
     }
-    for url in urls:
-        scraped_text = scrape_text_from_url(url)
-        if scraped_text:
-            print("Extracted text:")
-            print(scraped_text)
-            # Load existing data or create new list
-            filename = 'scraped_data.json'
-            if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data_list = json.load(f)
-            else:
-                data_list = []
-            
-            # Append new data
-            new_data = {
-                "url": url,
-                "content": scraped_text,
-                "timestamp": datetime.now().isoformat()
-            }
-            data_list.append(new_data)
-            
-            # Save back
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data_list, f, ensure_ascii=False, indent=4)
-            print(f"Data appended to {filename}")
-        else:
-            print(f"No text extracted for {url}.")
+    args = parse_args()
+    store = open_store(args.store)
+
+    start = time.perf_counter()
+    counts = scrape_all(
+        urls,
+        store,
+        workers=args.workers,
+        per_host=args.per_host,
+        delay=args.delay,
+        timeout=args.timeout,
+        force=args.force,
+    )
+    print(
+        f"Done in {time.perf_counter() - start:.1f}s: {counts['new']} new, {counts['updated']} updated, "
+        f"{counts['unchanged'] + counts['not_modified']} unchanged, {counts['failed']} failed"
+    )
+
+    if args.compact:
+        store.compact(keep_urls=urls)
+        print(f"Compacted {args.store} ({len(store.documents)} pages)")
+    if args.export_json:
+        store.export_json(args.export_json)
+        print(f"Data exported to {args.export_json}")
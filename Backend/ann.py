@@ -0,0 +1,185 @@
+"""
+Index approximatif (ANN) IVF-flat en NumPy pur.
+
+Un quantificateur grossier (k-means sphérique) répartit les lignes de la
+matrice du MmapVectorStore en `nlist` listes inversées. Une requête ne score
+exactement que les lignes des `nprobe` listes dont le centroïde est le plus
+proche, au lieu de toute la matrice.
+
+Fichiers écrits à côté du vector store (namespace "default") :
+    default__ivf_centroids.npy   centroïdes (nlist, D) float32 normalisés
+    default__ivf_offsets.npy     bornes (nlist + 1,) des listes dans ivf_rows
+    default__ivf_rows.npy        lignes de la matrice triées par liste
+    default__ivf.json            en-tête : nlist, nombre de lignes, empreinte des node ids
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from vector_store import DEFAULT_NAMESPACE, normalize_rows
+
+# Nombre de lignes assignées par bloc (borne la mémoire de la matrice de scores)
+_ASSIGN_BLOCK_ROWS = 16384
+
+
+def _ivf_paths(persist_dir, namespace=DEFAULT_NAMESPACE):
+    prefix = os.path.join(persist_dir, f"{namespace}__ivf")
+    return {
+        "centroids": prefix + "_centroids.npy",
+        "offsets": prefix + "_offsets.npy",
+        "rows": prefix + "_rows.npy",
+        "header": prefix + ".json",
+    }
+
+
+def node_ids_fingerprint(node_ids):
+    """Empreinte de la table des node ids : détecte un index IVF périmé."""
+    return hashlib.sha1(np.ascontiguousarray(node_ids).tobytes()).hexdigest()
+
+
+def default_nlist(count):
+    """Nombre de listes par défaut : ~4·sqrt(N), au moins 1."""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def assign(matrix, centroids):
+    """Centroïde le plus proche (produit scalaire) de chaque ligne."""
+    labels = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + _ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(matrix, n_clusters, n_iter=20, seed=0, max_samples_per_cluster=256):
+    """
+    k-means sphérique (similarité cosinus) entraîné sur un échantillon.
+    Retourne les centroïdes normalisés (n_clusters, D).
+    """
+    rng = np.random.default_rng(seed)
+    count = matrix.shape[0]
+    sample_size = min(count, n_clusters * max_samples_per_cluster)
+    sample_rows = np.sort(rng.choice(count, size=sample_size, replace=False))
+    sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(sample_size, size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        sizes = np.bincount(labels, minlength=n_clusters)
+        empty = np.flatnonzero(sizes == 0)
+        if empty.size:
+            # Listes vides : réensemencées avec des points tirés au hasard
+            sums[empty] = sample[rng.choice(sample_size, size=empty.size, replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Listes inversées au format CSR : les lignes de la liste i sont
+    rows[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, centroids, offsets, rows, fingerprint=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.fingerprint = fingerprint
+        # Instantané du store couvert par les listes (voir MmapVectorStore.snapshot)
+        self.snapshot = None
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vector_store, nlist=None, n_iter=20, seed=0):
+        """Entraîne le quantificateur et construit les listes inversées."""
+        matrix = vector_store.matrix
+        if matrix is None or matrix.shape[0] == 0:
+            raise ValueError("Impossible de construire un index IVF sur un store vide")
+        nlist = min(nlist or default_nlist(matrix.shape[0]), matrix.shape[0])
+        centroids = spherical_kmeans(matrix, nlist, n_iter=n_iter, seed=seed)
+        labels = assign(matrix, centroids)
+        rows = np.argsort(labels, kind='stable').astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        ivf = cls(centroids, offsets, rows, node_ids_fingerprint(vector_store.node_ids))
+        ivf.snapshot = vector_store.snapshot()
+        return ivf
+
+    def candidates(self, query_vector, nprobe):
+        """Lignes des `nprobe` listes les plus proches de la requête."""
+        nprobe = min(nprobe, self.nlist)
+        centroid_scores = self.centroids @ query_vector
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self.rows[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+
+    def search(self, vector_store, query_embedding, top_k, nprobe, filters=None, snapshot=None):
+        """
+        Top-k approximatif : scoring exact limité aux listes sondées.
+        Si le store a été modifié depuis la construction des listes, la
+        recherche retombe sur le mode exact en attendant la reconstruction.
+        """
+        snapshot = snapshot or vector_store.snapshot()
+        if snapshot is not self.snapshot:
+            return vector_store.search(query_embedding, top_k, filters=filters, snapshot=snapshot)
+        query_vector = normalize_rows(query_embedding)
+        return vector_store.search(
+            query_vector, top_k, filters=filters, rows=self.candidates(query_vector, nprobe), snapshot=snapshot
+        )
+
+    def is_stale(self, vector_store):
+        """Vrai si le store a changé depuis la construction de l'index."""
+        return self.fingerprint != node_ids_fingerprint(vector_store.node_ids)
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+    def save(self, persist_dir, namespace=DEFAULT_NAMESPACE):
+        paths = _ivf_paths(persist_dir, namespace)
+        for key in ("centroids", "offsets", "rows"):
+            tmp_path = paths[key] + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, getattr(self, key))
+            os.replace(tmp_path, paths[key])
+        tmp_path = paths["header"] + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"nlist": self.nlist, "count": int(self.rows.shape[0]), "fingerprint": self.fingerprint}, f)
+        os.replace(tmp_path, paths["header"])
+
+    @staticmethod
+    def exists(persist_dir, namespace=DEFAULT_NAMESPACE):
+        return os.path.exists(_ivf_paths(persist_dir, namespace)["header"])
+
+    @classmethod
+    def load(cls, persist_dir, namespace=DEFAULT_NAMESPACE):
+        paths = _ivf_paths(persist_dir, namespace)
+        with open(paths["header"], 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        return cls(
+            np.load(paths["centroids"]),
+            np.load(paths["offsets"]),
+            np.load(paths["rows"], mmap_mode='r'),
+            header["fingerprint"],
+        )
+
+
+def load_or_build_ivf(vector_store, persist_dir, nlist=None):
+    """
+    Charge l'index IVF persisté à côté du vector store, ou le (re)construit
+    s'il est absent ou périmé.
+    """
+    if IVFIndex.exists(persist_dir):
+        ivf = IVFIndex.load(persist_dir)
+        if not ivf.is_stale(vector_store) and (not nlist or ivf.nlist == nlist):
+            ivf.snapshot = vector_store.snapshot()
+            return ivf
+    print("🔄 Construction de l'index IVF...")
+    ivf = IVFIndex.build(vector_store, nlist=nlist)
+    ivf.save(persist_dir)
+    return ivf
+
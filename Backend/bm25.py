@@ -0,0 +1,246 @@
+"""
+Index lexical BM25 en NumPy pur, fusionné avec la recherche vectorielle.
+
+Les questions sur des chiffres ou des noms propres (« La Réunion »,
+« Entred 3 », « 6,48 % ») sont mal servies par les seuls embeddings : un
+index inversé sur les mots exacts des chunks complète la recherche dense,
+et les deux classements sont fusionnés par Reciprocal Rank Fusion.
+
+Les documents de l'index sont les lignes de la matrice du MmapVectorStore
+(même ordre), ce qui permet de réutiliser ses filtres de métadonnées.
+Les listes de postings sont au format CSR, et le poids BM25 de chaque
+posting est précalculé : une requête se résume à concaténer quelques
+tranches et à un np.bincount.
+
+Fichiers écrits à côté du vector store (namespace "default") :
+    default__bm25_terms.npy      vocabulaire trié (recherche par np.searchsorted)
+    default__bm25_offsets.npy    bornes (V + 1,) des postings de chaque terme
+    default__bm25_rows.npy       lignes de la matrice, par terme (int32)
+    default__bm25_weights.npy    poids BM25 de chaque posting (float32)
+    default__bm25.json           en-tête : paramètres, nombre de lignes, empreinte des node ids
+"""
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from ann import node_ids_fingerprint
+from vector_store import DEFAULT_NAMESPACE, top_k_indices
+
+# Articles et prépositions élidés : l'insuline, d'insuline, qu'un...
+_ELISION = re.compile(r"\b(?:[cdjlmnst]|qu|jusqu|lorsqu|puisqu)['’]")
+# Nombres (décimaux à virgule ou à point) ou mots
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[^\W\d_]+")
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces cette dans de des du elle en est et etre il ils je la le les leur
+leurs lui mais me meme mes mon ne nos notre nous on ou par pas pour qu que qui sa se ses
+son sont sur ta te tes toi ton tu un une vos votre vous y quel quelle quels quelles
+comment combien quoi ont plus
+""".split())
+
+
+def _strip_accents(text):
+    text = unicodedata.normalize('NFKD', text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _stem(word):
+    # Racinisation légère : pluriels en -s / -x (diabètes → diabete)
+    if len(word) > 4 and word[-1] in "sx" and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Tokens en français : minuscules sans accents, élisions retirées, mots
+    vides ignorés, pluriels réduits. Les nombres sont gardés entiers avec
+    la virgule comme séparateur décimal (« 6.48 » et « 6,48 » → « 6,48 »).
+    """
+    text = _ELISION.sub(" ", _strip_accents(text.lower()).replace("’", "'"))
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token[0].isdigit():
+            tokens.append(token.replace(".", ","))
+        elif len(token) > 1 and token not in STOPWORDS:
+            tokens.append(_stem(token))
+    return tokens
+
+
+def _bm25_paths(persist_dir, namespace=DEFAULT_NAMESPACE):
+    prefix = os.path.join(persist_dir, f"{namespace}__bm25")
+    return {
+        "terms": prefix + "_terms.npy",
+        "offsets": prefix + "_offsets.npy",
+        "rows": prefix + "_rows.npy",
+        "weights": prefix + "_weights.npy",
+        "header": prefix + ".json",
+    }
+
+
+class BM25Index:
+    """
+    Index inversé BM25 au format CSR : les postings du terme terms[i] sont
+    rows[offsets[i]:offsets[i + 1]], de poids weights[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, terms, offsets, rows, weights, count, k1=1.2, b=0.75, fingerprint=None):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+        self.count = count
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint
+        # Instantané du store couvert par l'index (voir MmapVectorStore.snapshot)
+        self.snapshot = None
+
+    @classmethod
+    def build(cls, vector_store, docstore, k1=1.2, b=0.75):
+        """Tokenise le texte des nodes, ligne par ligne de la matrice du store."""
+        snapshot = vector_store.snapshot()
+        count = len(vector_store)
+        node_ids = [vector_store.node_id(row, snapshot) for row in range(count)]
+        nodes = docstore.get_nodes(node_ids) if node_ids else []
+
+        doc_lengths = np.zeros(count, dtype=np.float32)
+        term_ids = {}
+        posting_terms, posting_rows, posting_tfs = [], [], []
+        for row, node in enumerate(nodes):
+            tokens = tokenize(node.get_content())
+            doc_lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_rows.append(row)
+                posting_tfs.append(tf)
+
+        # Vocabulaire trié : les postings sont regroupés par terme dans cet ordre
+        vocabulary = sorted(term_ids)
+        rank = np.empty(len(vocabulary), dtype=np.int64)
+        rank[[term_ids[term] for term in vocabulary]] = np.arange(len(vocabulary))
+        posting_terms = rank[np.asarray(posting_terms, dtype=np.int64)]
+        order = np.argsort(posting_terms, kind='stable')
+        rows = np.asarray(posting_rows, dtype=np.int32)[order]
+        tfs = np.asarray(posting_tfs, dtype=np.float32)[order]
+        df = np.bincount(posting_terms, minlength=len(vocabulary))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        # Poids BM25 précalculés : idf · tf·(k1 + 1) / (tf + k1·(1 - b + b·longueur/longueur moyenne))
+        idf = np.log1p((count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if count and doc_lengths.mean() > 0 else 1.0
+        norms = k1 * (1 - b + b * doc_lengths[rows] / average_length)
+        weights = (np.repeat(idf, df) * tfs * (k1 + 1) / (tfs + norms)).astype(np.float32)
+
+        index = cls(
+            np.asarray(vocabulary, dtype=str), offsets, rows, weights, count,
+            k1=k1, b=b, fingerprint=node_ids_fingerprint(vector_store.node_ids)
+        )
+        index.snapshot = snapshot
+        return index
+
+    def scores(self, query):
+        """Scores BM25 (count,) de toutes les lignes pour une requête textuelle."""
+        tokens = np.unique(tokenize(query))
+        if not tokens.size or not self.terms.size:
+            return np.zeros(self.count, dtype=np.float32)
+        # Recherche dichotomique dans le vocabulaire trié ; les termes absents sont ignorés
+        positions = np.searchsorted(self.terms, tokens)
+        found = positions < self.terms.size
+        found[found] = self.terms[positions[found]] == tokens[found]
+        slices = [slice(self.offsets[p], self.offsets[p + 1]) for p in positions[found]]
+        if not slices:
+            return np.zeros(self.count, dtype=np.float32)
+        rows = np.concatenate([self.rows[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return np.bincount(rows, weights=weights, minlength=self.count).astype(np.float32)
+
+    def search(self, vector_store, query, top_k, filters=None, snapshot=None):
+        """
+        Top-k lexical : retourne (lignes, scores) triés, limités aux lignes
+        ayant au moins un terme commun. Vide si le store a changé depuis la
+        construction de l'index (en attendant sa reconstruction).
+        """
+        snapshot = snapshot or vector_store.snapshot()
+        if snapshot is not self.snapshot:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self.scores(query)
+        candidates = vector_store.candidate_rows(filters, None, snapshot)
+        if candidates is not None:
+            scores = scores[candidates]
+        top = top_k_indices(scores, top_k)
+        top = top[scores[top] > 0]
+        return (top if candidates is None else candidates[top]), scores[top]
+
+    def is_stale(self, vector_store):
+        """Vrai si le store a changé depuis la construction de l'index."""
+        return self.fingerprint != node_ids_fingerprint(vector_store.node_ids)
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+    def save(self, persist_dir, namespace=DEFAULT_NAMESPACE):
+        paths = _bm25_paths(persist_dir, namespace)
+        for key in ("terms", "offsets", "rows", "weights"):
+            tmp_path = paths[key] + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, getattr(self, key))
+            os.replace(tmp_path, paths[key])
+        tmp_path = paths["header"] + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"count": self.count, "k1": self.k1, "b": self.b, "fingerprint": self.fingerprint}, f)
+        os.replace(tmp_path, paths["header"])
+
+    @staticmethod
+    def exists(persist_dir, namespace=DEFAULT_NAMESPACE):
+        return os.path.exists(_bm25_paths(persist_dir, namespace)["header"])
+
+    @classmethod
+    def load(cls, persist_dir, namespace=DEFAULT_NAMESPACE):
+        paths = _bm25_paths(persist_dir, namespace)
+        with open(paths["header"], 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        return cls(
+            np.load(paths["terms"]),
+            np.load(paths["offsets"]),
+            np.load(paths["rows"], mmap_mode='r'),
+            np.load(paths["weights"], mmap_mode='r'),
+            header["count"],
+            k1=header["k1"],
+            b=header["b"],
+            fingerprint=header["fingerprint"],
+        )
+
+
+def load_or_build_bm25(vector_store, docstore, persist_dir):
+    """
+    Charge l'index BM25 persisté à côté du vector store, ou le (re)construit
+    s'il est absent ou périmé.
+    """
+    if BM25Index.exists(persist_dir):
+        index = BM25Index.load(persist_dir)
+        if not index.is_stale(vector_store):
+            index.snapshot = vector_store.snapshot()
+            return index
+    print("🔄 Construction de l'index BM25...")
+    index = BM25Index.build(vector_store, docstore)
+    os.makedirs(persist_dir, exist_ok=True)
+    index.save(persist_dir)
+    return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fusionne des classements [(node_id, score), ...] : chaque node reçoit
+    la somme des 1 / (k + rang) sur les classements où il apparaît.
+    Retourne [(node_id, score fusionné), ...] trié par score décroissant.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (node_id, _) in enumerate(ranking, start=1):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
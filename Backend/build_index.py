@@ -0,0 +1,252 @@
+"""
+Construction hors ligne de l'index persistant (sans démarrer l'API).
+
+Les documents sont découpés en chunks par un pool de processus, puis
+embeddés par lots avec un nombre limité d'appels simultanés au serveur
+d'embedding ; le découpage des documents suivants continue pendant ce temps.
+Chaque groupe de documents terminé est enregistré dans un point de reprise
+(`<index>.partial/`) : une construction interrompue reprend là où elle
+s'était arrêtée. L'index écrit est celui que charge l'API (docstore +
+MmapVectorStore), avec les empreintes de l'ingestion incrémentale.
+Les doublons (URL canonique, contenu, quasi-doublons de chunks) sont
+écartés avant l'embedding, comme à l'ingestion incrémentale (dedup.py).
+
+Usage (depuis Backend/) :
+    python build_index.py
+    python build_index.py --workers 8 --concurrency 8 --batch-size 64
+    python build_index.py --force          # reconstruire un index existant
+"""
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from llama_index.core import Document, StorageContext, VectorStoreIndex
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+
+from config import (
+    CHUNK_OVERLAP, CHUNK_SIZE, DEDUP_ENABLED, DEDUP_THRESHOLD, DOCSTORE_BACKEND, INDEX_DIR, SCRAPED_DATA_FILE,
+    VECTOR_DTYPE
+)
+from bm25 import BM25Index
+from corpus import load_corpus
+from dedup import DEDUP_REPORT_FILE, Deduplicator
+from docstore import open_stores
+from ingestion import content_hash, document_id
+from manifest import build_manifest, corpus_fingerprint, write_manifest
+from vector_store import MmapVectorStore
+
+_splitter = None
+
+
+def _init_worker():
+    global _splitter
+    _splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def chunk_document(item):
+    """Découpe un document scrapé en nodes (exécuté dans un processus du pool)."""
+    document = Document(
+        id_=document_id(item['url']),
+        text=item['content'],
+        metadata={'url': item['url'], 'timestamp': item['timestamp']}
+    )
+    return _splitter.get_nodes_from_documents([document])
+
+
+class Checkpoint:
+    """
+    Point de reprise : un fichier pickle de nodes embeddés par groupe de
+    documents, et un journal JSONL des documents terminés.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.journal = os.path.join(path, "done.jsonl")
+        os.makedirs(path, exist_ok=True)
+        self.done = {}
+        if os.path.exists(self.journal):
+            with open(self.journal, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.done.update(entry['documents'])
+
+    def is_done(self, doc_id, digest):
+        return self.done.get(doc_id) == digest
+
+    def save(self, nodes, documents):
+        """Enregistre un groupe terminé : les nodes d'abord, le journal ensuite."""
+        part = f"part-{time.time_ns()}.pkl"
+        tmp_path = os.path.join(self.path, part + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(nodes, f)
+        os.replace(tmp_path, os.path.join(self.path, part))
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"part": part, "documents": documents}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(documents)
+
+    def load_nodes(self, wanted):
+        """Nodes des groupes enregistrés dont les documents sont encore voulus ({doc_id: hash})."""
+        nodes = []
+        with open(self.journal, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            with open(os.path.join(self.path, entry['part']), 'rb') as f:
+                for node in pickle.load(f):
+                    ref_doc_id = node.ref_doc_id
+                    if wanted.get(ref_doc_id) == entry['documents'].get(ref_doc_id):
+                        nodes.append(node)
+        return nodes
+
+
+async def embed_nodes(embed_model, nodes, batch_size, semaphore):
+    """Embeddings des nodes par lots, au plus `concurrency` lots en cours."""
+    async def embed_batch(batch):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        async with semaphore:
+            embeddings = await embed_model.aget_text_embedding_batch(texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+    await asyncio.gather(*[
+        embed_batch(nodes[start:start + batch_size]) for start in range(0, len(nodes), batch_size)
+    ])
+
+
+async def run_pipeline(items, embed_model, checkpoint, workers, concurrency, batch_size, group_size, dedup=None):
+    """
+    Découpe (processus) et embedde (asyncio) les documents non encore faits.
+    Avec `dedup`, les quasi-doublons de chunks déjà gardés ne sont pas embeddés.
+    """
+    pending = [
+        item for item in items
+        if not checkpoint.is_done(document_id(item['url']), content_hash(item['url'], item['content']))
+    ]
+    print(f"📄 {len(items)} documents, {len(items) - len(pending)} déjà faits (point de reprise), "
+          f"{len(pending)} à traiter")
+    if not pending:
+        return
+    if dedup is not None and checkpoint.done:
+        # Reprise : les chunks des groupes déjà faits servent de référence
+        dedup.seed(checkpoint.load_nodes(
+            {document_id(item['url']): content_hash(item['url'], item['content']) for item in items}
+        ))
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    done_docs = 0
+    done_chunks = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # Tous les découpages sont soumis d'emblée : le pool avance pendant les embeddings
+        futures = [loop.run_in_executor(executor, chunk_document, item) for item in pending]
+        for group_start in range(0, len(pending), group_size):
+            group = pending[group_start:group_start + group_size]
+            group_nodes = []
+            for future in futures[group_start:group_start + group_size]:
+                group_nodes.extend(await future)
+            if dedup is not None:
+                group_nodes = dedup.filter_nodes(group_nodes)
+
+            await embed_nodes(embed_model, group_nodes, batch_size, semaphore)
+            checkpoint.save(group_nodes, {
+                document_id(item['url']): content_hash(item['url'], item['content']) for item in group
+            })
+
+            done_docs += len(group)
+            done_chunks += len(group_nodes)
+            elapsed = time.perf_counter() - start
+            print(f"⏳ {done_docs}/{len(pending)} documents, {done_chunks} chunks "
+                  f"({done_chunks / elapsed:.1f} chunks/s)")
+
+
+def write_index(items, checkpoint, index_dir, embed_model, fingerprint):
+    """
+    Assemble les nodes du point de reprise en un index persistant, écrit
+    dans un dossier temporaire puis mis en place par renommage.
+    """
+    wanted = {document_id(item['url']): content_hash(item['url'], item['content']) for item in items}
+    nodes = checkpoint.load_nodes(wanted)
+
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    stores = {}
+    if DOCSTORE_BACKEND == "sqlite":
+        # Les nodes sont écrits directement dans la base du dossier temporaire
+        stores["docstore"], stores["index_store"] = open_stores(tmp_dir, fresh=True)
+    storage_context = StorageContext.from_defaults(vector_store=MmapVectorStore(dtype=VECTOR_DTYPE), **stores)
+    # Les nodes ont déjà leur embedding : aucun appel au modèle ici
+    index = VectorStoreIndex(nodes=nodes, storage_context=storage_context, embed_model=embed_model)
+    for doc_id, digest in wanted.items():
+        index.docstore.set_document_hash(doc_id, digest)
+
+    index.storage_context.persist(persist_dir=tmp_dir)
+    # Index lexical du mode hybride, aligné sur les lignes de la matrice écrite
+    BM25Index.build(index.vector_store, index.docstore).save(tmp_dir)
+    if stores:
+        stores["docstore"].close()
+    write_manifest(tmp_dir, build_manifest(embed_model.model_name, fingerprint))
+    old_dir = index_dir + ".old"
+    if os.path.exists(index_dir):
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(wanted), len(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=SCRAPED_DATA_FILE, help="Corpus scrapé (JSON ou JSONL)")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processus de découpage")
+    parser.add_argument("--concurrency", type=int, default=4, help="Lots d'embeddings simultanés")
+    parser.add_argument("--batch-size", type=int, default=32, help="Chunks par appel d'embedding")
+    parser.add_argument("--group-size", type=int, default=16, help="Documents par point de reprise")
+    parser.add_argument("--force", action="store_true", help="Remplacer un index existant")
+    args = parser.parse_args()
+
+    if os.path.exists(args.index_dir) and not args.force:
+        parser.error(f"{args.index_dir} existe déjà (utiliser --force pour le reconstruire, "
+                     "ou POST /index/refresh pour une mise à jour incrémentale)")
+
+    # Import différé : évite de charger les clients LLM dans les processus du pool
+    from model import create_embed_model
+
+    fingerprint = corpus_fingerprint(args.corpus)
+    # Un document par URL, le dernier l'emporte (comme l'ingestion incrémentale)
+    items = load_corpus(args.corpus)
+    dedup = None
+    if DEDUP_ENABLED:
+        splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        dedup = Deduplicator(threshold=DEDUP_THRESHOLD, count_chunks=lambda text: len(splitter.split_text(text)))
+        items = dedup.documents(items)
+    else:
+        items = list({item['url']: item for item in items}.values())
+    checkpoint = Checkpoint(args.index_dir + ".partial")
+    embed_model = create_embed_model()
+    start = time.perf_counter()
+    asyncio.run(run_pipeline(
+        items, embed_model, checkpoint,
+        args.workers, args.concurrency, args.batch_size, args.group_size, dedup
+    ))
+    documents, chunks = write_index(items, checkpoint, args.index_dir, embed_model, fingerprint)
+    shutil.rmtree(checkpoint.path)
+    if dedup is not None:
+        dedup.report.save(os.path.join(args.index_dir, DEDUP_REPORT_FILE))
+        print(f"🧹 Déduplication : {dedup.report.describe()}")
+    print(f"✅ Index écrit dans {args.index_dir} : {documents} documents, {chunks} chunks "
+          f"en {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+from dotenv import load_dotenv
+
+# Charger les variables d'environnement
+load_dotenv()
+
+# Configuration des API keys
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Modèles utilisés : "groq" / "ollama" en production, "fake" pour tester sans serveur
+LLM_BACKEND = os.getenv("RAG_LLM_BACKEND", "groq")
+EMBED_BACKEND = os.getenv("RAG_EMBED_BACKEND", "ollama")
+# Latence simulée par le LLM factice : avant le premier token, puis entre chaque token (secondes)
+FAKE_LLM_LATENCY = float(os.getenv("RAG_FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("RAG_FAKE_LLM_TOKEN_DELAY", "0.02"))
+
+# Clients Groq / Ollama (upstream.py) : adresses des services, taille du pool de connexions
+# keep-alive, nouvelles tentatives (attente exponentielle avec gigue, base et plafond en
+# secondes), délai global par appel, disjoncteur (échecs consécutifs avant ouverture, durée
+# d'ouverture) et délai avant une requête d'embedding couverte (0 = pas de hedging)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+UPSTREAM_POOL_SIZE = int(os.getenv("RAG_UPSTREAM_POOL_SIZE", "32"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("RAG_UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("RAG_UPSTREAM_BACKOFF", "0.2"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("RAG_UPSTREAM_BACKOFF_MAX", "2.0"))
+LLM_DEADLINE = float(os.getenv("RAG_LLM_DEADLINE", "60"))
+EMBED_DEADLINE = float(os.getenv("RAG_EMBED_DEADLINE", "30"))
+BREAKER_FAILURES = int(os.getenv("RAG_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("RAG_BREAKER_RESET", "30"))
+EMBED_HEDGE_AFTER = float(os.getenv("RAG_EMBED_HEDGE_AFTER", "0"))
+
+# Micro-batching des embeddings unitaires : les questions arrivées pendant la fenêtre
+# (millisecondes, 0 = désactivé) partent en un seul appel, de RAG_EMBED_BATCH_MAX textes au plus.
+# La fenêtre ne s'ouvre que si un appel est déjà en cours (une question seule part aussitôt)
+EMBED_BATCH_WINDOW = float(os.getenv("RAG_EMBED_BATCH_WINDOW_MS", "3")) / 1000
+EMBED_BATCH_MAX = int(os.getenv("RAG_EMBED_BATCH_MAX", "32"))
+
+# Chemins des données
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+# Corpus : le JSONL append-only du scraper s'il existe, sinon scraped_data.json
+SCRAPED_DATA_JSONL = os.path.join(DATA_DIR, 'scraped_data.jsonl')
+SCRAPED_DATA_FILE = os.getenv(
+    "RAG_SCRAPED_DATA",
+    SCRAPED_DATA_JSONL if os.path.exists(SCRAPED_DATA_JSONL) else os.path.join(DATA_DIR, 'scraped_data.json')
+)
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(DATA_DIR, 'vector_index'))
+
+# Découpage des documents en chunks (tokens)
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 20
+
+# Stockage des vecteurs : "float32" (par défaut) ou "float16" (deux fois plus compact)
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+
+# Mode de recherche : "exact" (produit matrice-vecteur complet), "ivf" (ANN IVF-flat),
+# "int8" ou "pq" (codes compressés en mémoire, candidats rescorés sur les vecteurs pleine précision)
+INDEX_MODE = os.getenv("RAG_INDEX_MODE", "exact")
+# Nombre de listes IVF (0 = automatique, ~4·sqrt(N)) et nombre de listes sondées par requête
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+# Quantification : dimension après PCA (0 = sans PCA), nombre de sous-vecteurs PQ
+# (0 = automatique, ~8 dimensions par octet) et facteur de sur-échantillonnage des
+# candidats rescorés (top_k × facteur ; 0 = scores des codes, sans rescoring).
+# Valeurs impossibles pour la taille du corpus ramenées au plus proche (voir quantization.fit_params) ;
+# ces modes ne sont utiles qu'au-delà de quelques milliers de vecteurs
+QUANT_PCA_DIM = int(os.getenv("RAG_QUANT_PCA_DIM", "0"))
+PQ_SUBSPACES = int(os.getenv("RAG_PQ_M", "0"))
+QUANT_RESCORE = int(os.getenv("RAG_QUANT_RESCORE", "10"))
+
+# Recherche "vector" (vecteurs seuls) ou "hybrid" (vecteurs + BM25 fusionnés par RRF),
+# nombre de candidats de chaque recherche passés à la fusion, et constante k de la RRF
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "vector")
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Déduplication à l'ingestion : URLs canoniques, contenus identiques, puis quasi-doublons
+# de chunks (similarité de Jaccard estimée par MinHash >= seuil)
+DEDUP_ENABLED = os.getenv("RAG_DEDUP", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))
+
+# Docstore : "sqlite" (nodes lus à la demande depuis docstore.sqlite, LRU de N nodes)
+# ou "json" (docstore.json et index_store.json chargés entièrement en mémoire)
+DOCSTORE_BACKEND = os.getenv("RAG_DOCSTORE", "sqlite")
+DOCSTORE_CACHE_ITEMS = int(os.getenv("RAG_DOCSTORE_CACHE_ITEMS", "1024"))
+
+# Synchroniser l'index avec scraped_data.json au démarrage (ingestion incrémentale)
+SYNC_ON_STARTUP = os.getenv("RAG_SYNC_ON_STARTUP", "1") == "1"
+
+# Cache d'embeddings : LRU en mémoire + base SQLite partagée entre processus
+EMBED_CACHE_ENABLED = os.getenv("RAG_EMBED_CACHE", "1") == "1"
+EMBED_CACHE_PATH = os.getenv("RAG_EMBED_CACHE_PATH", os.path.join(DATA_DIR, 'embedding_cache.sqlite'))
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("RAG_EMBED_CACHE_MEMORY_ITEMS", "10000"))
+
+# Chemin /query asynchrone : nombre maximal de requêtes simultanées par processus,
+# et attente maximale (secondes) d'une place libre avant de répondre 429
+MAX_INFLIGHT_QUERIES = int(os.getenv("RAG_MAX_INFLIGHT_QUERIES", "256"))
+QUERY_QUEUE_TIMEOUT = float(os.getenv("RAG_QUERY_QUEUE_TIMEOUT", "0"))
+
+# /query/batch : nombre maximal de questions par lot et de générations LLM simultanées par lot
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "8"))
+
+# Cache de réponses : recherche exacte (question normalisée) puis sémantique
+# (similarité cosinus des questions >= seuil ; un seuil > 1 désactive la recherche sémantique)
+RESPONSE_CACHE_ENABLED = os.getenv("RAG_RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RAG_RESPONSE_CACHE_MAX_ITEMS", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RAG_RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RAG_RESPONSE_CACHE_THRESHOLD", "0.92"))
+
+# Observabilité : niveau des logs JSON, profilage à la demande (en-tête X-Profile: 1)
+LOG_LEVEL = os.getenv("RAG_LOG_LEVEL", "INFO")
+PROFILING_ENABLED = os.getenv("RAG_PROFILING", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("RAG_PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("RAG_PROFILE_DIR", os.path.join(DATA_DIR, 'profiles'))
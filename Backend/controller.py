@@ -1,17 +1,128 @@
+import json
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import schema
 import crud
+import metrics
+from limiter import QueryLimitExceeded
+from readiness import ModelNotReady
+from upstream import find_upstream_error
 
-def query_controller(request: schema.QueryRequest) -> schema.QueryResponse:
+# Délai conseillé (secondes) avant de réessayer pendant l'initialisation
+NOT_READY_RETRY_AFTER = "2"
+
+def not_ready_error(e: ModelNotReady) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": NOT_READY_RETRY_AFTER})
+
+def server_error(message: str, e: Exception) -> HTTPException:
+    """503 si Groq ou Ollama est indisponible (disjoncteur ouvert, tentatives épuisées), 500 sinon."""
+    upstream = find_upstream_error(e)
+    if upstream is not None:
+        retry_after = str(max(1, round(upstream.retry_after or 1)))
+        return HTTPException(status_code=503, detail=f"{message} : {upstream}", headers={"Retry-After": retry_after})
+    return HTTPException(status_code=500, detail=f"{message} : {str(e)}")
+
+async def query_controller(request: schema.QueryRequest) -> schema.QueryResponse:
+    try:
+        answer, sources, evaluation = await crud.aquery_rag(request.question, evaluate=request.evaluate)
+        scores, global_score = evaluation if evaluation is not None else (None, None)
+        return schema.QueryResponse(
+            question=request.question,
+            answer=answer,
+            sources=sources,
+            evaluation=scores,
+            global_score=global_score
+        )
+    except ModelNotReady as e:
+        raise not_ready_error(e)
+    except QueryLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise server_error("Erreur lors de la requête", e)
+
+def format_sse(event: str, data: dict) -> str:
+    """Sérialise un événement au format Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def query_stream_controller(request: schema.QueryRequest) -> StreamingResponse:
+    try:
+        events = await crud.astream_rag(request.question)
+    except ModelNotReady as e:
+        raise not_ready_error(e)
+    except QueryLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise server_error("Erreur lors de la requête", e)
+
+    async def body():
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+        finally:
+            # Client déconnecté : libère la place réservée sans attendre le ramasse-miettes
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def query_batch_controller(request: schema.BatchQueryRequest) -> StreamingResponse:
     try:
-        answer = crud.query_rag(request.question)
-        return schema.QueryResponse(question=request.question, answer=answer)
+        results = await crud.aquery_batch(request.questions, evaluate=request.evaluate)
+    except ModelNotReady as e:
+        raise not_ready_error(e)
+    except QueryLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur lors de la requête : {str(e)}")
+        raise server_error("Erreur lors de la requête", e)
+
+    async def body():
+        try:
+            async for result in results:
+                # Une ligne JSON par question (NDJSON), envoyée dès qu'elle est prête
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            await results.aclose()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
 def evaluate_controller(request: schema.EvaluationRequest) -> schema.EvaluationResponse:
     try:
         scores, global_score = crud.evaluate_rag(request.question, request.answer, request.contexts)
         return schema.EvaluationResponse(scores=scores, global_score=global_score)
+    except ModelNotReady as e:
+        raise not_ready_error(e)
+    except Exception as e:
+        raise server_error("Erreur lors de l'évaluation", e)
+
+def refresh_index_controller() -> schema.RefreshResponse:
+    try:
+        stats = crud.refresh_index()
+        return schema.RefreshResponse(**stats)
+    except ModelNotReady as e:
+        raise not_ready_error(e)
+    except crud.RefreshInWorker as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur lors de l'évaluation : {str(e)}")
\ No newline at end of file
+        raise server_error("Erreur lors de la mise à jour de l'index", e)
+
+def cache_stats_controller() -> schema.CacheStatsResponse:
+    try:
+        return schema.CacheStatsResponse(**crud.cache_stats())
+    except ModelNotReady as e:
+        raise not_ready_error(e)
+    except Exception as e:
+        raise server_error("Erreur lors de la lecture des statistiques", e)
+
+def metrics_controller() -> PlainTextResponse:
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def readiness_controller() -> JSONResponse:
+    state = crud.readiness()
+    if state["status"] == "ready":
+        return JSONResponse(content=state)
+    return JSONResponse(status_code=503, content=state, headers={"Retry-After": NOT_READY_RETRY_AFTER})
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Stockage du corpus scrapé en JSONL append-only.
+
+Chaque ligne est un enregistrement JSON complet, ajouté en une seule
+écriture `O_APPEND` suivie d'un fsync : une interruption ne peut laisser
+qu'une dernière ligne tronquée, ignorée à la lecture. Pour une URL, le
+dernier enregistrement l'emporte. Les enregistrements sans `content` ne
+mettent à jour que les validateurs HTTP (ETag / Last-Modified).
+
+Format d'un enregistrement :
+    {"url", "content", "timestamp", "content_hash", "etag", "last_modified"}
+"""
+import hashlib
+import json
+import os
+
+
+def text_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def read_records(path):
+    """Itère sur les enregistrements valides du fichier (lignes tronquées ignorées)."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Dernière ligne interrompue pendant l'écriture
+                continue
+
+
+class CorpusStore:
+    """
+    Corpus JSONL append-only, avec l'état courant par URL gardé en mémoire.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.documents = {}
+        self.validators = {}
+        for record in read_records(path):
+            self._apply(record)
+
+    def _apply(self, record):
+        url = record['url']
+        self.validators[url] = {
+            "etag": record.get('etag'),
+            "last_modified": record.get('last_modified'),
+        }
+        if record.get('content') is not None:
+            self.documents[url] = {
+                "url": url,
+                "content": record['content'],
+                "timestamp": record.get('timestamp'),
+                "content_hash": record.get('content_hash') or text_hash(record['content']),
+            }
+
+    def append(self, record):
+        """Ajoute un enregistrement en une seule écriture atomique."""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._apply(record)
+
+    def content_hash(self, url):
+        document = self.documents.get(url)
+        return document['content_hash'] if document else None
+
+    def records(self):
+        """Documents courants, au format de scraped_data.json."""
+        return [
+            {"url": doc['url'], "content": doc['content'], "timestamp": doc['timestamp']}
+            for doc in self.documents.values()
+        ]
+
+    def compact(self, keep_urls=None):
+        """
+        Réécrit le fichier avec un seul enregistrement par URL (fichier
+        temporaire + os.replace). Si `keep_urls` est donné, les autres URLs
+        sont retirées du corpus.
+        """
+        if keep_urls is not None:
+            keep_urls = set(keep_urls)
+            for url in list(self.documents):
+                if url not in keep_urls:
+                    self.documents.pop(url)
+                    self.validators.pop(url, None)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for url, doc in self.documents.items():
+                record = dict(doc, **self.validators.get(url, {}))
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def export_json(self, json_path):
+        """Écrit le corpus courant au format scraped_data.json, atomiquement."""
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.records(), f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, json_path)
+
+
+def load_corpus(path):
+    """Charge le corpus au format JSONL (append-only) ou JSON (liste)."""
+    if path.endswith(".jsonl"):
+        return CorpusStore(path).records()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
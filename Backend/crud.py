@@ -1,28 +1,384 @@
-import model
+import asyncio
+import os
+import threading
+import time
+import weakref
 import numpy as np
+from config import MAX_INFLIGHT_QUERIES, QUERY_QUEUE_TIMEOUT, BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY
+import metrics
+from limiter import QueryLimiter
+from metrics import span
+from readiness import ModelNotReady, StartupState
+from response_cache import normalize_question
+from singleflight import SingleFlight
 
 # Instance globale du modèle RAG
 rag_model = None
 
+# Phases de l'initialisation (exposées par /ready)
+startup_state = StartupState()
+
+# Limite des requêtes /query simultanées (backpressure)
+query_limiter = QueryLimiter(MAX_INFLIGHT_QUERIES, queue_timeout=QUERY_QUEUE_TIMEOUT)
+
+# Pid du processus maître de prefork.py (None hors prefork) : les workers partagent
+# docstore.sqlite mais ont chacun leur vector store, seul le maître met l'index à jour
+prefork_master = None
+
+class RefreshInWorker(Exception):
+    """Mise à jour de l'index demandée à un worker pré-forké."""
+
+# Questions identiques en cours de traitement : un seul calcul partagé (par chemin)
+query_flights = SingleFlight()
+stream_flights = SingleFlight()
+
+def collect_metrics():
+    """Recopie les statistiques du limiteur et des caches dans les métriques."""
+    stats = query_limiter.stats()
+    metrics.QUERIES_IN_FLIGHT.set(stats["in_flight"])
+    metrics.QUERIES_REJECTED.set(stats["rejected"])
+    for path, flights in (("query", query_flights), ("stream", stream_flights)):
+        coalescing = flights.stats()
+        metrics.COALESCED_REQUESTS.set(coalescing["leaders"], path=path, role="leader")
+        metrics.COALESCED_REQUESTS.set(coalescing["followers"], path=path, role="follower")
+        metrics.COALESCING_RATIO.set(coalescing["coalescing_ratio"], path=path)
+    if rag_model is None:
+        return
+    caches = rag_model.cache_stats()
+    embeddings = caches["embeddings"]
+    if embeddings is not None:
+        for result in ("memory_hits", "disk_hits", "misses"):
+            metrics.CACHE_LOOKUPS.set(embeddings[result], cache="embeddings", result=result)
+        metrics.CACHE_ITEMS.set(embeddings["memory_items"], cache="embeddings")
+    responses = caches["responses"]
+    if responses is not None:
+        for result in ("exact_hits", "semantic_hits", "misses"):
+            metrics.CACHE_LOOKUPS.set(responses[result], cache="responses", result=result)
+        metrics.CACHE_ITEMS.set(responses["items"], cache="responses")
+
+metrics.REGISTRY.add_collector(collect_metrics)
+
 def init_rag_model():
     global rag_model
     if rag_model is None:
-        rag_model = model.RAGModel()
+        try:
+            with startup_state.phase("imports"):
+                # Imports lourds (llama_index, clients LLM) différés : le processus démarre sans eux
+                import model
+            rag_model = model.RAGModel(startup_state)
+            startup_state.mark_ready()
+        except Exception as e:
+            startup_state.mark_failed(e)
+            raise
     return rag_model
 
-def query_rag(question: str):
+def start_background_init():
+    """Lance l'initialisation dans un thread : l'API répond pendant le chargement."""
+    def run():
+        try:
+            init_rag_model()
+        except Exception as e:
+            print(f"❌ Échec de l'initialisation du modèle RAG : {e}")
+
+    thread = threading.Thread(target=run, name="rag-init", daemon=True)
+    thread.start()
+    return thread
+
+def require_model():
     if rag_model is None:
-        raise ValueError("Modèle RAG non initialisé")
-    response = rag_model.query_engine.query(question)
-    return str(response)
+        if startup_state.status == "failed":
+            raise ModelNotReady(f"Échec de l'initialisation du modèle RAG : {startup_state.error}")
+        raise ModelNotReady("Modèle RAG en cours d'initialisation, réessayez dans quelques secondes")
+    return rag_model
 
-def evaluate_rag(question: str, answer: str, contexts: list):
-    if rag_model is None or rag_model.evaluator is None:
-        raise ValueError("Évaluateur non initialisé")
-    scores = rag_model.evaluator.evaluate(question, answer, contexts)
-    global_score = np.mean([
+def readiness():
+    return startup_state.to_dict()
+
+def format_sources(nodes):
+    """Sources retrouvées (node id, url, score, texte du chunk) à partir des NodeWithScore."""
+    return [
+        {
+            "node_id": node.node.node_id,
+            "url": node.node.metadata.get('url'),
+            "score": node.score,
+            "fusion_score": getattr(node, "fusion_score", None),
+            "text": node.node.get_content(),
+        }
+        for node in nodes
+    ]
+
+def global_score(scores):
+    return float(np.mean([
         scores.get('answer_relevancy', 0),
         scores.get('context_precision', 0),
         scores.get('context_recall', 0)
-    ])
-    return scores, float(global_score)
\ No newline at end of file
+    ]))
+
+async def _lookup_cache(question: str):
+    """
+    Cherche la question dans le cache de réponses : exacte d'abord, puis
+    sémantique. Retourne (réponse en cache ou None, QueryBundle avec son
+    embedding, réutilisé par le retriever en cas d'échec).
+    """
+    # Déjà chargé par le modèle : import local pour garder le démarrage léger
+    from llama_index.core import QueryBundle
+    cache = rag_model.response_cache
+    if cache is None:
+        return None, QueryBundle(question)
+    cached = cache.get_exact(question)
+    if cached is not None:
+        return cached, None
+    with span("embed"):
+        embedding = await rag_model.embed_model.aget_query_embedding(question)
+    return cache.get_similar(embedding), QueryBundle(question, embedding=embedding)
+
+def _store_cache(query_bundle, answer, sources):
+    if rag_model.response_cache is not None and query_bundle.embedding is not None:
+        rag_model.response_cache.put(query_bundle.query_str, answer, sources, query_bundle.embedding)
+
+def flight_key(question: str, *options):
+    """
+    Clé de regroupement : question normalisée (comme le cache de réponses)
+    et version de l'index, pour ne pas servir une réponse calculée avant
+    une mise à jour à une requête arrivée après.
+    """
+    return (normalize_question(question), rag_model.index_version, *options)
+
+def query_rag(question: str):
+    require_model()
+
+    def run():
+        response = rag_model.query_engine.query(question)
+        return str(response), format_sources(response.source_nodes)
+
+    return query_flights.call(flight_key(question, "sync"), run)
+
+async def aquery_rag(question: str, evaluate: bool = False):
+    """
+    Retourne (réponse, sources, évaluation). Avec `evaluate`, les scores sont
+    calculés à partir de la recherche déjà faite (voir RAGModel.aevaluate_answer),
+    sinon l'évaluation vaut None. Les requêtes identiques simultanées
+    partagent un seul calcul.
+    """
+    require_model()
+    return await query_flights.do(flight_key(question, evaluate), lambda: _aquery(question, evaluate))
+
+async def _aquery(question: str, evaluate: bool):
+    async with query_limiter.slot():
+        cached, query_bundle = await _lookup_cache(question)
+        if cached is not None:
+            answer, sources = cached.answer, cached.sources
+            # Question exacte déjà en cache : son embedding y est conservé
+            question_embedding = query_bundle.embedding if query_bundle is not None else cached.embedding
+        else:
+            response = await rag_model.query_engine.aquery(query_bundle)
+            answer, sources = str(response), format_sources(response.source_nodes)
+            # Calculé par le retriever si le cache de réponses ne l'a pas déjà fait
+            question_embedding = query_bundle.embedding
+            _store_cache(query_bundle, answer, sources)
+        evaluation = None
+        if evaluate:
+            scores = await rag_model.aevaluate_answer(question_embedding, answer, sources)
+            evaluation = (scores, global_score(scores))
+    return answer, sources, evaluation
+
+async def astream_rag(question: str):
+    """
+    Réserve une place (QueryLimitExceeded si saturé) puis retourne un
+    générateur asynchrone d'événements (type, données) : les sources
+    retrouvées, les tokens au fil de la génération, puis les temps mesurés.
+    Une question identique déjà en cours de génération n'en lance pas une
+    autre : la requête reçoit les événements déjà émis puis la suite du flux.
+    """
+    require_model()
+    key = flight_key(question)
+    if stream_flights.in_flight(key):
+        events, _ = stream_flights.stream(key, None)
+        return _follow(events)
+    await query_limiter.acquire()
+    engine = rag_model.stream_query_engine
+    # Place libérée à la fin du flux partagé, même s'il est annulé avant d'avoir démarré
+    events, leader = stream_flights.stream(
+        key, lambda: _stream_events(engine, question), on_done=query_limiter.release
+    )
+    if not leader:
+        # Flux lancé par une requête identique pendant l'attente d'une place
+        query_limiter.release()
+        return _follow(events)
+    return events
+
+async def _follow(events):
+    """Flux d'une requête regroupée : l'événement final le signale (`coalesced`)."""
+    try:
+        async for event, data in events:
+            if event == "done":
+                data = {**data, "coalesced": True}
+            yield event, data
+    finally:
+        await events.aclose()
+
+async def _stream_events(engine, question: str):
+    start = time.perf_counter()
+    try:
+        cached, query_bundle = await _lookup_cache(question)
+        if cached is not None:
+            # Réponse en cache : envoyée d'un bloc
+            yield "sources", {"sources": cached.sources}
+            yield "token", {"text": cached.answer}
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield "done", {
+                "retrieval_ms": elapsed_ms,
+                "first_token_ms": elapsed_ms,
+                "total_ms": elapsed_ms,
+                "tokens": 1,
+                "cached": True,
+            }
+            return
+
+        nodes = await engine.aretrieve(query_bundle)
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        sources = format_sources(nodes)
+        yield "sources", {"sources": sources}
+
+        response = await engine.asynthesize(query_bundle, nodes)
+        first_token_ms = None
+        tokens = 0
+        answer = ""
+        async for token in response.async_response_gen():
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+            tokens += 1
+            answer += token
+            yield "token", {"text": token}
+        _store_cache(query_bundle, answer, sources)
+
+        yield "done", {
+            "retrieval_ms": round(retrieval_ms, 1),
+            "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            "tokens": tokens,
+            "cached": False,
+        }
+    except Exception as e:
+        yield "error", {"detail": f"Erreur lors de la génération : {str(e)}"}
+
+async def aquery_batch(questions: list, evaluate: bool = False):
+    """
+    Réserve une place (QueryLimitExceeded si saturé) puis retourne un
+    générateur asynchrone de résultats, un par question, dans l'ordre de
+    complétion. Chaque résultat porte l'`index` de sa question dans le lot.
+    """
+    require_model()
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"Lot trop grand : {len(questions)} questions (maximum {BATCH_MAX_QUESTIONS})")
+    await query_limiter.acquire()
+    release = _release_once()
+    results = _batch_results(list(questions), evaluate, release)
+    # Générateur jamais itéré (client déconnecté avant la réponse) : son `finally` ne
+    # s'exécute pas, la place est libérée quand il est ramassé
+    weakref.finalize(results, release)
+    return results
+
+def _release_once():
+    """Libération de place idempotente (appelée par le générateur ou par son finaliseur)."""
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            query_limiter.release()
+    return release
+
+async def _batch_results(questions, evaluate, release):
+    """
+    Questions identiques (après normalisation) traitées une seule fois ;
+    embeddings en un appel batché, recherche en un produit matrice-matrice,
+    puis générations LLM simultanées dans la limite de RAG_BATCH_CONCURRENCY.
+    """
+    from llama_index.core import QueryBundle
+    tasks = []
+    try:
+        groups = {}
+        for i, question in enumerate(questions):
+            groups.setdefault(normalize_question(question), []).append(i)
+        indices = list(groups.values())
+        unique = [questions[group[0]] for group in indices]
+
+        # Cache de réponses : recherche exacte, puis sémantique une fois les questions embeddées
+        cache = rag_model.response_cache
+        cached = [cache.get_exact(question) if cache is not None else None for question in unique]
+        pending = [j for j, hit in enumerate(cached) if hit is None]
+        embeddings = {}
+        if pending:
+            vectors = await rag_model.aembed_questions([unique[j] for j in pending])
+            embeddings = dict(zip(pending, vectors))
+        if cache is not None:
+            for j in pending:
+                cached[j] = cache.get_similar(embeddings[j])
+        to_generate = [j for j in pending if cached[j] is None]
+        retrieved = {}
+        if to_generate:
+            # Recherche et lecture des nodes (SQLite) dans un thread : la boucle reste libre
+            nodes = await asyncio.to_thread(
+                rag_model.retriever.retrieve_batch,
+                [embeddings[j] for j in to_generate], [unique[j] for j in to_generate]
+            )
+            retrieved = dict(zip(to_generate, nodes))
+
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def answer(j):
+            question = unique[j]
+            try:
+                if cached[j] is not None:
+                    answer_text, sources = cached[j].answer, cached[j].sources
+                    question_embedding = embeddings.get(j, cached[j].embedding)
+                else:
+                    query_bundle = QueryBundle(question, embedding=embeddings[j])
+                    async with semaphore:
+                        response = await rag_model.query_engine.asynthesize(query_bundle, retrieved[j])
+                    answer_text, sources = str(response), format_sources(retrieved[j])
+                    question_embedding = query_bundle.embedding
+                    _store_cache(query_bundle, answer_text, sources)
+                result = {"answer": answer_text, "sources": sources, "cached": cached[j] is not None}
+                if evaluate:
+                    scores = await rag_model.aevaluate_answer(question_embedding, answer_text, sources)
+                    result.update(evaluation=scores, global_score=global_score(scores))
+            except Exception as e:
+                result = {"error": f"Erreur lors de la génération : {str(e)}"}
+            return j, result
+
+        tasks = [asyncio.create_task(answer(j)) for j in range(len(unique))]
+        for next_done in asyncio.as_completed(tasks):
+            j, result = await next_done
+            for i in indices[j]:
+                yield {"index": i, "question": questions[i], **result}
+    except Exception as e:
+        yield {"error": f"Erreur lors du traitement du lot : {str(e)}"}
+    finally:
+        # Client déconnecté : les générations restantes sont abandonnées
+        for task in tasks:
+            task.cancel()
+        release()
+
+def refresh_index():
+    require_model()
+    if prefork_master is not None and os.getpid() != prefork_master:
+        raise RefreshInWorker(
+            f"Serveur multi-workers : la mise à jour de l'index se fait dans le processus maître "
+            f"(kill -HUP {prefork_master}), qui relance ensuite les workers"
+        )
+    report = rag_model.refresh_index()
+    return report.to_dict()
+
+def cache_stats():
+    require_model()
+    coalescing = {"query": query_flights.stats(), "stream": stream_flights.stats()}
+    return {**rag_model.cache_stats(), "coalescing": coalescing}
+
+def evaluate_rag(question: str, answer: str, contexts: list):
+    require_model()
+    with span("evaluate"):
+        scores = rag_model.evaluator.evaluate(question, answer, contexts)
+    return scores, global_score(scores)
\ No newline at end of file
@@ -0,0 +1,376 @@
+"""
+Déduplication du corpus scrapé avant l'indexation.
+
+Le scraper ajoute ses pages sans vérifier les doublons : une même page
+revient sous plusieurs URLs (fragments `#:~:text=…`, paramètres de suivi)
+et des passages identiques à quelques mots près se retrouvent d'une page à
+l'autre. Chaque doublon coûte un appel d'embedding, grossit l'index et
+occupe une place du top-k à la recherche. Trois niveaux, du moins cher au
+plus cher :
+
+1. URL canonique (fragment, paramètres de suivi et `/` final retirés, hôte
+   en minuscules) : pour une même URL, le dernier enregistrement l'emporte ;
+2. contenu identique (espaces normalisés) sous deux URLs : le premier est gardé ;
+3. quasi-doublons de chunks : signature MinHash sur des shingles de mots,
+   candidats trouvés par LSH (bandes de la signature), puis similarité de
+   Jaccard estimée comparée au seuil. Un chunk trop proche d'un chunk déjà
+   gardé n'est pas embeddé.
+
+DedupReport liste ce qui a été retiré et le nombre d'embeddings évités.
+
+Usage (depuis Backend/), rapport sans toucher à l'index :
+    python dedup.py
+    python dedup.py --corpus ../scraped_data.json --threshold 0.8 --output rapport.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+# Rapport de la dernière synchronisation, écrit dans le dossier de l'index
+DEDUP_REPORT_FILE = "dedup_report.json"
+# Signatures MinHash des chunks indexés, à côté du rapport (évite de relire tout le docstore)
+DEDUP_SIGNATURES_FILE = "dedup_signatures.npz"
+
+# Paramètres de requête sans effet sur le contenu de la page
+_TRACKING_PARAMS = re.compile(r"^(?:utm_\w+|fbclid|gclid|mc_cid|mc_eid|xtor)$", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+# Nombre premier > 2^32 : (a·h + b) mod p tient en uint64 pour des hashes 32 bits
+_MERSENNE = np.uint64((1 << 32) + 15)
+
+
+def canonical_url(url):
+    """URL sans fragment ni paramètres de suivi, hôte en minuscules, sans `/` final."""
+    parts = urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+    if (parts.scheme == "https" and netloc.endswith(":443")) or (parts.scheme == "http" and netloc.endswith(":80")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                       if not _TRACKING_PARAMS.match(k)])
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path.rstrip('/') or '/', query, ""))
+
+
+def text_digest(text):
+    """Empreinte d'un texte aux espaces près."""
+    return hashlib.sha256(" ".join(text.split()).encode('utf-8')).hexdigest()
+
+
+class MinHasher:
+    """
+    Signatures MinHash : pour chacune des `num_perm` permutations
+    h → (a·h + b) mod p, le minimum sur les shingles (suites de
+    `shingle_size` mots) du texte.
+    """
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = _WORD.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        """Signature (num_perm,) uint32, ou None pour un texte sans mots."""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % _MERSENNE
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Index LSH de signatures MinHash : la signature est découpée en `bands`
+    bandes, deux chunks qui partagent une bande sont candidats. Avec 16
+    bandes de 8 valeurs, les paires de similarité > ~0.7 sont presque
+    toujours candidates ; la similarité estimée tranche ensuite.
+    """
+    def __init__(self, threshold=0.85, num_perm=128, bands=16, hasher=None):
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = hasher or MinHasher(num_perm=num_perm)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+        self._digests = {}
+        # Empreinte de chaque clé insérée (pour persister l'index)
+        self._digest_of = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def insert(self, key, text=None, signature=None, digest=None):
+        """
+        Ajoute un chunk gardé (sans vérification). Sans `text`, l'empreinte et
+        la signature (None pour un texte sans mots) sont celles déjà calculées.
+        """
+        digest = text_digest(text) if digest is None else digest
+        self._digest_of[key] = digest
+        self._digests.setdefault(digest, key)
+        if signature is None and text is not None:
+            signature = self.hasher.signature(text)
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+    def query(self, text, signature=None):
+        """Retourne (clé, similarité) du chunk gardé le plus proche au-dessus du seuil, ou None."""
+        key = self._digests.get(text_digest(text))
+        if key is not None:
+            return key, 1.0
+        signature = self.hasher.signature(text) if signature is None else signature
+        if signature is None:
+            return None
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band, ()))
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def entries(self):
+        """(clé, empreinte, signature ou None) de chaque chunk inséré."""
+        for key, digest in self._digest_of.items():
+            yield key, digest, self._signatures.get(key)
+
+    def add(self, key, text):
+        """Ajoute le chunk s'il n'a pas de quasi-doublon ; sinon retourne (clé du doublon, similarité)."""
+        signature = self.hasher.signature(text)
+        match = self.query(text, signature)
+        if match is None:
+            self.insert(key, text, signature)
+        return match
+
+
+class DedupReport:
+    """Ce qui a été retiré, à quel niveau, et les embeddings évités."""
+    def __init__(self):
+        self.removed = []
+        self.documents_in = 0
+        self.documents_out = 0
+        self.chunks_in = 0
+        self.chunks_out = 0
+        self.embeddings_saved = 0
+
+    def add(self, level, url, duplicate_of, similarity=1.0, chunks=0, text=None):
+        entry = {"level": level, "url": url, "duplicate_of": duplicate_of,
+                 "similarity": round(similarity, 3), "chunks": chunks}
+        if text is not None:
+            entry["text"] = text[:200]
+        self.removed.append(entry)
+        self.embeddings_saved += chunks
+
+    def summary(self):
+        counts = {"url": 0, "content": 0, "near": 0}
+        for entry in self.removed:
+            counts[entry["level"]] += 1
+        return {
+            "url_duplicates": counts["url"],
+            "content_duplicates": counts["content"],
+            "near_duplicate_chunks": counts["near"],
+            "embeddings_saved": self.embeddings_saved,
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            "documents_in": self.documents_in,
+            "documents_out": self.documents_out,
+            "chunks_in": self.chunks_in,
+            "chunks_out": self.chunks_out,
+            "removed": self.removed,
+        }
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def describe(self):
+        s = self.summary()
+        return (f"{s['url_duplicates']} URLs en double, {s['content_duplicates']} contenus identiques, "
+                f"{s['near_duplicate_chunks']} chunks quasi-dupliqués retirés "
+                f"({s['embeddings_saved']} embeddings évités)")
+
+
+class Deduplicator:
+    """
+    Étape de déduplication de l'ingestion : `documents()` filtre le corpus
+    (niveaux 1 et 2), `filter_nodes()` les chunks avant embedding (niveau 3).
+    `count_chunks(text)`, si fourni, compte les chunks des documents écartés
+    pour le rapport.
+    """
+    def __init__(self, threshold=0.85, num_perm=128, bands=16, count_chunks=None, signatures_path=None):
+        self.near = NearDuplicateIndex(threshold=threshold, num_perm=num_perm, bands=bands)
+        self.count_chunks = count_chunks
+        self.signatures_path = signatures_path
+        self.report = DedupReport()
+        self._urls = {}
+        # URL canonique → URL scrapée de l'enregistrement gardé (hash des anciens index)
+        self.original_urls = {}
+
+    def _chunks(self, text):
+        return self.count_chunks(text) if self.count_chunks else 0
+
+    def documents(self, items):
+        """
+        Corpus scrapé ({url, content, timestamp}) → un enregistrement par
+        URL canonique et par contenu, dans l'ordre de première apparition.
+        """
+        self.report.documents_in += len(items)
+        by_url = {}
+        original_urls = {}
+        for item in items:
+            url = canonical_url(item['url'])
+            if url in by_url:
+                self.report.add("url", original_urls[url], url, chunks=self._chunks(by_url[url]['content']))
+            by_url[url] = dict(item, url=url)
+            original_urls[url] = item['url']
+        self.original_urls.update(original_urls)
+
+        kept = []
+        by_digest = {}
+        for url, item in by_url.items():
+            digest = text_digest(item['content'])
+            original = by_digest.get(digest)
+            if original is not None:
+                self.report.add("content", url, original, chunks=self._chunks(item['content']))
+                continue
+            by_digest[digest] = url
+            kept.append(item)
+        self.report.documents_out += len(kept)
+        return kept
+
+    def seed(self, nodes):
+        """Chunks déjà présents dans l'index : référence pour les quasi-doublons."""
+        for node in nodes:
+            self._urls[node.node_id] = node.metadata.get('url')
+            self.near.insert(node.node_id, node.get_content())
+
+    def load_signatures(self, node_ids):
+        """
+        Référence des quasi-doublons lue dans `signatures_path` pour les chunks
+        `node_ids` ; retourne les ids sans signature persistée, à relire du
+        docstore et à passer à seed().
+        """
+        path = self.signatures_path
+        if path and os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    hasher = self.near.hasher
+                    # Signatures d'un autre MinHasher : inutilisables
+                    if (int(data["shingle_size"]) == hasher.shingle_size and np.array_equal(data["a"], hasher.a)
+                            and np.array_equal(data["b"], hasher.b)):
+                        wanted = set(node_ids)
+                        for key, url, digest, present, signature in zip(
+                                data["keys"].tolist(), data["urls"].tolist(), data["digests"].tolist(),
+                                data["present"].tolist(), data["signatures"]):
+                            if key in wanted and key not in self._urls:
+                                self._urls[key] = url or None
+                                self.near.insert(key, signature=signature if present else None, digest=digest)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Signatures de déduplication illisibles ({e}) : recalcul depuis le docstore")
+        return [node_id for node_id in node_ids if node_id not in self._urls]
+
+    def save_signatures(self):
+        """Écrit les signatures de tous les chunks gardés dans `signatures_path`."""
+        if not self.signatures_path:
+            return
+        hasher = self.near.hasher
+        keys, digests, present, signatures = [], [], [], []
+        for key, digest, signature in self.near.entries():
+            keys.append(key)
+            digests.append(digest)
+            present.append(signature is not None)
+            signatures.append(signature if signature is not None else np.zeros(hasher.num_perm, dtype=np.uint32))
+        os.makedirs(os.path.dirname(self.signatures_path) or ".", exist_ok=True)
+        tmp_path = self.signatures_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                keys=np.array(keys, dtype=str),
+                urls=np.array([self._urls.get(key) or "" for key in keys], dtype=str),
+                digests=np.array(digests, dtype=str),
+                present=np.array(present, dtype=bool),
+                signatures=np.array(signatures, dtype=np.uint32).reshape(len(keys), hasher.num_perm),
+                a=hasher.a,
+                b=hasher.b,
+                shingle_size=np.array(hasher.shingle_size),
+            )
+        os.replace(tmp_path, self.signatures_path)
+
+    def filter_nodes(self, nodes):
+        """Retourne les chunks à embedder, sans les quasi-doublons de chunks déjà gardés."""
+        kept = []
+        for node in nodes:
+            self.report.chunks_in += 1
+            text = node.get_content()
+            match = self.near.add(node.node_id, text)
+            if match is None:
+                self._urls[node.node_id] = node.metadata.get('url')
+                kept.append(node)
+            else:
+                duplicate_of, similarity = match
+                self.report.add("near", node.metadata.get('url'), self._urls.get(duplicate_of),
+                                similarity, chunks=1, text=text)
+        self.report.chunks_out += len(kept)
+        return kept
+
+
+def main():
+    from llama_index.core import Document
+    from llama_index.core.node_parser import SentenceSplitter
+
+    from config import CHUNK_OVERLAP, CHUNK_SIZE, DEDUP_THRESHOLD, SCRAPED_DATA_FILE
+    from corpus import load_corpus
+    from ingestion import document_id
+
+    parser = argparse.ArgumentParser(description="Rapport de déduplication du corpus scrapé")
+    parser.add_argument("--corpus", default=SCRAPED_DATA_FILE, help="Corpus scrapé (JSON ou JSONL)")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Similarité de Jaccard estimée à partir de laquelle un chunk est un quasi-doublon")
+    parser.add_argument("--output", help="Fichier JSON du rapport détaillé")
+    args = parser.parse_args()
+
+    splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    dedup = Deduplicator(threshold=args.threshold, count_chunks=lambda text: len(splitter.split_text(text)))
+    items = dedup.documents(load_corpus(args.corpus))
+    for item in items:
+        document = Document(id_=document_id(item['url']), text=item['content'], metadata={'url': item['url']})
+        dedup.filter_nodes(splitter.get_nodes_from_documents([document]))
+
+    report = dedup.report
+    print(f"📄 {report.documents_in} documents → {report.documents_out}, "
+          f"{report.chunks_in} chunks → {report.chunks_out}")
+    print(f"🧹 {report.describe()}")
+    for entry in report.removed:
+        print(f"  - [{entry['level']}] {entry['url']} ≈ {entry['duplicate_of']} ({entry['similarity']:.2f})")
+    if args.output:
+        report.save(args.output)
+        print(f"✅ Rapport écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Docstore et index store sur SQLite, lus à la demande.
+
+Avec les stores JSON de LlamaIndex, docstore.json et index_store.json sont
+entièrement parsés au démarrage (et gardés en mémoire), alors qu'une requête
+ne lit que le texte des quelques nodes retrouvés. Ici les deux stores
+partagent une base `docstore.sqlite` (table clé-valeur par collection,
+valeurs JSON compressées zlib) : chaque node est lu par son id au moment où
+il sert, avec un petit LRU devant la base. La mémoire résidente ne dépend
+plus de la taille du corpus, à la table des node ids de l'index près.
+
+Les écritures restent en mémoire jusqu'à `persist()`, comme avec les
+stores JSON : docstore et vector store sont enregistrés ensemble, et une
+synchronisation interrompue ne laisse pas de documents sans vecteurs.
+
+Migration : au premier chargement d'un index au format JSON, les fichiers
+sont convertis dans la base (ils sont conservés). Pour revenir aux stores
+JSON, `export_json_stores` réécrit les fichiers depuis la base, qui est
+gardée sous `docstore.sqlite.bak`.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.types import DEFAULT_PERSIST_FNAME as DOCSTORE_JSON
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.index_store.types import DEFAULT_PERSIST_FNAME as INDEX_STORE_JSON
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION, BaseKVStore
+
+DOCSTORE_FILE = "docstore.sqlite"
+
+# SQLite limite le nombre de paramètres par requête
+_MAX_PARAMS = 500
+
+
+# Stores ouverts : une connexion SQLite ne doit pas traverser un fork (workers pré-forkés).
+# Un seul hook par module, qui ne reconnecte que les stores encore vivants et non fermés.
+_OPEN_STORES = weakref.WeakSet()
+
+
+def _reconnect_after_fork():
+    for store in list(_OPEN_STORES):
+        store._connect()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reconnect_after_fork)
+
+
+class SQLiteKVStore(BaseKVStore):
+    """
+    Store clé-valeur LlamaIndex sur une table SQLite, avec un LRU des
+    valeurs décompressées. Le LRU garde le JSON, pas les objets : chaque
+    lecture rend un dict neuf, que LlamaIndex peut modifier sans risque.
+
+    Les écritures sont gardées en mémoire jusqu'à `persist()`, qui les
+    applique en une transaction : aucun verrou d'écriture n'est tenu entre
+    deux persistances (plusieurs workers lisent la même base). Une seule
+    connexion par processus, reconnectée après un fork.
+    """
+    def __init__(self, path, cache_items=1024):
+        self.path = path
+        self.cache_items = cache_items
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        # (collection, clé) → JSON à écrire, ou None pour une suppression
+        self._pending = {}
+        self._connect()
+        _OPEN_STORES.add(self)
+
+    def _connect(self):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (collection TEXT NOT NULL, key TEXT NOT NULL, "
+            "value BLOB NOT NULL, PRIMARY KEY (collection, key))"
+        )
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # LRU
+    # ------------------------------------------------------------------
+    def _remember(self, cache_key, value):
+        self._cache[cache_key] = value
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_items:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "items": len(self._cache),
+            "pending_writes": len(self._pending),
+        }
+
+    # ------------------------------------------------------------------
+    # Interface BaseKVStore
+    # ------------------------------------------------------------------
+    def put(self, key, val, collection=DEFAULT_COLLECTION):
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key, val, collection=DEFAULT_COLLECTION):
+        self.put(key, val, collection)
+
+    def put_all(self, kv_pairs, collection=DEFAULT_COLLECTION, batch_size=1):
+        with self._lock:
+            for key, val in kv_pairs:
+                self._cache.pop((collection, key), None)
+                self._pending[(collection, key)] = json.dumps(val, ensure_ascii=False)
+
+    async def aput_all(self, kv_pairs, collection=DEFAULT_COLLECTION, batch_size=1):
+        self.put_all(kv_pairs, collection, batch_size)
+
+    def get(self, key, collection=DEFAULT_COLLECTION):
+        return self.get_many([key], collection)[0]
+
+    async def aget(self, key, collection=DEFAULT_COLLECTION):
+        return self.get(key, collection)
+
+    def get_many(self, keys, collection=DEFAULT_COLLECTION):
+        """Valeurs des clés (None pour les absentes), en une requête pour celles hors du LRU."""
+        results = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                cache_key = (collection, key)
+                if cache_key in self._pending:
+                    results[i] = self._pending[cache_key]
+                    continue
+                value = self._cache.get(cache_key)
+                if value is not None:
+                    self._cache.move_to_end(cache_key)
+                    results[i] = value
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+            self.misses += len(missing)
+            wanted = list(missing)
+            for start in range(0, len(wanted), _MAX_PARAMS):
+                chunk = wanted[start:start + _MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE collection = ? AND key IN ({','.join('?' * len(chunk))})",
+                    [collection, *chunk]
+                ).fetchall()
+                for key, blob in rows:
+                    value = zlib.decompress(blob)
+                    self._remember((collection, key), value)
+                    for i in missing[key]:
+                        results[i] = value
+        return [json.loads(value) if value is not None else None for value in results]
+
+    def get_all(self, collection=DEFAULT_COLLECTION):
+        """Toute une collection (sans passer par le LRU)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM kv WHERE collection = ?", (collection,)).fetchall()
+            values = {key: zlib.decompress(blob) for key, blob in rows}
+            for (pending_collection, key), value in self._pending.items():
+                if pending_collection != collection:
+                    continue
+                if value is None:
+                    values.pop(key, None)
+                else:
+                    values[key] = value
+        return {key: json.loads(value) for key, value in values.items()}
+
+    async def aget_all(self, collection=DEFAULT_COLLECTION):
+        return self.get_all(collection)
+
+    def delete(self, key, collection=DEFAULT_COLLECTION):
+        with self._lock:
+            cache_key = (collection, key)
+            self._cache.pop(cache_key, None)
+            if cache_key in self._pending:
+                existed = self._pending[cache_key] is not None
+            else:
+                existed = self._conn.execute(
+                    "SELECT 1 FROM kv WHERE collection = ? AND key = ?", (collection, key)
+                ).fetchone() is not None
+            self._pending[cache_key] = None
+        return existed
+
+    async def adelete(self, key, collection=DEFAULT_COLLECTION):
+        return self.delete(key, collection)
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+    def commit(self):
+        """Écrit les modifications en attente en une transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            writes = [(collection, key, zlib.compress(value.encode('utf-8')))
+                      for (collection, key), value in self._pending.items() if value is not None]
+            deletes = [(collection, key) for (collection, key), value in self._pending.items() if value is None]
+            with self._conn:
+                self._conn.executemany("DELETE FROM kv WHERE collection = ? AND key = ?", deletes)
+                self._conn.executemany("INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)", writes)
+            self._pending.clear()
+
+    def close(self):
+        """Écrit les modifications en attente, réintègre le journal WAL dans la base et ferme la connexion."""
+        with self._lock:
+            self.commit()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+        _OPEN_STORES.discard(self)
+
+    def persist(self, persist_path, fs=None):
+        """
+        Écrit les modifications en attente. StorageContext.persist passe le
+        chemin de docstore.json / index_store.json : seul son dossier est
+        utilisé ; vers un autre dossier, la base y est copiée.
+        """
+        self.commit()
+        target = os.path.join(os.path.dirname(persist_path) or ".", DOCSTORE_FILE)
+        if os.path.abspath(target) != os.path.abspath(self.path):
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            with self._lock, sqlite3.connect(target) as destination:
+                self._conn.backup(destination)
+
+
+class SQLiteDocumentStore(KVDocumentStore):
+    """Docstore LlamaIndex sur SQLiteKVStore, avec lecture groupée des nodes."""
+    def __init__(self, kvstore, namespace=None, batch_size=100):
+        super().__init__(kvstore, namespace=namespace, batch_size=batch_size)
+
+    def persist(self, persist_path=None, fs=None):
+        self._kvstore.persist(persist_path or os.path.join(os.path.dirname(self._kvstore.path), DOCSTORE_JSON))
+
+    def get_nodes(self, node_ids, raise_error=True):
+        """Nodes des ids donnés, lus en une requête (hors LRU) au lieu d'une par node."""
+        values = self._kvstore.get_many(list(node_ids), collection=self._node_collection)
+        nodes = []
+        for node_id, value in zip(node_ids, values):
+            if value is None:
+                if raise_error:
+                    raise ValueError(f"Node {node_id} not found")
+                continue
+            nodes.append(json_to_doc(value))
+        return nodes
+
+    async def aget_nodes(self, node_ids, raise_error=True):
+        # Lecture SQLite hors de la boucle d'événements
+        return await asyncio.to_thread(self.get_nodes, node_ids, raise_error)
+
+    def close(self):
+        self._kvstore.close()
+
+
+class SQLiteIndexStore(KVIndexStore):
+    """Index store LlamaIndex dans la même base que le docstore."""
+    def persist(self, persist_path=None, fs=None):
+        self._kvstore.persist(persist_path or os.path.join(os.path.dirname(self._kvstore.path), INDEX_STORE_JSON))
+
+
+def _import_json(kvstore, json_path):
+    """Copie un store JSON de LlamaIndex ({collection: {clé: valeur}}) dans la base."""
+    if not os.path.exists(json_path):
+        return 0
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    count = 0
+    for collection, values in data.items():
+        kvstore.put_all(list(values.items()), collection=collection)
+        count += len(values)
+    return count
+
+
+def migrate_json_stores(persist_dir, cache_items=1024):
+    """
+    Convertit docstore.json et index_store.json d'un index persistant en
+    docstore.sqlite (écrit à côté puis renommé). Les fichiers JSON sont conservés.
+    """
+    path = os.path.join(persist_dir, DOCSTORE_FILE)
+    tmp_path = path + ".tmp"
+    for stale in (tmp_path, tmp_path + "-wal", tmp_path + "-shm"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    kvstore = SQLiteKVStore(tmp_path, cache_items=cache_items)
+    nodes = _import_json(kvstore, os.path.join(persist_dir, DOCSTORE_JSON))
+    _import_json(kvstore, os.path.join(persist_dir, INDEX_STORE_JSON))
+    # Le journal WAL est réintégré dans la base avant le renommage
+    kvstore.close()
+    os.replace(tmp_path, path)
+    return nodes
+
+
+def export_json_stores(persist_dir, cache_items=1024):
+    """
+    Réécrit docstore.json et index_store.json depuis docstore.sqlite (retour
+    à RAG_DOCSTORE=json). La base est ensuite renommée en docstore.sqlite.bak :
+    elle ne suivrait plus les écritures dans les fichiers JSON, et le
+    prochain passage en SQLite la reconvertit depuis ceux-ci.
+    """
+    path = os.path.join(persist_dir, DOCSTORE_FILE)
+    kvstore = SQLiteKVStore(path, cache_items=cache_items)
+    stores = {DOCSTORE_JSON: {}, INDEX_STORE_JSON: {}}
+    with kvstore._lock:
+        collections = [row[0] for row in kvstore._conn.execute("SELECT DISTINCT collection FROM kv")]
+    count = 0
+    for collection in collections:
+        values = kvstore.get_all(collection=collection)
+        target = INDEX_STORE_JSON if collection.startswith("index_store") else DOCSTORE_JSON
+        stores[target][collection] = values
+        count += len(values) if target == DOCSTORE_JSON else 0
+    # Journal WAL réintégré : la base renommée est complète
+    kvstore.close()
+    for name, data in stores.items():
+        json_path = os.path.join(persist_dir, name)
+        with open(json_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(json_path + ".tmp", json_path)
+    set_aside_stores(persist_dir)
+    return count
+
+
+def set_aside_stores(persist_dir):
+    """Renomme docstore.sqlite (et ses fichiers WAL) en .bak, sans rien supprimer."""
+    path = os.path.join(persist_dir, DOCSTORE_FILE)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.replace(path + suffix, path + ".bak" + suffix)
+
+
+def open_stores(persist_dir, cache_items=1024, fresh=False):
+    """
+    Docstore et index store SQLite d'un index persistant : la base est
+    ouverte (migrée depuis les fichiers JSON au besoin), ou recréée vide
+    avec `fresh=True` (reconstruction complète de l'index).
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, DOCSTORE_FILE)
+    if fresh:
+        for stale in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(stale):
+                os.remove(stale)
+    elif not os.path.exists(path) and os.path.exists(os.path.join(persist_dir, DOCSTORE_JSON)):
+        print("🔄 Conversion du docstore JSON vers SQLite...")
+        count = migrate_json_stores(persist_dir, cache_items=cache_items)
+        print(f"✅ {count} entrées converties dans {path}")
+    kvstore = SQLiteKVStore(path, cache_items=cache_items)
+    return SQLiteDocumentStore(kvstore), SQLiteIndexStore(kvstore)
@@ -0,0 +1,168 @@
+"""
+Micro-batching des embeddings unitaires (questions, réponses à évaluer).
+
+Sous charge, chaque requête /query embedde sa question par un appel
+séparé à Ollama : autant d'allers-retours HTTP et de passes du modèle que
+de requêtes, alors qu'un appel /api/embed accepte une liste de textes et
+que le coût d'une passe croît bien moins vite que le nombre de textes.
+
+MicroBatcher regroupe les textes soumis pendant une courte fenêtre
+(`window` secondes, quelques millisecondes) ou jusqu'à `max_batch` textes,
+envoie le lot en un seul appel, puis résout le futur de chaque appelant
+avec son propre vecteur. La fenêtre ne s'ouvre que si un lot est déjà en
+cours d'envoi : un texte qui arrive seul part dès le prochain tour de
+boucle (avec ceux soumis au même tour), sans attendre. Les doublons d'un même lot ne sont embeddés
+qu'une fois ; une erreur de l'appel est transmise à tous les appelants du
+lot. MicroBatchEmbedding applique ce regroupement devant un modèle
+LlamaIndex : seuls les appels asynchrones unitaires sont regroupés, les
+listes (indexation, lots de questions) sont déjà batchées et passent
+directement.
+"""
+import asyncio
+import weakref
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+import metrics
+
+
+class _Batch:
+    """Textes en attente d'envoi et futurs des appelants, dans l'ordre d'arrivée."""
+    def __init__(self):
+        self.texts = []
+        self.futures = []
+        self.timer = None
+
+
+class MicroBatcher:
+    """
+    Regroupe les appels `await submit(text)` d'une même boucle asyncio en
+    appels `await embed(texts)` de `max_batch` textes au plus.
+    """
+    def __init__(self, embed, window=0.003, max_batch=32):
+        self._embed = embed
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        # Un lot ouvert par boucle : les futurs ne peuvent pas changer de boucle
+        self._open = weakref.WeakKeyDictionary()
+        self._running = set()
+        self.batches = 0
+        self.texts = 0
+
+    async def submit(self, text):
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(loop)
+        if batch is None:
+            batch = self._open[loop] = _Batch()
+            # Aucun appel en cours : rien à attendre, le lot part au prochain tour de boucle
+            busy = any(task.get_loop() is loop for task in self._running)
+            delay = self.window if busy else 0
+            batch.timer = loop.call_later(delay, self._flush, loop, batch)
+        future = loop.create_future()
+        batch.texts.append(text)
+        batch.futures.append(future)
+        if len(batch.texts) >= self.max_batch:
+            self._flush(loop, batch)
+        return await future
+
+    def _flush(self, loop, batch):
+        if self._open.get(loop) is batch:
+            del self._open[loop]
+        batch.timer.cancel()
+        task = loop.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        # Appelants abandonnés (requête annulée) pendant la fenêtre : leurs textes ne partent pas
+        pending = [(text, future) for text, future in zip(batch.texts, batch.futures) if not future.done()]
+        if not pending:
+            return
+        unique = list(dict.fromkeys(text for text, _ in pending))
+        self.batches += 1
+        self.texts += len(pending)
+        metrics.EMBED_BATCH_SIZE.observe(len(unique))
+        try:
+            vectors = await self._embed(unique)
+        except BaseException as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        by_text = dict(zip(unique, vectors))
+        for text, future in pending:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
+
+
+class MicroBatchEmbedding(BaseEmbedding):
+    """
+    Modèle d'embedding LlamaIndex dont les appels asynchrones unitaires
+    sont regroupés par MicroBatcher avant d'atteindre le modèle enveloppé.
+    """
+    _embed_model = PrivateAttr()
+    _batcher = PrivateAttr()
+
+    def __init__(self, embed_model, window=0.003, max_batch=32, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs
+        )
+        self._embed_model = embed_model
+        self._batcher = MicroBatcher(embed_model._aget_text_embeddings, window=window, max_batch=max_batch)
+
+    @classmethod
+    def class_name(cls):
+        return "MicroBatchEmbedding"
+
+    @property
+    def inner(self):
+        """Modèle d'embedding enveloppé."""
+        return self._embed_model
+
+    @property
+    def batcher(self):
+        return self._batcher
+
+    # Instructions du modèle enveloppé : clés du cache d'embeddings inchangées
+    @property
+    def query_instruction(self):
+        return getattr(self._embed_model, "query_instruction", None)
+
+    @property
+    def text_instruction(self):
+        return getattr(self._embed_model, "text_instruction", None)
+
+    def _get_query_embedding(self, query):
+        return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query):
+        # Une question ne rejoint un lot de textes que si elle s'embedde comme un texte
+        if self.query_instruction != self.text_instruction:
+            return await self._embed_model._aget_query_embedding(query)
+        return await self._batcher.submit(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed_model._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text):
+        return await self._batcher.submit(text)
+
+    def _get_text_embeddings(self, texts):
+        return self._embed_model._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts):
+        if len(texts) == 1:
+            return [await self._batcher.submit(texts[0])]
+        return await self._embed_model._aget_text_embeddings(texts)
@@ -0,0 +1,261 @@
+"""
+Cache persistant d'embeddings partagé par l'indexation, les requêtes et l'évaluation.
+
+CachedEmbedding enveloppe le modèle d'embedding (OllamaEmbedding) : chaque
+texte est cherché dans un LRU en mémoire, puis dans une base SQLite sur
+disque, avant d'appeler le serveur d'embedding. La clé est
+sha256(nom du modèle + instruction + texte) : une même question embeddée par
+le retriever puis par l'évaluateur ne coûte qu'un seul appel.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+
+# Stores ouverts : une connexion SQLite ne doit pas traverser un fork (workers pré-forkés).
+# Un seul hook par module, qui ne reconnecte que les stores encore vivants.
+_OPEN_STORES = weakref.WeakSet()
+
+
+def _reconnect_after_fork():
+    for store in list(_OPEN_STORES):
+        store._connect()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reconnect_after_fork)
+
+
+class EmbeddingCacheStore:
+    """
+    LRU en mémoire + stockage SQLite (mode WAL, partageable entre processus).
+    Les vecteurs sont stockés en float32 bruts.
+    """
+    def __init__(self, path=None, max_memory_items=10000):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        # Écritures en arrière-plan du chemin asynchrone (références gardées jusqu'à la fin)
+        self._writes = set()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._connect()
+            _OPEN_STORES.add(self)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(namespace, text):
+        return hashlib.sha256(f"{namespace}\0{text}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """Retourne une liste de vecteurs (ou None pour les absents)."""
+        results = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.append(i)
+
+            if missing and self._conn is not None:
+                wanted = list({keys[i] for i in missing})
+                found = {}
+                # SQLite limite le nombre de paramètres par requête
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+                still_missing = []
+                for i in missing:
+                    vector = found.get(keys[i])
+                    if vector is not None:
+                        results[i] = vector
+                        self._remember(keys[i], vector)
+                        self.disk_hits += 1
+                    else:
+                        still_missing.append(i)
+                missing = still_missing
+            self.misses += len(missing)
+        return results
+
+    async def aget_many(self, keys):
+        """
+        Variante asynchrone de get_many : si une clé manque au LRU, la base
+        SQLite est lue dans un thread au lieu de bloquer la boucle d'événements.
+        """
+        with self._lock:
+            in_memory = all(key in self._memory for key in keys)
+        if in_memory or self._conn is None:
+            return self.get_many(keys)
+        return await asyncio.to_thread(self.get_many, keys)
+
+    def _remember_many(self, keys, vectors):
+        """Ajoute les vecteurs au LRU ; retourne les lignes à écrire dans la base."""
+        rows = []
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+        return rows
+
+    def _write(self, rows):
+        with self._lock:
+            if self._conn is not None and rows:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._conn.commit()
+
+    def put_many(self, keys, vectors):
+        self._write(self._remember_many(keys, vectors))
+
+    def aput_many(self, keys, vectors):
+        """
+        Variante pour le chemin asynchrone : le LRU est mis à jour tout de
+        suite, l'écriture SQLite (et son commit) part dans un thread sans
+        retarder la requête.
+        """
+        rows = self._remember_many(keys, vectors)
+        if self._conn is None or not rows:
+            return
+        task = asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+        self._writes.add(task)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task):
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Cache d'embeddings : écriture impossible ({task.exception()})")
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Modèle d'embedding LlamaIndex qui délègue au modèle enveloppé
+    uniquement les textes absents du cache.
+    """
+    _embed_model = PrivateAttr()
+    _cache = PrivateAttr()
+
+    def __init__(self, embed_model, cache, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def inner(self):
+        """Modèle d'embedding enveloppé."""
+        return self._embed_model
+
+    def _keys(self, texts, instruction_attr):
+        # Requêtes et textes partagent les entrées tant que le modèle n'ajoute pas d'instruction
+        instruction = getattr(self._embed_model, instruction_attr, None) or ""
+        namespace = f"{self.model_name}\0{instruction}"
+        return [EmbeddingCacheStore.make_key(namespace, text) for text in texts]
+
+    def _lookup(self, texts, instruction_attr):
+        """Retourne (clés, vecteurs trouvés ou None, textes manquants sans doublons)."""
+        keys = self._keys(texts, instruction_attr)
+        vectors = self._cache.get_many(keys)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        return keys, vectors, missing
+
+    async def _alookup(self, texts, instruction_attr):
+        keys = self._keys(texts, instruction_attr)
+        vectors = await self._cache.aget_many(keys)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        return keys, vectors, missing
+
+    def _store(self, texts, keys, vectors, missing, computed, put=None):
+        by_text = dict(zip(missing, computed))
+        new_keys = []
+        new_vectors = []
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                vectors[i] = by_text[texts[i]]
+                new_keys.append(keys[i])
+                new_vectors.append(vectors[i])
+        if new_keys:
+            (put or self._cache.put_many)(new_keys, new_vectors)
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+    def _get_query_embedding(self, query):
+        keys, vectors, missing = self._lookup([query], "query_instruction")
+        computed = [self._embed_model._get_query_embedding(query)] if missing else []
+        return self._store([query], keys, vectors, missing, computed)[0]
+
+    async def _aget_query_embedding(self, query):
+        keys, vectors, missing = await self._alookup([query], "query_instruction")
+        computed = [await self._embed_model._aget_query_embedding(query)] if missing else []
+        return self._store([query], keys, vectors, missing, computed, put=self._cache.aput_many)[0]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts):
+        keys, vectors, missing = self._lookup(texts, "text_instruction")
+        computed = self._embed_model._get_text_embeddings(missing) if missing else []
+        return self._store(texts, keys, vectors, missing, computed)
+
+    async def _aget_text_embeddings(self, texts):
+        keys, vectors, missing = await self._alookup(texts, "text_instruction")
+        computed = await self._embed_model._aget_text_embeddings(missing) if missing else []
+        return self._store(texts, keys, vectors, missing, computed, put=self._cache.aput_many)
@@ -0,0 +1,361 @@
+"""
+Modèles factices pour tester l'API sans Groq ni Ollama.
+
+Activés par RAG_LLM_BACKEND=fake et/ou RAG_EMBED_BACKEND=fake : le LLM
+simule la latence du premier token et le débit de génération (en streaming
+ou non), l'embedding produit des vecteurs déterministes dérivés du texte.
+Les deux restent grossièrement « pertinents » (réponse extraite du contexte,
+vecteurs de mots hachés) pour que les scores d'évaluation hors ligne aient
+un sens.
+
+FakeUpstreamServer sert les mêmes modèles en HTTP (API Ollama /api/embed et
+API OpenAI /chat/completions de Groq), avec injection de latence, de
+lenteurs occasionnelles, d'erreurs 503 et de connexions coupées : il permet
+d'exercer les vrais clients et la couche résiliente (upstream.py).
+
+Usage (depuis Backend/) :
+    python fakes.py --port 11435 --latency 0.02 --slow-rate 0.05 --error-rate 0.1
+    OLLAMA_HOST=http://127.0.0.1:11435 GROQ_API_BASE=http://127.0.0.1:11435/openai/v1 \
+        GROQ_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+FAKE_ANSWER = (
+    "Réponse simulée : le diabète est une maladie chronique caractérisée par un excès "
+    "de sucre dans le sang. Consultez un professionnel de santé pour un avis médical."
+)
+
+# Délimiteur du contexte dans les prompts de LlamaIndex (text_qa_template)
+_CONTEXT_SEPARATOR = "---------------------"
+
+
+def words(text):
+    """Mots en minuscules et sans accents."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"\w+", text)
+
+
+def extract_answer(prompt, max_sentences=2):
+    """
+    Réponse extractive : les phrases du contexte partageant le plus de mots
+    avec la question, dans leur ordre d'origine. FAKE_ANSWER si le prompt
+    n'a pas la forme contexte + question.
+    """
+    parts = prompt.split(_CONTEXT_SEPARATOR)
+    match = re.search(r"Query:\s*(.*?)\s*Answer:", parts[-1], re.S)
+    if len(parts) < 3 or match is None:
+        return FAKE_ANSWER
+    query_words = {word for word in words(match.group(1)) if len(word) > 3}
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", parts[1]) if len(s.strip()) > 20]
+    scored = [(len(query_words & set(words(sentence))), i) for i, sentence in enumerate(sentences)]
+    best = sorted(i for score, i in sorted(scored, key=lambda item: -item[0])[:max_sentences] if score > 0)
+    if not best:
+        return FAKE_ANSWER
+    return " ".join(sentences[i] for i in best)
+
+
+class FakeLLM(CustomLLM):
+    """
+    LLM factice : attend `latency` secondes avant le premier token,
+    puis `token_delay` secondes entre chaque token. Sans `answer` fixe,
+    la réponse est extraite du contexte du prompt (extract_answer).
+    """
+    latency: float = 0.0
+    token_delay: float = 0.0
+    answer: Optional[str] = None
+
+    @property
+    def metadata(self):
+        return LLMMetadata(model_name="fake-llm")
+
+    @classmethod
+    def class_name(cls):
+        return "FakeLLM"
+
+    def _answer(self, prompt):
+        return self.answer if self.answer is not None else extract_answer(prompt)
+
+    @staticmethod
+    def _tokens(answer):
+        return re.findall(r"\S+\s*", answer)
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        answer = self._answer(prompt)
+        time.sleep(self.latency + self.token_delay * len(self._tokens(answer)))
+        return CompletionResponse(text=answer)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        def gen():
+            time.sleep(self.latency)
+            text = ""
+            for token in self._tokens(self._answer(prompt)):
+                time.sleep(self.token_delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        answer = self._answer(prompt)
+        await asyncio.sleep(self.latency + self.token_delay * len(self._tokens(answer)))
+        return CompletionResponse(text=answer)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt, formatted=False, **kwargs):
+        async def gen():
+            await asyncio.sleep(self.latency)
+            text = ""
+            for token in self._tokens(self._answer(prompt)):
+                await asyncio.sleep(self.token_delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+        return gen()
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Embedding factice : sac de mots haché (chaque mot ajoute ±1 sur une
+    dimension tirée de son hash), normalisé. Déterministe, et des textes
+    partageant des mots ont des vecteurs proches. Un texte sans mot reçoit
+    un vecteur pseudo-aléatoire dont la graine est le hash du texte.
+    """
+    embed_dim: int = 1024
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls):
+        return "FakeEmbedding"
+
+    def _vector(self, text):
+        vector = np.zeros(self.embed_dim)
+        for word in words(text):
+            digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), "little")
+            vector[digest % self.embed_dim] += 1.0 if digest >> 63 else -1.0
+        if not vector.any():
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.embed_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _get_query_embedding(self, query):
+        time.sleep(self.latency)
+        return self._vector(query)
+
+    def _get_text_embedding(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts):
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def _aget_query_embedding(self, query):
+        await asyncio.sleep(self.latency)
+        return self._vector(query)
+
+    async def _aget_text_embedding(self, text):
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeUpstreamServer:
+    """
+    Serveur HTTP local imitant Ollama et Groq. Chaque requête attend
+    `latency` secondes (`slow_latency` avec la probabilité `slow_rate`),
+    puis échoue en 503 avec la probabilité `error_rate`, ou voit sa
+    connexion coupée avec la probabilité `drop_rate`. `down=True` répond
+    503 à tout. Les attributs peuvent être modifiés pendant l'exécution.
+    Un appel d'embedding coûte en plus `item_latency` secondes par texte ;
+    avec `parallel` > 0, le serveur ne traite que `parallel` requêtes à la
+    fois (comme OLLAMA_NUM_PARALLEL), les autres attendent leur tour.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, slow_rate=0.0, slow_latency=1.0,
+                 error_rate=0.0, drop_rate=0.0, token_delay=0.0, item_latency=0.0, parallel=0, seed=0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.token_delay = token_delay
+        self.item_latency = item_latency
+        self._slots = threading.BoundedSemaphore(parallel) if parallel > 0 else None
+        self.down = False
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._embedding = FakeEmbedding(model_name="fake-embedding")
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        # Connexions coupées par le client (requête couverte annulée...) : pas de trace dans la console
+        self._httpd.handle_error = lambda request, client_address: None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _fault(self):
+        """Latence et panne tirées pour une requête : (délai, "error" / "drop" / None)."""
+        with self._lock:
+            self.requests += 1
+            delay = self.slow_latency if self._random.random() < self.slow_rate else self.latency
+            draw = self._random.random()
+        if self.down or draw < self.error_rate:
+            return delay, "error"
+        if draw < self.error_rate + self.drop_rate:
+            return delay, "drop"
+        return delay, None
+
+    def _work(self, delay):
+        if self._slots is None:
+            time.sleep(delay)
+            return
+        with self._slots:
+            time.sleep(delay)
+
+    @staticmethod
+    def _inputs(payload):
+        inputs = payload.get("input", payload.get("prompt", ""))
+        return [inputs] if isinstance(inputs, str) else inputs
+
+    def _embed(self, payload):
+        inputs = self._inputs(payload)
+        vectors = [self._embedding._vector(text) for text in inputs]
+        if "prompt" in payload:
+            return {"embedding": vectors[0]}
+        return {"model": payload.get("model", "fake-embedding"), "embeddings": vectors}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, Nagle ajoute ~40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chat(self, payload):
+                prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+                answer = extract_answer(prompt)
+                base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": payload.get("model", "fake-llm")}
+                if not payload.get("stream"):
+                    self._send_json(200, {
+                        **base, "object": "chat.completion",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": answer}}],
+                        "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(answer.split()),
+                                  "total_tokens": len(prompt.split()) + len(answer.split())},
+                    })
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                tokens = FakeLLM._tokens(answer) + [None]
+                for token in tokens:
+                    time.sleep(server.token_delay)
+                    delta = {"role": "assistant", "content": token} if token is not None else {}
+                    chunk = {**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None if token else "stop"}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                delay, fault = server._fault()
+                embed = self.path.endswith(("/api/embed", "/api/embeddings"))
+                if embed and fault is None:
+                    delay += server.item_latency * len(server._inputs(payload))
+                server._work(delay)
+                if fault == "drop":
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if fault == "error":
+                    self._send_json(503, {"error": "service indisponible (simulé)"})
+                    return
+                if embed:
+                    self._send_json(200, server._embed(payload))
+                elif self.path.endswith("/chat/completions"):
+                    self._chat(payload)
+                else:
+                    self._send_json(404, {"error": f"chemin inconnu : {self.path}"})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur Ollama / Groq factice avec injection de pannes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latence de chaque requête (secondes)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Proportion de requêtes lentes")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Latence des requêtes lentes (secondes)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Proportion de connexions coupées")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Délai entre deux tokens en streaming")
+    parser.add_argument("--item-latency", type=float, default=0.0, help="Coût de chaque texte embeddé (secondes)")
+    parser.add_argument("--parallel", type=int, default=0, help="Requêtes traitées simultanément (0 = sans limite)")
+    args = parser.parse_args()
+
+    server = FakeUpstreamServer(
+        args.host, args.port, latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        error_rate=args.error_rate, drop_rate=args.drop_rate, token_delay=args.token_delay,
+        item_latency=args.item_latency, parallel=args.parallel
+    )
+    print(f"🧪 Serveur factice sur {server.url} (Ollama : /api/embed, Groq : /openai/v1/chat/completions)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Ingestion incrémentale du corpus scrapé dans l'index persistant.
+
+Chaque document est identifié par son URL et porte une empreinte
+`sha256(url + contenu)` enregistrée dans le docstore (hash du document).
+Une synchronisation ne chunke et n'embedde que les documents nouveaux ou
+modifiés, et supprime de l'index les URLs qui ont disparu du corpus :
+ré-ingérer un corpus inchangé ne fait aucun appel d'embedding.
+
+Avec un Deduplicator (dedup.py), les documents sont rapprochés par URL
+canonique et les chunks à embedder sont d'abord comparés (MinHash/LSH) à
+ceux déjà présents dans l'index : les quasi-doublons ne sont pas insérés.
+Un document dont tous les chunks sont écartés garde son empreinte dans le
+docstore (sans nodes) : inchangé, il n'est réexaminé que si l'index a perdu
+ou modifié un document depuis.
+"""
+import hashlib
+import uuid
+
+from llama_index.core import Document
+from llama_index.core.ingestion import run_transformations
+
+from dedup import canonical_url
+
+
+def content_hash(url, content):
+    """Empreinte d'un document : URL + digest du contenu."""
+    return hashlib.sha256(f"{url}\n{content}".encode('utf-8')).hexdigest()
+
+
+def document_id(url):
+    """Identifiant stable d'un document, dérivé de son URL."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+
+
+def _legacy_hash(document, url=None):
+    """
+    Hash LlamaIndex d'un document tel que créé avant l'ingestion incrémentale
+    (texte + métadonnées url / timestamp), pour reconnaître les anciens index.
+    `url` est l'URL scrapée d'origine quand le document porte l'URL canonique.
+    """
+    metadata = dict(document.metadata)
+    if url is not None:
+        metadata['url'] = url
+    return Document(text=document.text, metadata=metadata).hash
+
+
+class SyncReport:
+    """Résumé d'une synchronisation."""
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.removed = []
+        self.unchanged = 0
+        self.duplicates_removed = 0
+        self.migrated = 0
+        self.embedded_chunks = 0
+        # Documents dont tous les chunks sont des quasi-doublons : rien à indexer
+        self.skipped = []
+        self.dedup = None
+
+    @property
+    def changed(self):
+        # Les documents écartés comptent : leur empreinte doit être persistée
+        return bool(self.added or self.updated or self.removed or self.duplicates_removed or self.migrated
+                    or self.skipped)
+
+    def to_dict(self):
+        return {
+            "added": len(self.added),
+            "updated": len(self.updated),
+            "removed": len(self.removed),
+            "unchanged": self.unchanged,
+            "duplicates_removed": self.duplicates_removed,
+            "migrated": self.migrated,
+            "embedded_chunks": self.embedded_chunks,
+            "skipped": len(self.skipped),
+            "dedup": self.dedup.summary() if self.dedup is not None else None,
+        }
+
+
+def _existing_documents(docstore, normalize_url=None):
+    """Regroupe les documents déjà indexés par URL : {url: [ref_doc_id, ...]}."""
+    by_url = {}
+    for ref_doc_id, info in (docstore.get_all_ref_doc_info() or {}).items():
+        url = (info.metadata or {}).get('url')
+        if normalize_url is not None and url is not None:
+            url = normalize_url(url)
+        by_url.setdefault(url, []).append(ref_doc_id)
+    return by_url
+
+
+# Nodes relus du docstore par lot pour calculer les signatures manquantes
+_SEED_BATCH = 1024
+
+
+def _seed(dedup, index):
+    """
+    Référence des quasi-doublons : signatures persistées des chunks indexés,
+    les autres relus du docstore par lots de _SEED_BATCH.
+    """
+    vector_store = index.vector_store
+    snapshot = vector_store.snapshot()
+    node_ids = [vector_store.node_id(row, snapshot) for row in range(len(vector_store))]
+    missing = dedup.load_signatures(node_ids)
+    for start in range(0, len(missing), _SEED_BATCH):
+        dedup.seed(index.docstore.get_nodes(missing[start:start + _SEED_BATCH]))
+
+
+def _insert(index, document, digest, report, dedup=None):
+    """Découpe, filtre (quasi-doublons) et insère un document ; False si aucun chunk n'est gardé."""
+    # Mêmes transformations que index.insert (découpage selon Settings)
+    nodes = run_transformations([document], index._transformations)
+    if dedup is not None:
+        nodes = dedup.filter_nodes(nodes)
+    if nodes:
+        index.insert_nodes(nodes)
+        report.embedded_chunks += len(nodes)
+    # L'empreinte URL + contenu sert de hash du document dans le docstore, même
+    # pour un document entièrement écarté (il n'est pas rechunké s'il ne change pas)
+    index.docstore.set_document_hash(document.id_, digest)
+    return bool(nodes)
+
+
+def sync_index(index, documents, dedup=None):
+    """
+    Synchronise l'index avec la liste de documents (un document par URL,
+    le dernier l'emporte en cas de doublon). Retourne un SyncReport.
+    """
+    report = SyncReport()
+    docstore = index.docstore
+
+    wanted = {}
+    for document in documents:
+        wanted[document.metadata['url']] = document
+    # Les documents indexés avant la déduplication sont retrouvés par leur URL canonique
+    existing = _existing_documents(docstore, canonical_url if dedup is not None else None)
+    pending = []
+    # Documents déjà écartés (quasi-doublons) et inchangés depuis
+    still_skipped = []
+
+    for url, document in wanted.items():
+        digest = content_hash(url, document.text)
+        ref_doc_ids = existing.pop(url, [])
+
+        # Cherche un document déjà indexé avec le même contenu
+        kept = None
+        # Les anciens index ont haché l'URL scrapée, pas l'URL canonique
+        original_url = dedup.original_urls.get(url) if dedup is not None else None
+        for ref_doc_id in ref_doc_ids:
+            stored_hash = docstore.get_document_hash(ref_doc_id)
+            if stored_hash == digest:
+                kept = ref_doc_id
+                break
+            if stored_hash == _legacy_hash(document, original_url):
+                # Ancien index : on adopte l'empreinte sans ré-embedder
+                docstore.set_document_hash(ref_doc_id, digest)
+                report.migrated += 1
+                kept = ref_doc_id
+                break
+
+        for ref_doc_id in ref_doc_ids:
+            if ref_doc_id != kept:
+                index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+                if kept is not None:
+                    # Doublon d'une URL déjà indexée avec le bon contenu
+                    report.duplicates_removed += 1
+
+        if kept is not None:
+            report.unchanged += 1
+        elif not ref_doc_ids and docstore.get_document_hash(document.id_) == digest:
+            still_skipped.append((url, document, digest, False))
+        else:
+            pending.append((url, document, digest, bool(ref_doc_ids)))
+
+    # URLs disparues du corpus
+    for url, ref_doc_ids in existing.items():
+        for ref_doc_id in ref_doc_ids:
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+        report.removed.append(url)
+
+    # Le chunk dont un document écarté était le doublon a pu disparaître : on le réexamine
+    if report.removed or any(existed for *_, existed in pending):
+        pending.extend(still_skipped)
+    else:
+        report.unchanged += len(still_skipped)
+
+    if dedup is not None:
+        report.dedup = dedup.report
+        if pending:
+            # Référence des quasi-doublons : les chunks restés dans l'index
+            _seed(dedup, index)
+
+    # Insertions après les suppressions : un document modifié n'est pas comparé à son ancienne version
+    for url, document, digest, existed in pending:
+        inserted = _insert(index, document, digest, report, dedup)
+        if existed:
+            report.updated.append(url)
+        elif inserted:
+            report.added.append(url)
+        else:
+            report.skipped.append(url)
+
+    if dedup is not None and pending:
+        dedup.save_signatures()
+    return report
@@ -0,0 +1,71 @@
+"""
+Limitation du nombre de requêtes RAG en cours dans un processus.
+
+Le chemin /query est asynchrone de bout en bout : une requête en attente du
+LLM n'occupe plus de thread, seulement une coroutine. Le QueryLimiter borne
+le nombre de requêtes simultanées (sémaphore) et refuse les requêtes en
+trop au lieu de les laisser s'empiler (l'API répond alors 429).
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class QueryLimitExceeded(Exception):
+    """Trop de requêtes en cours : le serveur est saturé."""
+
+
+class QueryLimiter:
+    """
+    Sémaphore asynchrone avec file d'attente bornée dans le temps :
+    une requête attend au plus `queue_timeout` secondes qu'une place se libère.
+    """
+    def __init__(self, max_inflight, queue_timeout=0.0):
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    async def _wait(self):
+        if self.queue_timeout <= 0:
+            if self._semaphore.locked():
+                return False
+            await self._semaphore.acquire()
+            return True
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def acquire(self):
+        """Réserve une place, ou lève QueryLimitExceeded. À libérer avec release()."""
+        if not await self._wait():
+            self.rejected += 1
+            raise QueryLimitExceeded(
+                f"Trop de requêtes en cours ({self.max_inflight} maximum), réessayez plus tard"
+            )
+        self.in_flight += 1
+        self.accepted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Réserve une place pour la durée du bloc, ou lève QueryLimitExceeded."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "max_inflight": self.max_inflight,
+            "in_flight": self.in_flight,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
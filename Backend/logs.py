@@ -0,0 +1,37 @@
+"""
+Journalisation structurée de l'API : une ligne JSON par événement.
+
+Les champs propres à un événement sont passés dans `extra={"fields": {...}}`.
+Le niveau est fixé par RAG_LOG_LEVEL (INFO par défaut) : le détail des
+en-têtes de chaque requête n'est écrit qu'au niveau DEBUG.
+"""
+import json
+import logging
+import sys
+import time
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level="INFO"):
+    """Configure le logger `rag` (idempotent) et le retourne."""
+    logger = logging.getLogger("rag")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level.upper())
+    return logger
@@ -1,3 +1,6 @@
+import asyncio
+import os
+import time
 from typing import Union
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,11 +9,17 @@ from contextlib import asynccontextmanager
 import controller
 import schema
 import crud
+import metrics
+from config import LOG_LEVEL, PROFILING_ENABLED, PROFILE_INTERVAL, PROFILE_DIR
+from logs import setup_logging
+from profiler import SamplingProfiler
+
+logger = setup_logging(LOG_LEVEL)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    crud.init_rag_model()
+    # Startup : le modèle se charge en arrière-plan, l'API répond immédiatement (voir /ready)
+    crud.start_background_init()
     yield
     # Shutdown (if needed)
 
@@ -26,13 +35,58 @@ app.add_middleware(
     expose_headers=["*"]  # Expose tous les headers
 )
 
-# Middleware de debug pour voir les requêtes
+# Journal, métriques et étapes mesurées de chaque requête
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"🔍 Requête reçue: {request.method} {request.url}")
-    print(f"📍 Origin: {request.headers.get('origin', 'N/A')}")
-    print(f"📍 Headers: {dict(request.headers)}")
-    response = await call_next(request)
+async def observe_requests(request: Request, call_next):
+    trace = metrics.start_trace()
+    logger.debug("requête reçue", extra={"fields": {
+        "method": request.method,
+        "url": str(request.url),
+        "origin": request.headers.get('origin'),
+        "headers": dict(request.headers),
+    }})
+    # Profil de la requête sur demande (en-tête X-Profile), si activé par RAG_PROFILING=1
+    profiler = None
+    if PROFILING_ENABLED and request.headers.get("x-profile"):
+        profiler = SamplingProfiler(PROFILE_INTERVAL).start()
+
+    start = time.perf_counter()
+    status = 500
+    metrics.HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        elapsed = time.perf_counter() - start
+        # Chemin de la route (/items/{item_id}) plutôt que l'URL : nombre de séries borné
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUESTS.inc(method=request.method, path=path, status=status)
+        metrics.HTTP_DURATION.observe(elapsed, method=request.method, path=path)
+        if profiler is not None:
+            profiler.stop()
+
+    stages = {}
+    for stage, duration_ms in trace:
+        stages[stage] = round(stages.get(stage, 0) + duration_ms, 2)
+    fields = {
+        "method": request.method,
+        "path": request.url.path,
+        "status": status,
+        "duration_ms": round(elapsed * 1000, 2),
+        "stages": stages,
+    }
+    if trace:
+        response.headers["Server-Timing"] = metrics.server_timing(trace)
+    if profiler is not None:
+        # Écriture hors de la boucle d'événements ; seul le nom du fichier est renvoyé au client
+        profile_path = await asyncio.to_thread(
+            profiler.save, PROFILE_DIR, request.url.path.strip("/").replace("/", "_") or "root"
+        )
+        response.headers["X-Profile-File"] = os.path.basename(profile_path)
+        fields["profile"] = profile_path
+    logger.info("requête traitée", extra={"fields": fields})
     return response
 
 @app.get("/")
@@ -46,6 +100,10 @@ def read_root():
         }
     )
 
+@app.get("/ready")
+def readiness_endpoint():
+    return controller.readiness_controller()
+
 @app.options("/query")
 async def options_query():
     """Handle preflight CORS requests"""
@@ -59,13 +117,33 @@ async def options_query():
     )
 
 @app.post("/query")
-def query_rag_endpoint(request: schema.QueryRequest):
-    return controller.query_controller(request)
+async def query_rag_endpoint(request: schema.QueryRequest):
+    return await controller.query_controller(request)
+
+@app.post("/query/stream")
+async def query_stream_endpoint(request: schema.QueryRequest):
+    return await controller.query_stream_controller(request)
+
+@app.post("/query/batch")
+async def query_batch_endpoint(request: schema.BatchQueryRequest):
+    return await controller.query_batch_controller(request)
 
 @app.post("/evaluate")
 def evaluate_rag_endpoint(request: schema.EvaluationRequest):
     return controller.evaluate_controller(request)
 
+@app.post("/index/refresh")
+def refresh_index_endpoint():
+    return controller.refresh_index_controller()
+
+@app.get("/cache/stats")
+def cache_stats_endpoint():
+    return controller.cache_stats_controller()
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return controller.metrics_controller()
+
 @app.get("/items/{item_id}")
 def read_item(item_id: int, q: Union[str, None] = None):
     return {"item_id": item_id, "q": q}
\ No newline at end of file
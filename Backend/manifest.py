@@ -0,0 +1,83 @@
+"""
+Manifeste de l'index persistant (`index_manifest.json`).
+
+Il enregistre l'empreinte du corpus utilisé pour la dernière
+synchronisation, les paramètres de découpage et le modèle d'embedding.
+Au démarrage, un manifeste à jour évite de relire et parser le corpus :
+- corpus modifié : synchronisation incrémentale ;
+- découpage ou modèle d'embedding différents : reconstruction complète ;
+- manifeste absent (index ancien ou copié) : le modèle d'embedding est
+  vérifié sur les vecteurs eux-mêmes (RAGModel.verify_embeddings) avant
+  toute synchronisation incrémentale.
+"""
+import hashlib
+import json
+import os
+
+from config import CHUNK_OVERLAP, CHUNK_SIZE
+
+MANIFEST_FILE = "index_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def corpus_fingerprint(path, previous=None):
+    """
+    Empreinte du fichier corpus : taille, date de modification et sha256 des
+    octets. Si taille et date sont celles de `previous`, le fichier n'est pas relu.
+    """
+    stat = os.stat(path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        return dict(previous)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+
+
+def build_manifest(embed_model_name, fingerprint):
+    return {
+        "version": MANIFEST_VERSION,
+        "corpus": fingerprint,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embed_model": embed_model_name,
+    }
+
+
+def read_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(index_dir, manifest):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def check_manifest(index_dir, corpus_path, embed_model_name):
+    """
+    Compare l'index au corpus et à la configuration courante.
+    Retourne (état, raison) avec l'état parmi :
+    "fresh", "stale" (corpus modifié), "unverified" (manifeste absent : modèle
+    d'embedding inconnu) ou "incompatible".
+    """
+    manifest = read_manifest(index_dir)
+    if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+        return "unverified", "manifeste absent"
+    if manifest.get("embed_model") != embed_model_name:
+        return "incompatible", f"modèle d'embedding changé ({manifest.get('embed_model')} → {embed_model_name})"
+    if (manifest.get("chunk_size"), manifest.get("chunk_overlap")) != (CHUNK_SIZE, CHUNK_OVERLAP):
+        return "incompatible", "paramètres de découpage changés"
+    previous = manifest.get("corpus") or {}
+    if not os.path.exists(corpus_path):
+        return "stale", "corpus introuvable"
+    if corpus_fingerprint(corpus_path, previous).get("sha256") != previous.get("sha256"):
+        return "stale", "corpus modifié"
+    return "fresh", "index à jour"
@@ -0,0 +1,305 @@
+"""
+Métriques au format Prometheus et mesure des étapes d'une requête.
+
+Sans dépendance externe : compteurs, jauges et histogrammes sont gardés en
+mémoire et rendus au format texte de Prometheus par /metrics. Les valeurs
+déjà suivies ailleurs (caches, limiteur) sont lues au moment de la collecte.
+
+`span("embed")` mesure une étape : la durée alimente l'histogramme
+rag_stage_duration_seconds et, si une trace est ouverte pour la requête
+en cours (contextvar posée par le middleware), y est ajoutée. Les appels au
+LLM et l'assemblage du prompt sont mesurés via l'instrumentation de
+LlamaIndex (install_llm_instrumentation).
+
+Chaque processus a ses propres métriques : avec plusieurs workers, chaque
+collecte ne voit que celui qui répond.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Bornes (secondes) des histogrammes de durée, du cache (~ms) aux générations longues (~10 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Recopie un compteur tenu ailleurs (statistiques des caches, du limiteur)."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Compteurs par borne (non cumulés), somme, nombre d'observations
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Métriques enregistrées et fonctions de collecte appelées à chaque rendu."""
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """`collector()` met à jour des jauges/compteurs juste avant le rendu."""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                # Une source indisponible (modèle en cours de chargement) ne bloque pas la collecte
+                pass
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "rag_http_requests_total", "Requêtes HTTP traitées", ("method", "path", "status")
+))
+HTTP_DURATION = REGISTRY.register(Histogram(
+    "rag_http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "path")
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "rag_http_requests_in_flight", "Requêtes HTTP en cours"
+))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "Durée des étapes du pipeline RAG", ("stage",)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "rag_llm_tokens_total", "Tokens générés par le LLM (estimés en mots si le LLM ne les compte pas)"
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "rag_cache_lookups_total", "Recherches dans les caches par résultat", ("cache", "result")
+))
+CACHE_ITEMS = REGISTRY.register(Gauge(
+    "rag_cache_items", "Entrées présentes dans les caches en mémoire", ("cache",)
+))
+QUERIES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "rag_queries_in_flight", "Requêtes RAG en cours (limiteur)"
+))
+QUERIES_REJECTED = REGISTRY.register(Counter(
+    "rag_queries_rejected_total", "Requêtes RAG refusées par le limiteur (429)"
+))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "rag_coalesced_requests_total",
+    "Requêtes RAG ayant lancé un calcul (leader) ou rejoint un calcul identique en cours (follower)",
+    ("path", "role")
+))
+COALESCING_RATIO = REGISTRY.register(Gauge(
+    "rag_coalescing_ratio", "Part des requêtes RAG servies par un calcul identique déjà en cours", ("path",)
+))
+EMBED_BATCH_SIZE = REGISTRY.register(Histogram(
+    "rag_embed_batch_size", "Textes distincts par appel d'embedding regroupé (micro-batching)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    "rag_upstream_requests_total", "Appels aux services amont (Groq, Ollama) par résultat", ("upstream", "outcome")
+))
+UPSTREAM_RETRIES = REGISTRY.register(Counter(
+    "rag_upstream_retries_total", "Nouvelles tentatives d'appels aux services amont", ("upstream",)
+))
+UPSTREAM_HEDGES = REGISTRY.register(Counter(
+    "rag_upstream_hedges_total", "Requêtes couvertes envoyées, et gagnées par la seconde requête", ("upstream", "result")
+))
+UPSTREAM_BREAKER_OPEN = REGISTRY.register(Gauge(
+    "rag_upstream_breaker_open", "Disjoncteur ouvert (1) ou fermé (0) par service amont", ("upstream",)
+))
+
+# Étapes de la requête HTTP en cours : liste de (étape, durée en ms)
+_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+def start_trace():
+    """Ouvre une trace pour la requête courante ; retourne la liste des étapes."""
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def record_stage(stage, seconds):
+    STAGE_DURATION.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, round(seconds * 1000, 2)))
+
+
+@contextmanager
+def span(stage):
+    """Mesure la durée du bloc comme étape `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing(trace):
+    """En-tête Server-Timing (affiché par les outils de développement des navigateurs)."""
+    return ", ".join(f"{stage};dur={duration_ms}" for stage, duration_ms in trace)
+
+
+def _count_tokens(response):
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if completion_tokens is None and isinstance(usage, dict):
+        completion_tokens = usage.get("completion_tokens")
+    if completion_tokens is not None:
+        return int(completion_tokens)
+    text = getattr(response, "text", None)
+    if text is None:
+        message = getattr(response, "message", None)
+        text = getattr(message, "content", None) or ""
+    return len(text.split())
+
+
+_prompt_start = contextvars.ContextVar("rag_prompt_start", default=None)
+_instrumented = False
+
+
+def install_llm_instrumentation():
+    """
+    Mesure l'assemblage du prompt (début de la synthèse → appel au LLM),
+    la durée de chaque appel au LLM (jusqu'au dernier token en streaming)
+    et les tokens générés, à partir des événements de LlamaIndex.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    # Déjà chargé par le modèle : import local pour garder le démarrage léger
+    from llama_index.core.instrumentation import get_dispatcher
+    from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+
+    starts = {}
+
+    class StageEventHandler(BaseEventHandler):
+        @classmethod
+        def class_name(cls):
+            return "StageEventHandler"
+
+        def handle(self, event, **kwargs):
+            name = event.class_name()
+            now = time.perf_counter()
+            if name == "SynthesizeStartEvent":
+                _prompt_start.set(now)
+            elif name in ("LLMCompletionStartEvent", "LLMChatStartEvent"):
+                prompt_start = _prompt_start.get()
+                if prompt_start is not None:
+                    record_stage("prompt", now - prompt_start)
+                    _prompt_start.set(None)
+                starts[event.span_id] = now
+            elif name in ("LLMCompletionEndEvent", "LLMChatEndEvent"):
+                start = starts.pop(event.span_id, None)
+                if start is not None:
+                    record_stage("llm", now - start)
+                LLM_TOKENS.inc(_count_tokens(event.response))
+
+    get_dispatcher().add_event_handler(StageEventHandler())
+    _instrumented = True
@@ -1,23 +1,112 @@
-import json
+import asyncio
 import os
+import threading
+import httpx
+from ollama import AsyncClient as OllamaAsyncClient, Client as OllamaClient
 from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.core import VectorStoreIndex, Document, Settings
+from llama_index.core import VectorStoreIndex, Document, Settings, StorageContext, load_index_from_storage
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.llms.groq import Groq
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from dotenv import load_dotenv
+from config import (
+    GROQ_API_KEY, LLM_BACKEND, EMBED_BACKEND, FAKE_LLM_LATENCY, FAKE_LLM_TOKEN_DELAY,
+    OLLAMA_HOST, GROQ_API_BASE, UPSTREAM_POOL_SIZE, UPSTREAM_MAX_RETRIES, UPSTREAM_BACKOFF, UPSTREAM_BACKOFF_MAX,
+    LLM_DEADLINE, EMBED_DEADLINE, BREAKER_FAILURES, BREAKER_RESET, EMBED_HEDGE_AFTER,
+    EMBED_BATCH_WINDOW, EMBED_BATCH_MAX,
+    INDEX_DIR, SCRAPED_DATA_FILE, VECTOR_DTYPE, CHUNK_SIZE, CHUNK_OVERLAP,
+    INDEX_MODE, IVF_NLIST, IVF_NPROBE, QUANT_PCA_DIM, PQ_SUBSPACES, QUANT_RESCORE, SYNC_ON_STARTUP, DEDUP_ENABLED, DEDUP_THRESHOLD, DOCSTORE_BACKEND, DOCSTORE_CACHE_ITEMS, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K,
+    EMBED_CACHE_ENABLED, EMBED_CACHE_PATH, EMBED_CACHE_MEMORY_ITEMS,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ITEMS, RESPONSE_CACHE_TTL, RESPONSE_CACHE_THRESHOLD
+)
+from vector_store import MmapVectorStore, load_vector_store
+from retriever import NumpyRetriever
+from ann import load_or_build_ivf
+from quantization import QUANTIZATION_KINDS, load_or_build_quantized
+from bm25 import load_or_build_bm25
+from ingestion import document_id, sync_index
+from dedup import DEDUP_REPORT_FILE, DEDUP_SIGNATURES_FILE, Deduplicator
+from docstore import DOCSTORE_FILE, export_json_stores, open_stores, set_aside_stores
+from embedding_cache import CachedEmbedding, EmbeddingCacheStore
+from embed_batcher import MicroBatchEmbedding
+from fakes import FakeEmbedding, FakeLLM
+from response_cache import ResponseCache
+from corpus import load_corpus
+from readiness import StartupState
+from manifest import build_manifest, check_manifest, corpus_fingerprint, write_manifest
+from metrics import install_llm_instrumentation, span
+from upstream import transports
 
-# Charger les variables d'environnement
-load_dotenv()
+def upstream_transports(name, deadline, **options):
+    """Transports httpx résilients (pool, tentatives, délai, disjoncteur) d'un service amont."""
+    return transports(
+        name, pool_size=UPSTREAM_POOL_SIZE, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET,
+        max_retries=UPSTREAM_MAX_RETRIES, backoff=UPSTREAM_BACKOFF, backoff_max=UPSTREAM_BACKOFF_MAX,
+        deadline=deadline, **options
+    )
 
-# Configuration des API keys
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+def create_embed_model():
+    """
+    Modèle d'embedding selon RAG_EMBED_BACKEND (ollama ou fake), enveloppé
+    par le micro-batching puis par le cache d'embeddings s'ils sont activés.
+    """
+    if EMBED_BACKEND == "ollama":
+        embed_model = OllamaEmbedding(model_name="bge-m3", base_url=OLLAMA_HOST)
+        # OllamaEmbedding passe les mêmes options à ses clients synchrone et asynchrone :
+        # chacun reçoit ici son transport (les embeddings de questions peuvent être couverts)
+        transport, async_transport = upstream_transports(
+            "ollama", EMBED_DEADLINE, hedge_after=EMBED_HEDGE_AFTER, hedge_paths=("/api/embed", "/api/embeddings")
+        )
+        embed_model._client = OllamaClient(host=OLLAMA_HOST, transport=transport)
+        embed_model._async_client = OllamaAsyncClient(host=OLLAMA_HOST, transport=async_transport)
+    elif EMBED_BACKEND == "fake":
+        embed_model = FakeEmbedding(model_name="fake-embedding")
+    else:
+        raise ValueError(f"RAG_EMBED_BACKEND inconnu : {EMBED_BACKEND} (attendu : ollama ou fake)")
+    if EMBED_BATCH_WINDOW > 0:
+        # Sous le cache : seules les questions absentes du cache attendent la fenêtre
+        embed_model = MicroBatchEmbedding(embed_model, window=EMBED_BATCH_WINDOW, max_batch=EMBED_BATCH_MAX)
+    if EMBED_CACHE_ENABLED:
+        # Cache partagé par l'indexation, le retriever et l'évaluateur
+        cache = EmbeddingCacheStore(EMBED_CACHE_PATH, max_memory_items=EMBED_CACHE_MEMORY_ITEMS)
+        embed_model = CachedEmbedding(embed_model, cache)
+    return embed_model
+
+def create_llm():
+    """LLM selon RAG_LLM_BACKEND (groq ou fake)."""
+    if LLM_BACKEND == "groq":
+        # Tentatives et délais gérés par le transport (pas de nouvelles tentatives du SDK en plus)
+        transport, async_transport = upstream_transports("groq", LLM_DEADLINE)
+        return Groq(
+            model="llama-3.3-70b-versatile", api_key=GROQ_API_KEY, api_base=GROQ_API_BASE,
+            max_retries=0, timeout=LLM_DEADLINE,
+            http_client=httpx.Client(transport=transport),
+            async_http_client=httpx.AsyncClient(transport=async_transport)
+        )
+    if LLM_BACKEND == "fake":
+        return FakeLLM(latency=FAKE_LLM_LATENCY, token_delay=FAKE_LLM_TOKEN_DELAY)
+    raise ValueError(f"RAG_LLM_BACKEND inconnu : {LLM_BACKEND} (attendu : groq ou fake)")
 
 class RAGModel:
-    def __init__(self):
+    def __init__(self, startup_state=None):
         self.embed_model = None
+        self.index = None
+        self.retriever = None
         self.query_engine = None
+        self.stream_query_engine = None
         self.evaluator = None
+        self.response_cache = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                max_items=RESPONSE_CACHE_MAX_ITEMS,
+                ttl=RESPONSE_CACHE_TTL,
+                threshold=RESPONSE_CACHE_THRESHOLD
+            )
+        self._refresh_lock = threading.Lock()
+        # Incrémentée à chaque mise à jour de l'index (clé du regroupement des requêtes identiques)
+        self.index_version = 0
+        self.startup_state = startup_state or StartupState()
         self.initialize()
 
     def load_scraped_data(self, json_file=None):
@@ -25,14 +114,12 @@ class RAGModel:
         Charge les données scrapées depuis le fichier JSON.
         """
         if json_file is None:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            json_file = os.path.join(script_dir, 'data/scraped_data.json')
+            json_file = SCRAPED_DATA_FILE
         if not os.path.exists(json_file):
             print(f"Fichier {json_file} non trouvé.")
             return []
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data
+        # JSON (liste) ou JSONL append-only du scraper
+        return load_corpus(json_file)
 
     def create_documents(self, data):
         """
@@ -41,6 +128,7 @@ class RAGModel:
         documents = []
         for item in data:
             doc = Document(
+                id_=document_id(item['url']),
                 text=item['content'],
                 metadata={
                     'url': item['url'],
@@ -50,50 +138,266 @@ class RAGModel:
             documents.append(doc)
         return documents
 
+    def load_documents(self):
+        """
+        Lit et parse le corpus. Retourne (documents, empreinte du fichier,
+        Deduplicator ou None), l'empreinte étant calculée avant la lecture
+        pour le manifeste. Les doublons d'URL et de contenu sont écartés ici,
+        les quasi-doublons de chunks pendant la synchronisation.
+        """
+        fingerprint = corpus_fingerprint(SCRAPED_DATA_FILE) if os.path.exists(SCRAPED_DATA_FILE) else None
+        data = self.load_scraped_data()
+        if not data:
+            raise ValueError("Aucun document trouvé. Assurez-vous que scraped_data.json existe.")
+        dedup = None
+        if DEDUP_ENABLED:
+            splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+            dedup = Deduplicator(threshold=DEDUP_THRESHOLD, count_chunks=lambda text: len(splitter.split_text(text)),
+                                 signatures_path=os.path.join(INDEX_DIR, DEDUP_SIGNATURES_FILE))
+            data = dedup.documents(data)
+        documents = self.create_documents(data)
+        print(f"✅ {len(documents)} documents chargés !")
+        return documents, fingerprint, dedup
+
     def initialize(self):
         print("Initialisation du modèle RAG...")
 
-        # Vérifier la clé API Groq
-        if not GROQ_API_KEY:
-            raise ValueError("GROQ_API_KEY non trouvée dans les variables d'environnement")
+        with self.startup_state.phase("config"):
+            # Vérifier la clé API Groq
+            if LLM_BACKEND == "groq" and not GROQ_API_KEY:
+                raise ValueError("GROQ_API_KEY non trouvée dans les variables d'environnement")
 
-        # Configurer les modèles LlamaIndex
-        self.embed_model = OllamaEmbedding(model_name="bge-m3")
-        Settings.embed_model = self.embed_model
-        Settings.chunk_size = 512
-        Settings.chunk_overlap = 20
-        Settings.llm = Groq(model="llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
-        print("✅ Modèles configurés !")
+            # Configurer les modèles LlamaIndex
+            self.embed_model = create_embed_model()
+            Settings.embed_model = self.embed_model
+            Settings.chunk_size = CHUNK_SIZE
+            Settings.chunk_overlap = CHUNK_OVERLAP
+            Settings.llm = create_llm()
+            # Durées du prompt et des appels au LLM, tokens générés (/metrics)
+            install_llm_instrumentation()
+            print("✅ Modèles configurés !")
 
-        # Créer l'évaluateur personnalisé
-        self.evaluator = CustomEvaluator(self.embed_model)
-        print("✅ Évaluateur créé !")
+            # Créer l'évaluateur personnalisé
+            self.evaluator = CustomEvaluator(self.embed_model)
+            print("✅ Évaluateur créé !")
 
-        # Chargement des documents
-        print("📄 Chargement des documents...")
-        data = self.load_scraped_data()
-        if not data:
-            raise ValueError("Aucun document trouvé. Assurez-vous que scraped_data.json existe.")
+        with self.startup_state.phase("index"):
+            # Création ou chargement de l'index persistant
+            print("🔍 Création/Chargement de l'index...")
+            state, reason = "missing", "index absent"
+            if os.path.exists(INDEX_DIR):
+                # Le manifeste évite de relire le corpus quand l'index est à jour
+                state, reason = check_manifest(INDEX_DIR, SCRAPED_DATA_FILE, self.embed_model.model_name)
 
-        documents = self.create_documents(data)
-        print(f"✅ {len(documents)} documents chargés !")
+            if state in ("fresh", "stale", "unverified"):
+                # Les vecteurs sont mappés en mémoire au lieu d'être parsés depuis le JSON
+                vector_store = load_vector_store(INDEX_DIR, dtype=VECTOR_DTYPE)
+                storage_context = self.storage_context(vector_store)
+                if state == "unverified":
+                    state, reason = self.verify_embeddings(vector_store, storage_context.docstore)
+                    if state == "incompatible":
+                        # La base SQLite ouverte est recréée vide par la reconstruction
+                        close = getattr(storage_context.docstore, "close", None)
+                        if close is not None:
+                            close()
+
+            if state in ("fresh", "stale"):
+                self.index = load_index_from_storage(storage_context)
+                print("✅ Index chargé depuis le disque !")
+                if state == "fresh":
+                    print("✅ Index à jour (manifeste), corpus non relu")
+                elif SYNC_ON_STARTUP:
+                    print(f"📄 Synchronisation de l'index ({reason})...")
+                    self.sync_documents(*self.load_documents())
+            else:
+                # Index absent, ou construit avec un autre modèle / découpage : tout ré-embedder
+                # (pour un gros corpus, préférer la construction hors ligne : python build_index.py)
+                print(f"📄 Construction de l'index ({reason})...")
+                storage_context = self.storage_context(MmapVectorStore(dtype=VECTOR_DTYPE), fresh=True)
+                self.index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+                self.sync_documents(*self.load_documents())
+                print("✅ Index créé et sauvegardé !")
+
+        with self.startup_state.phase("query_engine"):
+            self.build_query_engine()
+            print("✅ Query engine prêt !")
+
+    def verify_embeddings(self, vector_store, docstore):
+        """
+        Index sans manifeste : le modèle qui a produit ses vecteurs est inconnu.
+        Un chunk de l'index est ré-embeddé avec le modèle courant et comparé au
+        vecteur stocké ; une dimension ou une direction différente impose une
+        reconstruction complète plutôt qu'une synchronisation qui mélangerait
+        des vecteurs de deux modèles. Retourne (état, raison).
+        """
+        if len(vector_store) == 0:
+            return "stale", "manifeste absent (index vide)"
+        node_id = vector_store.node_id(0)
+        node = docstore.get_node(node_id, raise_error=False)
+        if node is None:
+            return "incompatible", "manifeste absent et docstore incohérent avec les vecteurs"
+        stored = np.asarray(vector_store.get(node_id), dtype=np.float32)
+        current = np.asarray(
+            self.embed_model.get_text_embedding(node.get_content(metadata_mode=MetadataMode.EMBED)), dtype=np.float32
+        )
+        if current.shape != stored.shape:
+            return "incompatible", f"dimension des embeddings différente ({stored.shape[0]} → {current.shape[0]})"
+        similarity = float(np.dot(stored, current) / (np.linalg.norm(stored) * np.linalg.norm(current) or 1.0))
+        if similarity < 0.99:
+            return "incompatible", f"vecteurs produits par un autre modèle d'embedding (similarité {similarity:.2f})"
+        return "stale", "manifeste absent, modèle d'embedding vérifié"
+
+    def storage_context(self, vector_store, fresh=False):
+        """
+        StorageContext de l'index persistant. Avec RAG_DOCSTORE=sqlite, le
+        docstore et l'index store sont lus à la demande depuis docstore.sqlite
+        (convertie depuis les fichiers JSON au premier chargement) ; `fresh`
+        repart d'une base vide pour une reconstruction complète.
+        """
+        if DOCSTORE_BACKEND == "sqlite":
+            docstore, index_store = open_stores(INDEX_DIR, cache_items=DOCSTORE_CACHE_ITEMS, fresh=fresh)
+            return StorageContext.from_defaults(docstore=docstore, index_store=index_store, vector_store=vector_store)
+        if DOCSTORE_BACKEND != "json":
+            raise ValueError(f"RAG_DOCSTORE inconnu : {DOCSTORE_BACKEND} (attendu : sqlite ou json)")
+        # La base SQLite est la version à jour du docstore : elle est réexportée en JSON
+        # (puis gardée en docstore.sqlite.bak), jamais supprimée
+        sqlite_path = os.path.join(INDEX_DIR, DOCSTORE_FILE)
+        if os.path.exists(sqlite_path) and not fresh:
+            print("🔄 Export du docstore SQLite vers JSON...")
+            count = export_json_stores(INDEX_DIR, cache_items=DOCSTORE_CACHE_ITEMS)
+            print(f"✅ {count} entrées exportées (base conservée dans {sqlite_path}.bak)")
+        elif os.path.exists(sqlite_path):
+            # Reconstruction complète : l'ancienne base est mise de côté
+            set_aside_stores(INDEX_DIR)
+        if fresh:
+            return StorageContext.from_defaults(vector_store=vector_store)
+        return StorageContext.from_defaults(persist_dir=INDEX_DIR, vector_store=vector_store)
+
+    def sync_documents(self, documents, fingerprint=None, dedup=None):
+        """
+        Synchronise l'index avec les documents : seuls les documents nouveaux
+        ou modifiés sont chunkés et embeddés, les URLs disparues sont supprimées.
+        Le manifeste est mis à jour avec l'empreinte du corpus synchronisé, et
+        le rapport de déduplication écrit dans dedup_report.json.
+        """
+        report = sync_index(self.index, documents, dedup)
+        if report.changed or not os.path.exists(INDEX_DIR):
+            self.index.storage_context.persist(persist_dir=INDEX_DIR)
+        if fingerprint is not None:
+            write_manifest(INDEX_DIR, build_manifest(self.embed_model.model_name, fingerprint))
+        if dedup is not None:
+            dedup.report.save(os.path.join(INDEX_DIR, DEDUP_REPORT_FILE))
+            print(f"🧹 Déduplication : {dedup.report.describe()}")
+        stats = report.to_dict()
+        print(
+            f"✅ Index synchronisé : {stats['added']} ajoutés, {stats['updated']} modifiés, "
+            f"{stats['removed']} supprimés, {stats['unchanged']} inchangés, {stats['skipped']} ignorés "
+            f"({stats['embedded_chunks']} chunks embeddés)"
+        )
+        return report
+
+    def refresh_index(self):
+        """
+        Relit le corpus scrapé et met à jour l'index à la demande.
+        """
+        with self._refresh_lock:
+            report = self.sync_documents(*self.load_documents())
+            if report.changed:
+                self.build_query_engine()
+                self.index_version += 1
+                # Les réponses en cache ont pu être générées sur des documents modifiés
+                if self.response_cache is not None:
+                    self.response_cache.clear()
+            return report
+
+    def cache_stats(self):
+        """Compteurs des caches d'embeddings et de réponses (None si désactivés)."""
+        embeddings = None
+        if isinstance(self.embed_model, CachedEmbedding):
+            embeddings = self.embed_model.cache.stats()
+        responses = self.response_cache.stats() if self.response_cache is not None else None
+        return {"embeddings": embeddings, "responses": responses}
+
+    async def aembed_questions(self, questions):
+        """
+        Embeddings de plusieurs questions en un seul appel batché. Sans
+        instruction de requête, une question s'embedde comme un texte ;
+        sinon chaque question passe par aget_query_embedding.
+        """
+        inner = self.embed_model.inner if isinstance(self.embed_model, CachedEmbedding) else self.embed_model
+        with span("embed"):
+            if getattr(inner, "query_instruction", None):
+                return list(await asyncio.gather(*(self.embed_model.aget_query_embedding(q) for q in questions)))
+            return await self.embed_model.aget_text_embedding_batch(questions)
+
+    async def aevaluate_answer(self, question_embedding, answer, sources):
+        """
+        Évalue une réponse sans nouvelle recherche : l'embedding de la question
+        vient du retriever et ceux des chunks retrouvés sont relus dans la
+        matrice de l'index. Seule la réponse générée est embeddée.
+        """
+        with span("evaluate"):
+            contexts = []
+            for source in sources:
+                try:
+                    contexts.append(self.index.vector_store.get(source["node_id"]))
+                except KeyError:
+                    contexts.append(None)
+            # Chunk supprimé de l'index depuis la mise en cache de la réponse : embeddé à nouveau
+            missing = [i for i, vector in enumerate(contexts) if vector is None]
+            texts = [answer] + [sources[i]["text"] for i in missing]
+            embeddings = await self.embed_model.aget_text_embedding_batch(texts)
+            for i, embedding in zip(missing, embeddings[1:]):
+                contexts[i] = embedding
+            return self.evaluator.score_embeddings(question_embedding, embeddings[0], contexts)
 
-        # Création ou chargement de l'index persistant
-        print("🔍 Création/Chargement de l'index...")
-        index_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/vector_index')
-        if os.path.exists(index_dir):
-            from llama_index.core import StorageContext, load_index_from_storage
-            storage_context = StorageContext.from_defaults(persist_dir=index_dir)
-            index = load_index_from_storage(storage_context)
-            print("✅ Index chargé depuis le disque !")
-        else:
-            index = VectorStoreIndex.from_documents(documents)
-            index.storage_context.persist(persist_dir=index_dir)
-            print("✅ Index créé et sauvegardé !")
-
-        # Créer le query engine
-        self.query_engine = index.as_query_engine(similarity_top_k=3)
-        print("✅ Query engine prêt !")
+    def build_query_engine(self):
+        """Construit le retriever NumPy (et l'index IVF ou les codes optionnels) puis le query engine."""
+        # Index approximatif optionnel (RAG_INDEX_MODE=ivf), persisté à côté de l'index
+        ann_index = None
+        quantized_index = None
+        if INDEX_MODE == "ivf":
+            # Store vide : pas d'index IVF, le retriever fait une recherche exacte
+            if len(self.index.vector_store):
+                ann_index = load_or_build_ivf(self.index.vector_store, INDEX_DIR, nlist=IVF_NLIST or None)
+                print(f"✅ Index IVF prêt ({ann_index.nlist} listes, nprobe={IVF_NPROBE}) !")
+        elif INDEX_MODE in QUANTIZATION_KINDS:
+            # Codes compressés (RAG_INDEX_MODE=int8 ou pq), persistés à côté de l'index
+            if len(self.index.vector_store):
+                quantized_index = load_or_build_quantized(
+                    self.index.vector_store, INDEX_DIR, INDEX_MODE, pca_dim=QUANT_PCA_DIM, subspaces=PQ_SUBSPACES
+                )
+                print(f"✅ Codes {INDEX_MODE} prêts ({quantized_index.nbytes / 1024:.0f} Ko, "
+                      f"rescoring de top_k × {QUANT_RESCORE}) !")
+        elif INDEX_MODE != "exact":
+            raise ValueError(f"RAG_INDEX_MODE inconnu : {INDEX_MODE} (attendu : exact, ivf, int8 ou pq)")
+
+        # Index lexical BM25 (RAG_RETRIEVAL_MODE=hybrid), persisté à côté de l'index
+        lexical_index = None
+        if RETRIEVAL_MODE == "hybrid":
+            if len(self.index.vector_store):
+                lexical_index = load_or_build_bm25(self.index.vector_store, self.index.docstore, INDEX_DIR)
+                print(f"✅ Index BM25 prêt ({lexical_index.terms.size} termes) !")
+        elif RETRIEVAL_MODE != "vector":
+            raise ValueError(f"RAG_RETRIEVAL_MODE inconnu : {RETRIEVAL_MODE} (attendu : hybrid ou vector)")
+
+        # Créer le query engine sur le retriever NumPy (top-k vectorisé)
+        self.retriever = NumpyRetriever(
+            self.index.vector_store,
+            self.index.docstore,
+            self.embed_model,
+            similarity_top_k=3,
+            ann_index=ann_index,
+            nprobe=IVF_NPROBE,
+            quantized_index=quantized_index,
+            rescore=QUANT_RESCORE,
+            lexical_index=lexical_index,
+            candidates=HYBRID_CANDIDATES,
+            fusion_k=RRF_K
+        )
+        self.query_engine = RetrieverQueryEngine.from_args(self.retriever)
+        # Variante en streaming pour /query/stream (tokens envoyés au fil de la génération)
+        self.stream_query_engine = RetrieverQueryEngine.from_args(self.retriever, streaming=True)
 
 class CustomEvaluator:
     """
@@ -110,28 +414,73 @@ class CustomEvaluator:
         except Exception as e:
             print(f"Erreur lors de l'embedding : {e}")
             return None
-    
+
+    def get_embeddings(self, texts):
+        """
+        Embeddings de plusieurs textes en un seul appel batché (textes dédoublonnés).
+        Retourne ({texte: ligne}, matrice normalisée) ou (None, None) en cas d'erreur.
+        """
+        unique = list(dict.fromkeys(texts))
+        try:
+            embeddings = self.embed_model.get_text_embedding_batch(unique)
+        except Exception as e:
+            print(f"Erreur lors de l'embedding : {e}")
+            return None, None
+        matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        return {text: row for row, text in enumerate(unique)}, matrix
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def _mean_similarity(similarities):
+        # Similarité cosinus ramenée entre 0 et 1, moyennée
+        if similarities.size == 0:
+            return 0.0
+        return float(np.mean((similarities + 1) / 2))
+
+    def _scores(self, question, answer, contexts):
+        """
+        Calcule les trois scores avec un seul appel d'embedding et un seul
+        produit matriciel (question et réponse contre tous les textes).
+        """
+        rows, matrix = self.get_embeddings([question, answer] + list(contexts))
+        if rows is None:
+            return {"answer_relevancy": 0.0, "context_precision": 0.0, "context_recall": 0.0}
+
+        q_row, a_row = rows[question], rows[answer]
+        similarities = matrix[[q_row, a_row]] @ matrix.T
+        context_rows = [rows[context] for context in contexts]
+        return {
+            "answer_relevancy": self._mean_similarity(similarities[0, [a_row]]),
+            "context_precision": self._mean_similarity(similarities[0, context_rows]),
+            "context_recall": self._mean_similarity(similarities[1, context_rows]),
+        }
+
+    def score_embeddings(self, question_embedding, answer_embedding, context_embeddings):
+        """
+        Calcule les trois scores à partir d'embeddings déjà connus
+        (aucun appel au modèle d'embedding).
+        """
+        matrix = self._normalize(np.asarray(
+            [question_embedding, answer_embedding] + list(context_embeddings), dtype=np.float32
+        ))
+        similarities = matrix[:2] @ matrix.T
+        return {
+            "answer_relevancy": self._mean_similarity(similarities[0, [1]]),
+            "context_precision": self._mean_similarity(similarities[0, 2:]),
+            "context_recall": self._mean_similarity(similarities[1, 2:]),
+        }
+
     def answer_relevancy(self, question, answer):
         """
         Mesure la pertinence de la réponse par rapport à la question.
         Score entre 0 et 1 (plus proche de 1 = plus pertinent).
         """
         try:
-            q_embedding = self.get_embedding(question)
-            a_embedding = self.get_embedding(answer)
-            
-            if q_embedding is None or a_embedding is None:
-                return 0.0
-            
-            # Calcul de similarité cosinus
-            similarity = cosine_similarity(
-                [q_embedding],
-                [a_embedding]
-            )[0][0]
-            
-            # Normaliser entre 0 et 1
-            score = (similarity + 1) / 2
-            return float(score)
+            return self._scores(question, answer, [])["answer_relevancy"]
         except Exception as e:
             print(f"Erreur dans answer_relevancy : {e}")
             return 0.0
@@ -145,25 +494,11 @@ class CustomEvaluator:
         try:
             if not contexts:
                 return 0.0
-            
-            q_embedding = self.get_embedding(question)
-            if q_embedding is None:
+            rows, matrix = self.get_embeddings([question] + list(contexts))
+            if rows is None:
                 return 0.0
-            
-            scores = []
-            for context in contexts:
-                c_embedding = self.get_embedding(context)
-                if c_embedding is not None:
-                    similarity = cosine_similarity(
-                        [q_embedding],
-                        [c_embedding]
-                    )[0][0]
-                    scores.append((similarity + 1) / 2)
-            
-            # Retourner la moyenne des scores
-            if scores:
-                return float(np.mean(scores))
-            return 0.0
+            similarities = matrix[[rows[context] for context in contexts]] @ matrix[rows[question]]
+            return self._mean_similarity(similarities)
         except Exception as e:
             print(f"Erreur dans context_precision : {e}")
             return 0.0
@@ -177,25 +512,11 @@ class CustomEvaluator:
         try:
             if not contexts:
                 return 0.0
-            
-            a_embedding = self.get_embedding(answer)
-            if a_embedding is None:
+            rows, matrix = self.get_embeddings([answer] + list(contexts))
+            if rows is None:
                 return 0.0
-            
-            scores = []
-            for context in contexts:
-                c_embedding = self.get_embedding(context)
-                if c_embedding is not None:
-                    similarity = cosine_similarity(
-                        [a_embedding],
-                        [c_embedding]
-                    )[0][0]
-                    scores.append((similarity + 1) / 2)
-            
-            # Retourner la moyenne des scores
-            if scores:
-                return float(np.mean(scores))
-            return 0.0
+            similarities = matrix[[rows[context] for context in contexts]] @ matrix[rows[answer]]
+            return self._mean_similarity(similarities)
         except Exception as e:
             print(f"Erreur dans context_recall : {e}")
             return 0.0
@@ -204,9 +525,10 @@ class CustomEvaluator:
         """
         Effectue une évaluation complète.
         Retourne un dictionnaire avec tous les scores.
+        Question, réponse et contextes sont embeddés en un seul appel batché.
         """
-        return {
-            "answer_relevancy": self.answer_relevancy(question, answer),
-            "context_precision": self.context_precision(question, contexts),
-            "context_recall": self.context_recall(answer, contexts)
-        }
\ No newline at end of file
+        try:
+            return self._scores(question, answer, contexts or [])
+        except Exception as e:
+            print(f"Erreur dans evaluate : {e}")
+            return {"answer_relevancy": 0.0, "context_precision": 0.0, "context_recall": 0.0}
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Serveur de production multi-workers avec index partagé en lecture seule.
+
+Le processus maître charge le modèle RAG une seule fois (docstore, vecteurs
+mappés en mémoire, clients), ouvre le socket d'écoute, puis forke N workers
+uvicorn qui héritent de ces objets en copie sur écriture : ajouter un worker
+augmente le débit sans recharger ni dupliquer l'index. Le maître relance les
+workers qui s'arrêtent et affiche périodiquement la mémoire de chacun
+(RSS, et PSS qui répartit les pages partagées entre les processus).
+
+Les workers partagent docstore.sqlite mais ont chacun leur vector store :
+ils refusent /index/refresh (409). Sur SIGHUP, le maître met l'index à jour
+lui-même, puis remplace les workers un par un (le nouveau démarre avant
+l'arrêt de l'ancien, qui termine ses requêtes en cours).
+
+Sans fork (Windows), les workers sont lancés par `uvicorn --workers` : chacun
+charge son modèle, mais la matrice des vecteurs reste partagée via le page
+cache (np.load en mmap).
+
+Usage (depuis Backend/) :
+    python prefork.py --workers 4 --port 8000
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+
+def memory_usage(pid):
+    """(RSS, PSS) en Mo lus dans /proc (Linux), ou None si indisponible."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        return None
+    return values.get("Rss"), values.get("Pss")
+
+
+def report_memory(workers):
+    """Affiche la mémoire du maître et de chaque worker."""
+    rows = [("maître", os.getpid())] + [(f"worker {slot}", pid) for slot, pid in sorted(workers.items())]
+    print(f"{'processus':>10} | {'pid':>7} | {'RSS (Mo)':>9} | {'PSS (Mo)':>9}")
+    total_pss = 0.0
+    for name, pid in rows:
+        usage = memory_usage(pid)
+        if usage is None:
+            print(f"{name:>10} | {pid:>7} | {'n/a':>9} | {'n/a':>9}")
+            continue
+        rss, pss = usage
+        total_pss += pss or 0.0
+        print(f"{name:>10} | {pid:>7} | {rss:>9.1f} | {pss:>9.1f}")
+    print(f"{'total':>10} | {'':>7} | {'':>9} | {total_pss:>9.1f}")
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, log_level):
+    """Corps d'un worker forké : un serveur uvicorn sur le socket partagé."""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, lifespan="on", log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(app, sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock, log_level)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def reload_workers(crud, app, sock, log_level, children, retiring):
+    """Met l'index à jour dans le maître, puis remplace chaque worker par un fork du nouvel état."""
+    print("🔄 Mise à jour de l'index dans le processus maître...")
+    gc.unfreeze()
+    try:
+        report = crud.refresh_index()
+    except Exception as e:
+        print(f"❌ Échec de la mise à jour de l'index : {e}")
+        return
+    finally:
+        gc.collect()
+        gc.freeze()
+    print(f"✅ Index à jour ({report['added']} ajoutés, {report['updated']} modifiés, "
+          f"{report['removed']} supprimés), relance des workers...")
+    for slot, old in list(children.items()):
+        children[slot] = spawn_worker(app, sock, log_level)
+        retiring.add(old)
+        try:
+            os.kill(old, signal.SIGTERM)
+        except ProcessLookupError:
+            retiring.discard(old)
+
+
+def run_prefork(host, port, workers, report_interval, log_level):
+    # Imports de l'application dans le maître : hérités par tous les workers
+    import crud
+    import main
+
+    print(f"🔧 Chargement du modèle RAG dans le processus maître (pid {os.getpid()})...")
+    crud.prefork_master = os.getpid()
+    crud.init_rag_model()
+    # Les objets chargés ne seront plus parcourus par le GC : moins de pages copiées après le fork
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(host, port)
+    children = {}
+    retiring = set()
+    stopping = False
+    reload_requested = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def request_reload(signum, frame):
+        nonlocal reload_requested
+        reload_requested = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, request_reload)
+
+    for slot in range(workers):
+        children[slot] = spawn_worker(main.app, sock, log_level)
+    print(f"✅ {workers} workers à l'écoute sur http://{host}:{port}")
+
+    next_report = time.monotonic() + 5
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            if pid in retiring:
+                retiring.discard(pid)
+                continue
+            slot = next((s for s, p in children.items() if p == pid), None)
+            if slot is not None:
+                del children[slot]
+                if not stopping:
+                    print(f"⚠️ Worker {slot} (pid {pid}) arrêté, relance...")
+                    children[slot] = spawn_worker(main.app, sock, log_level)
+            continue
+        if reload_requested and not stopping:
+            reload_requested = False
+            reload_workers(crud, main.app, sock, log_level, children, retiring)
+            continue
+        if report_interval > 0 and not stopping and time.monotonic() >= next_report:
+            report_memory(children)
+            next_report = time.monotonic() + report_interval
+        time.sleep(0.2)
+    sock.close()
+    print("👋 Serveur arrêté")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--report-interval", type=float, default=60,
+                        help="Secondes entre deux rapports mémoire (0 = désactivé)")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    if hasattr(os, "fork"):
+        run_prefork(args.host, args.port, args.workers, args.report_interval, args.log_level)
+    else:
+        print("ℹ️ fork indisponible : un modèle par worker, vecteurs partagés via mmap")
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,69 @@
+"""
+Profileur par échantillonnage, activable pour une requête (en-tête X-Profile).
+
+Un thread relève la pile de chaque thread du processus toutes les
+`interval` secondes (sys._current_frames) et compte les piles identiques.
+Le résultat est écrit au format « piles repliées » (une pile par ligne,
+frames séparées par `;`, suivie du nombre d'échantillons), lisible par
+flamegraph.pl ou speedscope.
+
+Les autres requêtes traitées en même temps apparaissent aussi dans le
+profil : l'échantillonnage voit tout le processus.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _frames(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return stack[::-1]
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                name = names.get(thread_id)
+                if name is None:
+                    # Thread apparu depuis le dernier relevé : table id → nom reconstruite
+                    names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                    name = names.setdefault(thread_id, str(thread_id))
+                self.samples[";".join([name] + self._frames(frame))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rag-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def save(self, directory, name):
+        """Écrit le profil dans `directory` et retourne son chemin."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:6]}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        return path
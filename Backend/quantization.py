@@ -0,0 +1,330 @@
+"""
+Codes compressés des vecteurs (int8 / quantification produit) avec rescoring exact.
+
+Les embeddings bge-m3 (1024 dimensions, 4 Ko par vecteur en float32) font
+de la matrice le premier poste mémoire dès que le corpus grossit. Ici, la
+recherche parcourt des codes compacts gardés en mémoire, puis rescore
+exactement les `top_k × rescore` meilleurs candidats sur la matrice pleine
+précision du MmapVectorStore, qui reste sur disque (mappée : seules les
+lignes des candidats sont lues).
+
+Deux quantificateurs, précédés d'une réduction de dimension PCA optionnelle :
+- "int8" : quantification scalaire par dimension (min/max → 256 niveaux),
+  4 fois plus compact que float32 ;
+- "pq"   : quantification produit, le vecteur est découpé en `m`
+  sous-vecteurs codés chacun par le centroïde le plus proche (1 octet) ;
+  le score d'une requête est une somme de `m` lectures dans une table
+  (distance asymétrique).
+
+Fichiers écrits à côté du vector store (namespace "default") :
+    default__quant_codes.npy     codes (N, d) int8 ou (N, m) uint8
+    default__quant_<param>.npy   paramètres : moyenne / composantes PCA, bornes int8, codebooks PQ
+    default__quant.json          en-tête : type, dimensions, empreinte des node ids
+"""
+import json
+import os
+
+import numpy as np
+
+from ann import node_ids_fingerprint
+from vector_store import DEFAULT_NAMESPACE, normalize_rows, top_k_indices
+
+QUANTIZATION_KINDS = ("int8", "pq")
+# Paramètres possibles (ceux d'un autre type de quantification sont supprimés à l'écriture)
+_PARAM_NAMES = ("mean", "components", "low", "step", "codebooks")
+
+# Lignes encodées par bloc (borne la mémoire des conversions en float32)
+_BLOCK_ROWS = 4096
+# Lignes int8 scorées par bloc : la conversion en float32 d'un bloc reste dans le cache du CPU
+_SCORE_BLOCK_ROWS = 256
+# Lignes tirées pour apprendre la PCA et les codebooks
+_TRAIN_SAMPLES = 65536
+
+
+def _quant_paths(persist_dir, namespace=DEFAULT_NAMESPACE):
+    prefix = os.path.join(persist_dir, f"{namespace}__quant")
+    return {"prefix": prefix, "codes": prefix + "_codes.npy", "header": prefix + ".json"}
+
+
+def _training_sample(matrix, seed):
+    rng = np.random.default_rng(seed)
+    count = matrix.shape[0]
+    if count <= _TRAIN_SAMPLES:
+        return np.asarray(matrix, dtype=np.float32)
+    rows = np.sort(rng.choice(count, size=_TRAIN_SAMPLES, replace=False))
+    return np.asarray(matrix[rows], dtype=np.float32)
+
+
+def fit_pca(sample, dim):
+    """Moyenne (D,) et composantes principales (D, dim) de l'échantillon."""
+    mean = sample.mean(axis=0)
+    # SVD de la matrice centrée : les vecteurs singuliers droits sont les axes principaux
+    _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    components = vt[:dim].T.astype(np.float32)
+    if components.shape[1] < dim:
+        raise ValueError(f"PCA à {dim} dimensions impossible avec {sample.shape[0]} vecteurs d'entraînement")
+    return mean.astype(np.float32), components
+
+
+def kmeans(data, n_clusters, n_iter=15, seed=0):
+    """k-means euclidien ; retourne les centroïdes (n_clusters, D)."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(data.shape[0], size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = nearest_centroids(data, centroids)
+        # Sommes par cluster, colonne par colonne (bien plus rapide que np.add.at)
+        sums = np.stack([
+            np.bincount(labels, weights=data[:, d], minlength=n_clusters) for d in range(data.shape[1])
+        ], axis=1)
+        sizes = np.bincount(labels, minlength=n_clusters)
+        empty = sizes == 0
+        centroids[~empty] = (sums[~empty] / sizes[~empty, None]).astype(np.float32)
+        if empty.any():
+            # Centroïdes vides : réensemencés avec des points tirés au hasard
+            centroids[empty] = data[rng.choice(data.shape[0], size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+def nearest_centroids(data, centroids):
+    """Centroïde le plus proche (distance euclidienne) de chaque ligne."""
+    # argmin ||x - c||² = argmax (x·c - ||c||²/2)
+    half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(data.shape[0], dtype=np.int64)
+    for start in range(0, data.shape[0], _BLOCK_ROWS):
+        block = data[start:start + _BLOCK_ROWS]
+        labels[start:start + block.shape[0]] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return labels
+
+
+def default_subspaces(dim):
+    """Nombre de sous-vecteurs PQ par défaut : ~8 dimensions par octet de code."""
+    target = max(1, dim // 8)
+    return max(m for m in range(1, target + 1) if dim % m == 0)
+
+
+class QuantizedIndex:
+    """
+    Codes compressés des lignes du store et paramètres pour les décoder.
+    `params` contient `mean` / `components` si la PCA est active, puis
+    `low` / `step` (int8) ou `codebooks` (pq, forme (m, ksub, d / m)).
+    """
+    def __init__(self, kind, codes, params, fingerprint=None):
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Quantification inconnue : {kind} (attendu : {', '.join(QUANTIZATION_KINDS)})")
+        self.kind = kind
+        self.codes = codes
+        self.params = params
+        self.fingerprint = fingerprint
+        # Instantané du store couvert par les codes (voir MmapVectorStore.snapshot)
+        self.snapshot = None
+
+    @property
+    def pca_dim(self):
+        components = self.params.get("components")
+        return 0 if components is None else components.shape[1]
+
+    @property
+    def subspaces(self):
+        return self.codes.shape[1] if self.kind == "pq" else 0
+
+    @property
+    def nbytes(self):
+        """Mémoire des codes et des paramètres (octets)."""
+        return self.codes.nbytes + sum(array.nbytes for array in self.params.values())
+
+    @classmethod
+    def build(cls, vector_store, kind="int8", pca_dim=0, subspaces=0, seed=0):
+        """Apprend la PCA et le quantificateur sur un échantillon, puis encode toute la matrice."""
+        matrix = vector_store.matrix
+        if matrix is None or matrix.shape[0] == 0:
+            raise ValueError("Impossible de quantifier un store vide")
+        sample = _training_sample(matrix, seed)
+        params = {}
+        if pca_dim:
+            params["mean"], params["components"] = fit_pca(sample, pca_dim)
+        index = cls(kind, None, params, node_ids_fingerprint(vector_store.node_ids))
+        sample = index.project(sample)
+
+        if kind == "int8":
+            low, high = sample.min(axis=0), sample.max(axis=0)
+            params["low"] = low
+            params["step"] = np.maximum(high - low, 1e-12).astype(np.float32) / 255
+        else:
+            dim = sample.shape[1]
+            subspaces = subspaces or default_subspaces(dim)
+            if dim % subspaces:
+                raise ValueError(f"La dimension {dim} n'est pas divisible en {subspaces} sous-vecteurs")
+            ksub = min(256, sample.shape[0])
+            sub_dim = dim // subspaces
+            params["codebooks"] = np.stack([
+                kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], ksub, seed=seed + j)
+                for j in range(subspaces)
+            ]).astype(np.float32)
+
+        codes = np.concatenate([
+            index.encode(np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32))
+            for start in range(0, matrix.shape[0], _BLOCK_ROWS)
+        ])
+        # PQ : codes rangés par colonne, chaque sous-vecteur est lu d'un seul tenant au scoring
+        index.codes = np.asfortranarray(codes) if kind == "pq" else codes
+        index.snapshot = vector_store.snapshot()
+        return index
+
+    def project(self, vectors):
+        """Vecteurs dans l'espace quantifié (centrés et projetés si la PCA est active)."""
+        if "components" not in self.params:
+            return vectors
+        return (vectors - self.params["mean"]) @ self.params["components"]
+
+    def encode(self, vectors):
+        projected = self.project(vectors)
+        if self.kind == "int8":
+            levels = np.rint((projected - self.params["low"]) / self.params["step"])
+            return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+        codebooks = self.params["codebooks"]
+        sub_dim = codebooks.shape[2]
+        return np.stack([
+            nearest_centroids(projected[:, j * sub_dim:(j + 1) * sub_dim], codebooks[j])
+            for j in range(codebooks.shape[0])
+        ], axis=1).astype(np.uint8)
+
+    def scores(self, query_vector, rows=None):
+        """
+        Scores approchés (produit scalaire) de la requête normalisée avec les
+        lignes codées (toutes, ou `rows`). La constante q·moyenne de la PCA est
+        ajoutée pour que les scores restent comparables aux scores exacts.
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        offset = 0.0
+        if "components" in self.params:
+            offset = float(query_vector @ self.params["mean"])
+            query_vector = query_vector @ self.params["components"]
+
+        if self.kind == "int8":
+            # x ≈ low + step · (code + 128)
+            weights = (query_vector * self.params["step"]).astype(np.float32)
+            offset += float(query_vector @ self.params["low"]) + 128.0 * float(weights.sum())
+            scores = np.empty(codes.shape[0], dtype=np.float32)
+            for start in range(0, codes.shape[0], _SCORE_BLOCK_ROWS):
+                block = codes[start:start + _SCORE_BLOCK_ROWS].astype(np.float32)
+                scores[start:start + block.shape[0]] = block @ weights
+            return scores + offset
+
+        # Table (m, ksub) des produits scalaires sous-requête · centroïdes, puis m lectures par ligne
+        codebooks = self.params["codebooks"]
+        subspaces, ksub, sub_dim = codebooks.shape
+        tables = np.einsum('mkd,md->mk', codebooks, query_vector.reshape(subspaces, sub_dim)).astype(np.float32)
+        scores = np.full(codes.shape[0], offset, dtype=np.float32)
+        for j in range(subspaces):
+            scores += tables[j][codes[:, j]]
+        return scores
+
+    def search(self, vector_store, query_embedding, top_k, rescore, filters=None, snapshot=None):
+        """
+        Top-k en deux temps : les `top_k × rescore` meilleurs candidats selon
+        les codes, rescorés exactement sur la matrice pleine précision.
+        Si le store a été modifié depuis l'encodage, la recherche retombe sur
+        le mode exact en attendant la reconstruction.
+        """
+        snapshot = snapshot or vector_store.snapshot()
+        if snapshot is not self.snapshot:
+            return vector_store.search(query_embedding, top_k, filters=filters, snapshot=snapshot)
+        query_vector = normalize_rows(query_embedding)
+        candidates = vector_store.candidate_rows(filters, None, snapshot)
+        scores = self.scores(query_vector, candidates)
+        top = top_k_indices(scores, top_k * max(1, rescore))
+        rows = top if candidates is None else candidates[top]
+        if rescore <= 0:
+            # Sans rescoring : scores approchés des codes
+            return rows, scores[top]
+        return vector_store.search(query_vector, top_k, rows=rows, snapshot=snapshot)
+
+    def is_stale(self, vector_store):
+        """Vrai si le store a changé depuis l'encodage."""
+        return self.fingerprint != node_ids_fingerprint(vector_store.node_ids)
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+    def save(self, persist_dir, namespace=DEFAULT_NAMESPACE):
+        paths = _quant_paths(persist_dir, namespace)
+        arrays = dict(self.params, codes=self.codes)
+        for name, array in arrays.items():
+            path = f"{paths['prefix']}_{name}.npy"
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        for name in _PARAM_NAMES:
+            path = f"{paths['prefix']}_{name}.npy"
+            if name not in self.params and os.path.exists(path):
+                os.remove(path)
+        tmp_path = paths["header"] + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "kind": self.kind,
+                "count": int(self.codes.shape[0]),
+                "pca_dim": self.pca_dim,
+                "subspaces": self.subspaces,
+                "params": sorted(self.params),
+                "fingerprint": self.fingerprint,
+            }, f)
+        os.replace(tmp_path, paths["header"])
+
+    @staticmethod
+    def exists(persist_dir, namespace=DEFAULT_NAMESPACE):
+        return os.path.exists(_quant_paths(persist_dir, namespace)["header"])
+
+    @classmethod
+    def load(cls, persist_dir, namespace=DEFAULT_NAMESPACE):
+        paths = _quant_paths(persist_dir, namespace)
+        with open(paths["header"], 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        params = {name: np.load(f"{paths['prefix']}_{name}.npy") for name in header["params"]}
+        # Les codes sont lus en mémoire : c'est la structure parcourue à chaque requête
+        return cls(header["kind"], np.load(paths["codes"]), params, header["fingerprint"])
+
+
+def fit_params(count, dim, kind, pca_dim=0, subspaces=0):
+    """
+    Paramètres réalisables pour `count` vecteurs de dimension `dim` : la PCA
+    ne peut pas garder plus d'axes que de vecteurs d'entraînement (ni que la
+    dimension d'origine) et les sous-vecteurs PQ doivent diviser la dimension
+    quantifiée. Les valeurs impossibles sont ramenées au plus proche, avec un
+    avertissement, au lieu d'empêcher le démarrage.
+    """
+    if pca_dim:
+        limit = min(count, _TRAIN_SAMPLES, dim)
+        if pca_dim >= dim:
+            print(f"⚠️ RAG_QUANT_PCA_DIM={pca_dim} ≥ dimension des vecteurs ({dim}) : quantification sans PCA")
+            pca_dim = 0
+        elif pca_dim > limit:
+            print(f"⚠️ RAG_QUANT_PCA_DIM={pca_dim} > nombre de vecteurs ({count}) : PCA ramenée à {limit} dimensions")
+            pca_dim = limit
+    if kind == "pq" and subspaces:
+        quant_dim = pca_dim or dim
+        if subspaces > quant_dim or quant_dim % subspaces:
+            fallback = default_subspaces(quant_dim)
+            print(f"⚠️ RAG_PQ_M={subspaces} ne divise pas la dimension quantifiée ({quant_dim}) : "
+                  f"{fallback} sous-vecteurs")
+            subspaces = fallback
+    return pca_dim, subspaces
+
+
+def load_or_build_quantized(vector_store, persist_dir, kind, pca_dim=0, subspaces=0):
+    """
+    Charge les codes persistés à côté du vector store, ou les (re)construit
+    s'ils sont absents, périmés ou encodés avec d'autres paramètres.
+    """
+    count, dim = vector_store.matrix.shape
+    pca_dim, subspaces = fit_params(count, dim, kind, pca_dim, subspaces)
+    if QuantizedIndex.exists(persist_dir):
+        index = QuantizedIndex.load(persist_dir)
+        if (not index.is_stale(vector_store) and index.kind == kind and index.pca_dim == pca_dim
+                and (kind != "pq" or not subspaces or index.subspaces == subspaces)):
+            index.snapshot = vector_store.snapshot()
+            return index
+    print(f"🔄 Quantification des vecteurs ({kind})...")
+    index = QuantizedIndex.build(vector_store, kind=kind, pca_dim=pca_dim, subspaces=subspaces)
+    index.save(persist_dir)
+    return index
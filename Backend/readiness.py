@@ -0,0 +1,67 @@
+"""
+Suivi de l'initialisation du modèle RAG, exécutée en arrière-plan.
+
+L'API accepte les connexions immédiatement ; /ready expose l'état de chaque
+phase (imports, config, index, query_engine) et sa durée. Tant que le
+modèle n'est pas prêt, les endpoints RAG répondent 503 avec Retry-After.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+PHASES = ("imports", "config", "index", "query_engine")
+
+
+class ModelNotReady(Exception):
+    """Le modèle RAG est encore en cours d'initialisation (ou a échoué)."""
+
+
+class StartupState:
+    """État des phases d'initialisation : pending, running, done ou failed."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "starting"
+        self.error = None
+        self.started_at = time.perf_counter()
+        self.total_ms = None
+        self.phases = {name: {"status": "pending", "duration_ms": None} for name in PHASES}
+
+    @contextmanager
+    def phase(self, name):
+        with self._lock:
+            self.phases[name] = {"status": "running", "duration_ms": None}
+        start = time.perf_counter()
+        status = "failed"
+        try:
+            yield
+            status = "done"
+        finally:
+            with self._lock:
+                self.phases[name] = {
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                }
+
+    def mark_ready(self):
+        with self._lock:
+            self.status = "ready"
+            self.total_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    def mark_failed(self, error):
+        with self._lock:
+            self.status = "failed"
+            self.error = str(error)
+            self.total_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "status": self.status,
+                "error": self.error,
+                "total_ms": self.total_ms,
+                "phases": {name: dict(phase) for name, phase in self.phases.items()},
+            }
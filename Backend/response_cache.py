@@ -0,0 +1,140 @@
+"""
+Cache de réponses devant le query engine.
+
+Deux niveaux de recherche :
+- exact : la question normalisée (casse, accents, ponctuation, espaces) ;
+- sémantique : similarité cosinus entre l'embedding de la question et celui
+  des questions déjà posées, au-dessus d'un seuil configurable.
+
+Les entrées expirent après `ttl` secondes et les moins récemment utilisées
+sont évincées au-delà de `max_items`. Le cache est vidé quand l'index change.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_question(question):
+    """Forme canonique d'une question pour la recherche exacte."""
+    text = unicodedata.normalize('NFKD', question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class CachedResponse:
+    """Réponse mise en cache avec ses sources."""
+    def __init__(self, question, answer, sources, embedding, created_at):
+        self.question = question
+        self.answer = answer
+        self.sources = sources
+        self.embedding = embedding
+        self.created_at = created_at
+
+
+class ResponseCache:
+    """
+    Cache LRU + TTL des réponses, avec recherche exacte puis sémantique.
+    """
+    def __init__(self, max_items=1000, ttl=86400, threshold=0.92):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Matrice des embeddings des questions, reconstruite après modification
+        self._matrix = None
+        self._matrix_keys = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry.created_at > self.ttl
+
+    def _purge_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if self._expired(entry, now)]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self.expirations += len(expired)
+            self._matrix = None
+
+    def _hit(self, key):
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def get_exact(self, question):
+        """Recherche sur la question normalisée (aucun appel d'embedding)."""
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                del self._entries[key]
+                self.expirations += 1
+                self._matrix = None
+                return None
+            self.exact_hits += 1
+            return self._hit(key)
+
+    def get_similar(self, embedding):
+        """
+        Recherche la question la plus proche ; compte un échec si aucune
+        ne dépasse le seuil (à appeler après get_exact).
+        """
+        with self._lock:
+            self._purge_expired(time.time())
+            if self._entries and self.threshold <= 1.0:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries.keys())
+                    self._matrix = np.stack([self._entries[key].embedding for key in self._matrix_keys])
+                query = np.asarray(embedding, dtype=np.float32)
+                scores = self._matrix @ (query / (np.linalg.norm(query) or 1.0))
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.semantic_hits += 1
+                    return self._hit(self._matrix_keys[best])
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, sources, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = CachedResponse(question, answer, sources, embedding, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        """Invalide toutes les réponses (l'index a changé)."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.invalidations += 1
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "items": len(self._entries),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,200 @@
+"""
+Retriever vectorisé NumPy branché derrière RAGModel.query_engine.
+
+Tous les embeddings des nodes sont dans une seule matrice float32 normalisée
+(celle du MmapVectorStore) : une requête coûte un produit matrice-vecteur
+et un argpartition, au lieu d'un scoring node par node en listes Python.
+En mode hybride, les candidats vectoriels sont fusionnés avec ceux de
+l'index BM25 (Reciprocal Rank Fusion) : la fusion décide du classement, le
+score des nodes reste la similarité cosinus. Avec des codes quantifiés, la matrice
+pleine précision ne sert qu'à rescorer les meilleurs candidats.
+"""
+from typing import Optional
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from bm25 import reciprocal_rank_fusion
+from metrics import span
+from vector_store import normalize_rows
+
+
+class FusedNodeWithScore(NodeWithScore):
+    """Node retrouvé par la recherche hybride : `score` cosinus et score RRF de la fusion."""
+    fusion_score: Optional[float] = None
+
+
+class NumpyRetriever(BaseRetriever):
+    """
+    Retriever top-k sur la matrice du MmapVectorStore, avec filtres
+    optionnels sur les métadonnées `url` / `timestamp` (MetadataFilters).
+    Si un index IVF est fourni, seules les `nprobe` listes les plus proches
+    sont scorées (recherche approximative). Si des codes quantifiés sont
+    fournis, ils sont parcourus à la place de la matrice et les
+    `similarity_top_k × rescore` meilleurs candidats sont rescorés
+    exactement. Si un index BM25 est fourni,
+    les `candidates` meilleurs résultats vectoriels et lexicaux sont
+    fusionnés par RRF (classement fusionné ; score du node = similarité
+    cosinus, score RRF dans `fusion_score`).
+    """
+    def __init__(self, vector_store, docstore, embed_model, similarity_top_k=3, filters=None,
+                 ann_index=None, nprobe=8, quantized_index=None, rescore=10,
+                 lexical_index=None, candidates=20, fusion_k=60, **kwargs):
+        self.vector_store = vector_store
+        self.docstore = docstore
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+        self.ann_index = ann_index
+        self.nprobe = nprobe
+        self.quantized_index = quantized_index
+        self.rescore = rescore
+        self.lexical_index = lexical_index
+        self.candidates = candidates
+        self.fusion_k = fusion_k
+        super().__init__(**kwargs)
+
+    def with_filters(self, filters):
+        """Retourne un retriever partageant la même matrice avec d'autres filtres."""
+        return NumpyRetriever(
+            self.vector_store,
+            self.docstore,
+            self.embed_model,
+            similarity_top_k=self.similarity_top_k,
+            filters=filters,
+            ann_index=self.ann_index,
+            nprobe=self.nprobe,
+            quantized_index=self.quantized_index,
+            rescore=self.rescore,
+            lexical_index=self.lexical_index,
+            candidates=self.candidates,
+            fusion_k=self.fusion_k,
+        )
+
+    def search(self, query_embedding, top_k=None, filters=None):
+        """
+        Recherche brute sur la matrice : retourne [(node_id, score), ...].
+        """
+        top_k = top_k or self.similarity_top_k
+        filters = filters if filters is not None else self.filters
+        snapshot = self.vector_store.snapshot()
+        rows, scores = self._search_rows(query_embedding, top_k, filters, snapshot)
+        return [(self.vector_store.node_id(row, snapshot), float(score)) for row, score in zip(rows, scores)]
+
+    def _search_rows(self, query_embedding, top_k, filters, snapshot):
+        if self.quantized_index is not None:
+            return self.quantized_index.search(
+                self.vector_store, query_embedding, top_k, self.rescore, filters=filters, snapshot=snapshot
+            )
+        if self.ann_index is not None:
+            return self.ann_index.search(
+                self.vector_store, query_embedding, top_k, self.nprobe, filters=filters, snapshot=snapshot
+            )
+        return self.vector_store.search(query_embedding, top_k, filters=filters, snapshot=snapshot)
+
+    def lexical_search(self, query_str, top_k=None, filters=None):
+        """Recherche BM25 : retourne [(node_id, score), ...]."""
+        top_k = top_k or self.similarity_top_k
+        filters = filters if filters is not None else self.filters
+        snapshot = self.vector_store.snapshot()
+        with span("lexical"):
+            rows, scores = self.lexical_index.search(
+                self.vector_store, query_str, top_k, filters=filters, snapshot=snapshot
+            )
+        return [(self.vector_store.node_id(row, snapshot), float(score)) for row, score in zip(rows, scores)]
+
+    def _vector_top_k(self):
+        # En mode hybride, davantage de candidats vectoriels alimentent la fusion
+        return self.candidates if self.lexical_index is not None else self.similarity_top_k
+
+    def _fuse(self, query_str, query_embedding, vector_results):
+        """
+        Fusionne les résultats vectoriels avec ceux du BM25 et garde le top-k :
+        [(node_id, similarité cosinus, score RRF ou None), ...].
+        """
+        if self.lexical_index is None or not query_str:
+            return [(node_id, score, None) for node_id, score in vector_results[:self.similarity_top_k]]
+        lexical_results = self.lexical_search(query_str, self.candidates)
+        fused = reciprocal_rank_fusion([vector_results, lexical_results], k=self.fusion_k)
+        # Le score exposé reste comparable d'un mode à l'autre : similarité cosinus,
+        # recalculée pour les nodes trouvés par le seul BM25
+        cosine = dict(vector_results)
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        results = []
+        for node_id, fusion_score in fused[:self.similarity_top_k]:
+            score = cosine.get(node_id)
+            if score is None:
+                try:
+                    score = float(np.dot(self.vector_store.get(node_id), query))
+                except KeyError:
+                    pass
+            results.append((node_id, score, fusion_score))
+        return results
+
+    def search_batch(self, query_embeddings, top_k=None, filters=None):
+        """
+        Recherche de plusieurs requêtes : un seul produit matrice-matrice en
+        mode exact, une recherche par requête avec l'index IVF ou les codes.
+        Retourne une liste de [(node_id, score), ...], une par requête.
+        """
+        top_k = top_k or self.similarity_top_k
+        filters = filters if filters is not None else self.filters
+        snapshot = self.vector_store.snapshot()
+        if self.ann_index is not None or self.quantized_index is not None:
+            batch = [self._search_rows(embedding, top_k, filters, snapshot) for embedding in query_embeddings]
+        else:
+            batch = self.vector_store.search_batch(query_embeddings, top_k, filters=filters, snapshot=snapshot)
+        return [
+            [(self.vector_store.node_id(row, snapshot), float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in batch
+        ]
+
+    def retrieve_batch(self, query_embeddings, query_strs=None):
+        """
+        Nodes retrouvés (NodeWithScore) pour chaque embedding de requête ;
+        les textes des requêtes servent à la recherche BM25 en mode hybride.
+        """
+        query_strs = query_strs or [None] * len(query_embeddings)
+        with span("search"):
+            batch = self.search_batch(query_embeddings, top_k=self._vector_top_k())
+        return [
+            self._to_nodes(self._fuse(query_str, embedding, results))
+            for query_str, embedding, results in zip(query_strs, query_embeddings, batch)
+        ]
+
+    def _to_nodes(self, results, nodes=None):
+        if not results:
+            return []
+        # Un node supprimé du docstore partagé par un autre processus (mise à jour de l'index
+        # pendant la relance des workers) est ignoré au lieu de faire échouer la requête
+        if nodes is None:
+            nodes = self.docstore.get_nodes([result[0] for result in results], raise_error=False)
+        by_id = {node.node_id: node for node in nodes}
+        return [
+            NodeWithScore(node=by_id[node_id], score=score) if fusion_score is None
+            else FusedNodeWithScore(node=by_id[node_id], score=score, fusion_score=fusion_score)
+            for node_id, score, fusion_score in results if node_id in by_id
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle):
+        if query_bundle.embedding is None:
+            with span("embed"):
+                query_bundle.embedding = self.embed_model.get_query_embedding(query_bundle.query_str)
+        with span("search"):
+            results = self.search(query_bundle.embedding, top_k=self._vector_top_k())
+        return self._to_nodes(self._fuse(query_bundle.query_str, query_bundle.embedding, results))
+
+    async def _aretrieve(self, query_bundle: QueryBundle):
+        # Embedding et lecture des nodes asynchrones : la boucle d'événements n'est pas bloquée
+        if query_bundle.embedding is None:
+            with span("embed"):
+                query_bundle.embedding = await self.embed_model.aget_query_embedding(query_bundle.query_str)
+        with span("search"):
+            results = self.search(query_bundle.embedding, top_k=self._vector_top_k())
+        results = self._fuse(query_bundle.query_str, query_bundle.embedding, results)
+        if not results:
+            return []
+        nodes = await self.docstore.aget_nodes([result[0] for result in results], raise_error=False)
+        return self._to_nodes(results, nodes)
@@ -1,13 +1,27 @@
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 
 class QueryRequest(BaseModel):
     question: str
+    evaluate: bool = False
+
+class Source(BaseModel):
+    node_id: str
+    url: Optional[str] = None
+    score: Optional[float] = None
+    fusion_score: Optional[float] = None
+    text: str
 
 class QueryResponse(BaseModel):
     question: str
     answer: str
+    sources: List[Source] = []
     evaluation: Optional[Dict[str, float]] = None
+    global_score: Optional[float] = None
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    evaluate: bool = False
 
 class EvaluationRequest(BaseModel):
     question: str
@@ -16,4 +30,22 @@ class EvaluationRequest(BaseModel):
 
 class EvaluationResponse(BaseModel):
     scores: Dict[str, float]
-    global_score: float
\ No newline at end of file
+    global_score: float
+
+class RefreshResponse(BaseModel):
+    added: int
+    updated: int
+    removed: int
+    unchanged: int
+    duplicates_removed: int
+    migrated: int
+    embedded_chunks: int
+    skipped: int = 0
+    dedup: Optional[Dict[str, int]] = None
+
+class CacheStatsResponse(BaseModel):
+    # Compteurs entiers (hits, miss, éléments), taux en flottants
+    embeddings: Optional[Dict[str, Union[int, float]]] = None
+    responses: Optional[Dict[str, Union[int, float]]] = None
+    # Requêtes identiques regroupées, par chemin (query, stream)
+    coalescing: Optional[Dict[str, Dict[str, Union[int, float]]]] = None
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Regroupement (« single-flight ») des requêtes identiques en cours.
+
+Quand une question circule, des dizaines de requêtes identiques arrivent
+en même temps, avant que la première n'ait rempli le cache de réponses :
+chacune embedderait la question, interrogerait l'index et appellerait le
+LLM. SingleFlight associe à chaque clé (question normalisée, version de
+l'index...) un seul calcul en cours ; les requêtes qui arrivent pendant ce
+calcul en attendent le résultat au lieu d'en lancer un autre.
+
+- `do(key, fn)` (asyncio) : le calcul tourne dans une tâche partagée ; il
+  est annulé si toutes les requêtes qui l'attendent sont abandonnées.
+- `stream(key, factory)` : même principe pour un générateur asynchrone
+  d'événements ; une requête qui rejoint un flux en cours reçoit d'abord
+  les événements déjà produits, puis les suivants au fil de l'eau.
+- `call(key, fn)` : variante bloquante (threads).
+"""
+import asyncio
+import threading
+
+
+class _Broadcast:
+    """Événements d'un générateur partagé, relus par chaque abonné depuis le début."""
+    def __init__(self, source, on_done):
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(source))
+        self._task.add_done_callback(lambda _: on_done(self))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source):
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+            await source.aclose()
+
+    async def subscribe(self):
+        """À appeler après avoir compté l'abonné (`subscribers`)."""
+        position = 0
+        try:
+            while True:
+                while position < len(self.events):
+                    yield self.events[position]
+                    position += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            # Plus personne n'écoute : la génération est abandonnée
+            if self.subscribers == 0 and not self.done:
+                self._task.cancel()
+
+
+class _Call:
+    """Calcul bloquant en cours et son résultat."""
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Un seul calcul en cours par clé ; compte les requêtes servies par un calcul déjà lancé."""
+    def __init__(self):
+        self._tasks = {}
+        self._waiters = {}
+        self._streams = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def _count(self, leader):
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+    def in_flight(self, key):
+        return key in self._tasks or key in self._streams or key in self._calls
+
+    def _task_done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            self._waiters.pop(key, None)
+        # Exception déjà transmise aux requêtes en attente (ou à personne) : pas d'avertissement
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn):
+        """Résultat de `await fn()`, partagé avec les appels concurrents de même clé."""
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t: self._task_done(key, t))
+        self._count(leader)
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._tasks.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0 and not task.done():
+                    task.cancel()
+
+    def stream(self, key, factory, on_done=None):
+        """
+        Générateur d'événements partagé : `factory()` (générateur asynchrone)
+        n'est appelé que si aucun flux de même clé n'est en cours.
+        `on_done()` est appelé à la fin du flux lancé, quelle qu'en soit
+        l'issue (y compris une annulation avant son premier événement).
+        Retourne (générateur d'événements, True si le flux vient d'être lancé).
+        """
+        broadcast = self._streams.get(key)
+        leader = broadcast is None
+        if leader:
+            broadcast = _Broadcast(factory(), lambda b: self._stream_done(key, b, on_done))
+            self._streams[key] = broadcast
+        self._count(leader)
+        broadcast.subscribers += 1
+        return broadcast.subscribe(), leader
+
+    def _stream_done(self, key, broadcast, on_done):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+        if on_done is not None:
+            on_done()
+
+    def call(self, key, fn):
+        """Variante bloquante de `do` pour les appels synchrones."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._count(leader)
+        if not leader:
+            call.finished.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.finished.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        total = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalescing_ratio": self.followers / total if total else 0.0,
+            "in_flight": len(self._tasks) + len(self._streams) + len(self._calls),
+        }
@@ -0,0 +1,89 @@
+"""
+Disjoncteur des transports résilients (upstream.py).
+
+Usage (depuis Backend/) :
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upstream import AsyncResilientTransport, CircuitBreaker, UpstreamUnavailable
+
+
+class _HangingTransport(httpx.AsyncBaseTransport):
+    """Service qui ne répond jamais (l'appel n'aboutit que par annulation)."""
+    async def handle_async_request(self, request):
+        await asyncio.sleep(3600)
+
+
+class _HealthyTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        return httpx.Response(200, json={"ok": True})
+
+
+def _half_open_transport():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    return AsyncResilientTransport("test", breaker=breaker, max_retries=0, deadline=30.0)
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    transport = _half_open_transport()
+    request = httpx.Request("POST", "http://upstream.test/api/embed", json={"input": "x"})
+
+    async def scenario():
+        transport._transport = _HangingTransport()
+        probe = asyncio.ensure_future(transport.handle_async_request(request))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+        assert transport.breaker.state == "half_open"
+        assert not transport.breaker._probing
+        # Le service est revenu : l'essai suivant passe et referme le disjoncteur
+        transport._transport = _HealthyTransport()
+        response = await transport.handle_async_request(request)
+        assert response.status_code == 200
+        assert transport.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_unexpected_probe_error_releases_half_open_breaker():
+    transport = _half_open_transport()
+    request = httpx.Request("POST", "http://upstream.test/api/embed", json={"input": "x"})
+
+    class _BrokenTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            raise ValueError("erreur locale")
+
+    async def scenario():
+        transport._transport = _BrokenTransport()
+        try:
+            await transport.handle_async_request(request)
+        except ValueError:
+            pass
+        assert not transport.breaker._probing
+        transport._transport = _HealthyTransport()
+        assert (await transport.handle_async_request(request)).status_code == 200
+
+    asyncio.run(scenario())
+
+
+def test_open_breaker_rejects_calls():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    try:
+        breaker.before_call()
+    except UpstreamUnavailable as e:
+        assert e.retry_after > 0
+    else:
+        raise AssertionError("le disjoncteur ouvert aurait dû refuser l'appel")
@@ -0,0 +1,421 @@
+"""
+Couche client résiliente pour les appels à Groq et à Ollama.
+
+Les SDK (openai pour Groq, ollama pour les embeddings) s'appuient sur
+httpx : on leur passe ici des transports httpx qui ajoutent, sous chaque
+requête :
+
+- un pool de connexions keep-alive partagé par tous les appels d'un
+  processus (recréé après un fork, pour les workers pré-forkés) ;
+- des tentatives bornées sur erreur réseau, délai dépassé ou statut
+  429/5xx, espacées par une attente exponentielle avec gigue (« full
+  jitter ») et en respectant l'en-tête Retry-After ;
+- un délai global par appel (toutes tentatives comprises, jusqu'aux
+  en-têtes de la réponse) : le délai de chaque tentative est réduit au
+  temps restant ;
+- un disjoncteur par service : après `failure_threshold` échecs
+  consécutifs, les appels échouent immédiatement pendant `reset_timeout`
+  secondes, puis un seul appel d'essai décide de la réouverture ;
+- en option, des requêtes couvertes (hedging) pour les embeddings de
+  questions : si la réponse tarde plus de `hedge_after` secondes, une
+  seconde requête identique part et la première réponse valide l'emporte.
+
+Un service injoignable se traduit par UpstreamUnavailable (réponse 503 de
+l'API, avec Retry-After) au lieu d'une erreur 500 après un long délai.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+
+import metrics
+
+# Statuts qui justifient une nouvelle tentative
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class UpstreamUnavailable(Exception):
+    """Service amont indisponible : disjoncteur ouvert, tentatives épuisées ou délai dépassé."""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def find_upstream_error(exc):
+    """
+    UpstreamUnavailable à l'origine d'une exception, ou None. Les SDK
+    enveloppent les erreurs du transport (APIConnectionError d'openai...) :
+    on remonte la chaîne des causes.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, UpstreamUnavailable):
+            return exc
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'un service : fermé (appels normaux), ouvert (échec
+    immédiat) après `failure_threshold` échecs consécutifs, semi-ouvert
+    après `reset_timeout` secondes (un seul appel d'essai à la fois).
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def before_call(self):
+        """
+        Lève UpstreamUnavailable si l'appel ne doit pas partir. Retourne True
+        si l'appel est l'essai du mode semi-ouvert : son issue doit être
+        enregistrée (record_success / record_failure) ou abandonnée
+        (release_probe).
+        """
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+        raise UpstreamUnavailable(
+            f"{self.name} indisponible (disjoncteur ouvert après {self.failures} échecs)",
+            retry_after=self.retry_after() or 1.0
+        )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """Essai interrompu sans verdict (annulation, erreur locale) : un autre appel pourra tester le service."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.failure_threshold > 0 and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    print(f"⚠️ {self.name} : disjoncteur ouvert ({self.failures} échecs consécutifs)")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+# Les connexions ouvertes ne doivent pas être partagées avec les workers forkés :
+# un seul hook pour le module, qui recrée le pool des transports encore vivants
+_TRANSPORTS = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    for transport in list(_TRANSPORTS):
+        transport._reset_pool()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def _limit_timeout(request, remaining):
+    """Réduit les délais httpx de la requête au temps restant de l'appel."""
+    timeout = dict(request.extensions.get("timeout") or {})
+    for key in ("connect", "read", "write", "pool"):
+        value = timeout.get(key)
+        timeout[key] = remaining if value is None else min(value, remaining)
+    request.extensions["timeout"] = timeout
+
+
+def _discard(outcome):
+    """Ferme la réponse d'une tentative écartée."""
+    if isinstance(outcome, httpx.Response):
+        outcome.close()
+
+
+async def _adiscard(outcome):
+    if isinstance(outcome, httpx.Response):
+        await outcome.aclose()
+
+
+def _retry_after_header(response):
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _ResilientBase:
+    """Politique commune aux transports synchrone et asynchrone."""
+    def __init__(self, name, breaker=None, max_retries=2, backoff=0.2, backoff_max=2.0, deadline=60.0,
+                 hedge_after=0.0, hedge_paths=(), hedge_max_bytes=16384, limits=None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.hedge_paths = tuple(hedge_paths)
+        self.hedge_max_bytes = hedge_max_bytes
+        self.limits = limits or httpx.Limits(max_connections=32, max_keepalive_connections=32, keepalive_expiry=30.0)
+        self._reset_pool()
+        _TRANSPORTS.add(self)
+
+    def _hedged(self, request):
+        """Seules les petites requêtes (embeddings de questions) sont dupliquées, pas les lots d'indexation."""
+        if self.hedge_after <= 0 or not request.url.path.endswith(self.hedge_paths):
+            return False
+        # Corps JSON en mémoire (longueur connue) : il peut être renvoyé tel quel
+        length = request.headers.get("content-length")
+        return length is not None and int(length) <= self.hedge_max_bytes
+
+    def _failed(self, outcome):
+        """Une réponse ou une exception doit-elle être retentée ?"""
+        if isinstance(outcome, BaseException):
+            return isinstance(outcome, httpx.TransportError)
+        return outcome.status_code in RETRY_STATUSES
+
+    def _record(self, outcome):
+        # Un 429 signale un quota, pas un service en panne : il ne compte pas pour le disjoncteur
+        if not self._failed(outcome) or getattr(outcome, "status_code", None) == 429:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def _delay(self, attempt, response):
+        """Attente exponentielle avec gigue, ou Retry-After si le service en donne un."""
+        retry_after = _retry_after_header(response)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def _give_up(self, attempt, started, delay, outcome):
+        """Tentatives épuisées : UpstreamUnavailable à lever (None pour une réponse à retourner)."""
+        if attempt < self.max_retries and time.monotonic() - started + delay < self.deadline:
+            return None
+        metrics.UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="error")
+        if isinstance(outcome, BaseException):
+            error = UpstreamUnavailable(
+                f"{self.name} injoignable après {attempt + 1} tentative(s) : {outcome!r}",
+                retry_after=self.breaker.retry_after() or 1.0
+            )
+            error.__cause__ = outcome
+            return error
+        return UpstreamUnavailable(
+            f"{self.name} en échec après {attempt + 1} tentative(s) (HTTP {outcome.status_code})",
+            retry_after=_retry_after_header(outcome) or self.breaker.retry_after() or 1.0
+        )
+
+    def _remaining(self, started):
+        remaining = self.deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            metrics.UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="timeout")
+            raise UpstreamUnavailable(f"{self.name} : délai de {self.deadline:.0f} s dépassé", retry_after=1.0)
+        return remaining
+
+
+class ResilientTransport(_ResilientBase, httpx.BaseTransport):
+    """Transport httpx synchrone (ingestion, évaluation, appels bloquants)."""
+    def _reset_pool(self):
+        self._transport = httpx.HTTPTransport(limits=self.limits)
+        self._executor = None
+
+    def _attempt(self, request):
+        try:
+            return self._transport.handle_request(request)
+        except Exception as e:
+            return e
+
+    def _send_hedged(self, request):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.limits.max_connections or 32,
+                                                thread_name_prefix=f"hedge-{self.name}")
+        first = self._executor.submit(self._attempt, request)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        metrics.UPSTREAM_HEDGES.inc(upstream=self.name, result="sent")
+        second = self._executor.submit(self._attempt, request)
+        pending = {first, second}
+        outcome, winner = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if outcome is None or (self._failed(outcome) and not self._failed(result)):
+                    _discard(outcome)
+                    outcome, winner = result, future
+                else:
+                    _discard(result)
+            if not self._failed(outcome):
+                break
+        # La requête perdante se termine en arrière-plan ; sa réponse est fermée
+        for future in pending:
+            future.add_done_callback(lambda f: _discard(f.result()))
+        if winner is second and not self._failed(outcome):
+            metrics.UPSTREAM_HEDGES.inc(upstream=self.name, result="won")
+        return outcome
+
+    def handle_request(self, request):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                _limit_timeout(request, self._remaining(started))
+                outcome = self._send_hedged(request) if self._hedged(request) else self._attempt(request)
+                if isinstance(outcome, BaseException) and not self._failed(outcome):
+                    raise outcome
+                self._record(outcome)
+                probe = False
+            finally:
+                # Essai sans issue enregistrée : le disjoncteur ne doit pas rester bloqué en semi-ouvert
+                if probe:
+                    self.breaker.release_probe()
+            if not self._failed(outcome):
+                metrics.UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="ok")
+                return outcome
+            response = None if isinstance(outcome, BaseException) else outcome
+            delay = self._delay(attempt, response)
+            error = self._give_up(attempt, started, delay, outcome)
+            if response is not None:
+                response.close()
+            if error is not None:
+                raise error
+            attempt += 1
+            metrics.UPSTREAM_RETRIES.inc(upstream=self.name)
+            time.sleep(delay)
+
+    def close(self):
+        self._transport.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class AsyncResilientTransport(_ResilientBase, httpx.AsyncBaseTransport):
+    """Transport httpx asynchrone (chemin /query)."""
+    def _reset_pool(self):
+        self._transport = httpx.AsyncHTTPTransport(limits=self.limits)
+
+    async def _attempt(self, request):
+        try:
+            return await self._transport.handle_async_request(request)
+        except Exception as e:
+            return e
+
+    async def _send_hedged(self, request):
+        first = asyncio.ensure_future(self._attempt(request))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        metrics.UPSTREAM_HEDGES.inc(upstream=self.name, result="sent")
+        second = asyncio.ensure_future(self._attempt(request))
+        pending = {first, second}
+        outcome, winner = None, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if outcome is None or (self._failed(outcome) and not self._failed(result)):
+                    await _adiscard(outcome)
+                    outcome, winner = result, task
+                else:
+                    await _adiscard(result)
+            if not self._failed(outcome):
+                break
+        # La requête perdante est annulée (sa connexion est fermée par httpx)
+        for task in pending:
+            task.cancel()
+        if winner is second and not self._failed(outcome):
+            metrics.UPSTREAM_HEDGES.inc(upstream=self.name, result="won")
+        return outcome
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                _limit_timeout(request, self._remaining(started))
+                if self._hedged(request):
+                    outcome = await self._send_hedged(request)
+                else:
+                    outcome = await self._attempt(request)
+                if isinstance(outcome, BaseException) and not self._failed(outcome):
+                    raise outcome
+                self._record(outcome)
+                probe = False
+            finally:
+                # Essai annulé ou interrompu : le disjoncteur ne doit pas rester bloqué en semi-ouvert
+                if probe:
+                    self.breaker.release_probe()
+            if not self._failed(outcome):
+                metrics.UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="ok")
+                return outcome
+            response = None if isinstance(outcome, BaseException) else outcome
+            delay = self._delay(attempt, response)
+            error = self._give_up(attempt, started, delay, outcome)
+            if response is not None:
+                await response.aclose()
+            if error is not None:
+                raise error
+            attempt += 1
+            metrics.UPSTREAM_RETRIES.inc(upstream=self.name)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def transports(name, pool_size=32, failure_threshold=5, reset_timeout=30.0, **options):
+    """
+    Transports synchrone et asynchrone d'un service, avec un disjoncteur
+    commun. `options` : max_retries, backoff, backoff_max, deadline,
+    hedge_after, hedge_paths, hedge_max_bytes.
+    """
+    breaker = CircuitBreaker(name, failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+    BREAKERS[name] = breaker
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=30.0)
+    return (ResilientTransport(name, breaker=breaker, limits=limits, **options),
+            AsyncResilientTransport(name, breaker=breaker, limits=limits, **options))
+
+
+# Disjoncteurs des services configurés, par nom (état exporté dans /metrics)
+BREAKERS = {}
+
+
+def _collect_breakers():
+    for name, breaker in BREAKERS.items():
+        metrics.UPSTREAM_BREAKER_OPEN.set(0 if breaker.state == "closed" else 1, upstream=name)
+
+
+metrics.REGISTRY.add_collector(_collect_breakers)
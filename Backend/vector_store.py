@@ -0,0 +1,536 @@
+"""
+Vector store persistant au format binaire (matrice .npy mappée en mémoire).
+
+Remplace default__vector_store.json : au lieu de parser des listes de floats
+avec json.load, la matrice des embeddings est ouverte avec np.load(mmap_mode='r').
+Le démarrage ne coûte que le page-in des pages réellement lues et plusieurs
+workers uvicorn partagent la même copie physique via le page cache.
+
+Fichiers écrits dans le dossier de l'index (namespace "default") :
+    default__vectors.npy       matrice (N, D) float32 ou float16, normalisée L2
+    default__node_ids.npy      table des node ids (N,) en octets de largeur fixe
+    default__doc_codes.npy     indice (N,) int32 du document source dans la table "docs"
+    default__mmap_store.json   en-tête : dimension, dtype, nombre de lignes, table des documents
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+DEFAULT_NAMESPACE = "default"
+STORE_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+
+# Taille des blocs de lignes convertis en float32 lors du scoring d'une matrice float16
+_SCORE_BLOCK_ROWS = 65536
+
+
+def _store_paths(persist_dir, namespace=DEFAULT_NAMESPACE):
+    """Retourne les chemins des fichiers du store pour un namespace."""
+    prefix = os.path.join(persist_dir, f"{namespace}__")
+    return {
+        "vectors": prefix + "vectors.npy",
+        "node_ids": prefix + "node_ids.npy",
+        "doc_codes": prefix + "doc_codes.npy",
+        "header": prefix + "mmap_store.json",
+    }
+
+
+def _atomic_save_npy(path, array):
+    """Écrit un tableau .npy dans un fichier temporaire puis le renomme."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_json(path, data):
+    """Écrit un fichier JSON dans un fichier temporaire puis le renomme."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def normalize_rows(matrix):
+    """Normalise chaque ligne en norme L2 (les lignes nulles restent nulles)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def dot_scores(matrix, query_vector, rows=None):
+    """
+    Produit matrice-vecteur entre des embeddings normalisés et une requête,
+    ou matrice-matrice si `query_vector` est de forme (D, Q) : une colonne
+    de scores par requête.
+    Les matrices float16 sont converties en float32 par blocs pour rester
+    sur le chemin BLAS sans matérialiser une copie complète.
+    """
+    if rows is not None:
+        matrix = matrix[rows]
+    if matrix.dtype == np.float32:
+        return matrix @ query_vector
+    scores = np.empty((matrix.shape[0],) + query_vector.shape[1:], dtype=np.float32)
+    for start in range(0, matrix.shape[0], _SCORE_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + _SCORE_BLOCK_ROWS], dtype=np.float32)
+        scores[start:start + block.shape[0]] = block @ query_vector
+    return scores
+
+
+def top_k_indices(scores, k):
+    """
+    Indices des k meilleurs scores, triés par score décroissant.
+    argpartition sélectionne les candidats en O(N), seul le top-k est trié.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+# Métadonnées filtrables : elles sont portées par la table des documents du store
+FILTERABLE_KEYS = ("url", "timestamp", "ref_doc_id")
+
+
+def _match_filter(value, metadata_filter):
+    operator = metadata_filter.operator
+    expected = metadata_filter.value
+    if operator == FilterOperator.EQ:
+        return value == expected
+    if operator == FilterOperator.NE:
+        return value != expected
+    if operator == FilterOperator.IN:
+        return value in expected
+    if operator == FilterOperator.NIN:
+        return value not in expected
+    if operator == FilterOperator.TEXT_MATCH:
+        return value is not None and expected in value
+    if value is None:
+        return False
+    if operator == FilterOperator.GT:
+        return value > expected
+    if operator == FilterOperator.GTE:
+        return value >= expected
+    if operator == FilterOperator.LT:
+        return value < expected
+    if operator == FilterOperator.LTE:
+        return value <= expected
+    raise ValueError(f"Opérateur de filtre non supporté : {operator}")
+
+
+def _match_filters(doc, filters):
+    results = []
+    for metadata_filter in filters.filters:
+        if isinstance(metadata_filter, MetadataFilters):
+            results.append(_match_filters(doc, metadata_filter))
+            continue
+        if metadata_filter.key not in FILTERABLE_KEYS:
+            raise ValueError(
+                f"Filtre sur '{metadata_filter.key}' non supporté (clés : {', '.join(FILTERABLE_KEYS)})"
+            )
+        results.append(_match_filter(doc.get(metadata_filter.key), metadata_filter))
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    if filters.condition == FilterCondition.NOT:
+        return not any(results)
+    return all(results)
+
+
+def filter_mask(docs, doc_codes, filters):
+    """
+    Masque booléen (N,) des lignes qui satisfont les filtres.
+    Les filtres sont évalués une fois par document puis propagés aux lignes.
+    """
+    doc_mask = np.array([_match_filters(doc, filters) for doc in docs], dtype=bool)
+    if doc_mask.size == 0:
+        return np.zeros(len(doc_codes), dtype=bool)
+    return doc_mask[doc_codes]
+
+
+# Instantané immuable des lignes du store : les écritures remplacent l'instantané
+# entier, une recherche concurrente voit donc toujours des tableaux cohérents.
+StoreRows = namedtuple("StoreRows", ["matrix", "node_ids", "doc_codes"])
+
+_EMPTY_ROWS = StoreRows(None, np.empty(0, dtype="S1"), np.empty(0, dtype=np.int32))
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store LlamaIndex dont les embeddings vivent dans une matrice
+    contiguë, normalisée et (une fois persistée) mappée en lecture seule.
+    Le texte des nodes reste dans le docstore (stores_text = False).
+    """
+    stores_text: bool = False
+    dtype: str = "float32"
+
+    _rows = PrivateAttr(default=_EMPTY_ROWS)
+    _docs = PrivateAttr(default_factory=list)
+    _doc_index = PrivateAttr(default_factory=dict)
+    _row_index = PrivateAttr(default=None)
+
+    def __init__(self, dtype="float32", **kwargs):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype non supporté : {dtype} (attendu : {', '.join(SUPPORTED_DTYPES)})")
+        super().__init__(dtype=dtype, **kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "MmapVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    # ------------------------------------------------------------------
+    # Accès en lecture
+    # ------------------------------------------------------------------
+    @property
+    def matrix(self):
+        """Matrice (N, D) des embeddings normalisés, ou None si le store est vide."""
+        return self._rows.matrix
+
+    @property
+    def node_ids(self):
+        """Table (N,) des node ids, encodés en octets."""
+        return self._rows.node_ids
+
+    @property
+    def doc_codes(self):
+        """Indice (N,) du document source de chaque ligne dans `docs`."""
+        return self._rows.doc_codes
+
+    @property
+    def docs(self):
+        """Table des documents sources : ref_doc_id, url et timestamp."""
+        return self._docs
+
+    def snapshot(self):
+        """Instantané cohérent (matrix, node_ids, doc_codes) des lignes courantes."""
+        return self._rows
+
+    def __len__(self):
+        return 0 if self._rows.matrix is None else self._rows.matrix.shape[0]
+
+    def __bool__(self):
+        # Un store vide reste un store : StorageContext.from_defaults teste `if vector_store`
+        return True
+
+    def node_id(self, row, rows=None):
+        """Retourne le node id (str) d'une ligne de la matrice."""
+        rows = rows or self._rows
+        return rows.node_ids[row].decode('utf-8')
+
+    def row_of(self, node_id):
+        """Retourne la ligne d'un node id, ou None s'il est absent."""
+        rows = self._rows
+        cached = self._row_index
+        if cached is None or cached[0] is not rows:
+            cached = (rows, {raw.decode('utf-8'): row for row, raw in enumerate(rows.node_ids.tolist())})
+            self._row_index = cached
+        return cached[1].get(node_id)
+
+    def get(self, text_id):
+        """Retourne l'embedding (normalisé) d'un node."""
+        row = self.row_of(text_id)
+        if row is None:
+            raise KeyError(text_id)
+        return np.asarray(self._rows.matrix[row], dtype=np.float32).tolist()
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+    def _doc_code(self, ref_doc_id, metadata):
+        doc = {
+            "ref_doc_id": ref_doc_id,
+            "url": metadata.get('url'),
+            "timestamp": metadata.get('timestamp'),
+        }
+        code = self._doc_index.get(ref_doc_id)
+        if code is None:
+            code = len(self._docs)
+            self._docs.append(doc)
+            self._doc_index[ref_doc_id] = code
+        else:
+            # Document réinséré (mise à jour) : ses métadonnées peuvent avoir changé
+            self._docs[code] = doc
+        return code
+
+    def _append_rows(self, node_ids, embeddings, doc_codes):
+        embeddings = normalize_rows(embeddings).astype(self.dtype)
+        new_ids = np.array([node_id.encode('utf-8') for node_id in node_ids])
+        new_codes = np.asarray(doc_codes, dtype=np.int32)
+        rows = self._rows
+        if rows.matrix is None or rows.matrix.shape[0] == 0:
+            self._rows = StoreRows(embeddings, new_ids, new_codes)
+        else:
+            # np.concatenate produit une copie en mémoire : la matrice mappée n'est jamais modifiée
+            self._rows = StoreRows(
+                np.concatenate([rows.matrix, embeddings]),
+                np.concatenate([rows.node_ids, new_ids]),
+                np.concatenate([rows.doc_codes, new_codes]),
+            )
+
+    def add_embeddings(self, node_ids, embeddings, ref_doc_ids, metadatas=None):
+        """
+        Ajoute des lignes brutes : node ids, embeddings (N, D), documents
+        sources et métadonnées (url / timestamp) de chaque ligne.
+        """
+        if metadatas is None:
+            metadatas = [{}] * len(node_ids)
+        doc_codes = [
+            self._doc_code(ref_doc_id, metadata)
+            for ref_doc_id, metadata in zip(ref_doc_ids, metadatas)
+        ]
+        self._append_rows(node_ids, embeddings, doc_codes)
+
+    def add(self, nodes, **add_kwargs):
+        """Ajoute des nodes (déjà embeddés) au store."""
+        if not nodes:
+            return []
+        node_ids = [node.node_id for node in nodes]
+        self.add_embeddings(
+            node_ids,
+            [node.get_embedding() for node in nodes],
+            [node.ref_doc_id or "None" for node in nodes],
+            [node.metadata or {} for node in nodes],
+        )
+        return node_ids
+
+    def _keep_rows(self, keep):
+        rows = self._rows
+        self._rows = StoreRows(rows.matrix[keep], rows.node_ids[keep], rows.doc_codes[keep])
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        """Supprime toutes les lignes issues d'un document."""
+        code = self._doc_index.get(ref_doc_id)
+        if code is None or self._rows.matrix is None:
+            return
+        self._keep_rows(self._rows.doc_codes != code)
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        """Supprime des lignes par node id."""
+        if node_ids is None or self._rows.matrix is None:
+            return
+        targets = np.array([node_id.encode('utf-8') for node_id in node_ids])
+        self._keep_rows(~np.isin(self._rows.node_ids, targets))
+
+    def clear(self):
+        self._rows = _EMPTY_ROWS
+        self._docs = []
+        self._doc_index = {}
+        self._row_index = None
+
+    # ------------------------------------------------------------------
+    # Recherche
+    # ------------------------------------------------------------------
+    def query(self, query: VectorStoreQuery, **kwargs):
+        """Recherche exacte des top-k nodes par similarité cosinus."""
+        if query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+        snapshot = self._rows
+        node_rows = None
+        if query.node_ids is not None:
+            node_rows = [row for row in map(self.row_of, query.node_ids) if row is not None]
+        rows, scores = self.search(
+            query.query_embedding, query.similarity_top_k, filters=query.filters,
+            rows=node_rows, snapshot=snapshot
+        )
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=scores.tolist(),
+            ids=[self.node_id(row, snapshot) for row in rows],
+        )
+
+    def candidate_rows(self, filters=None, rows=None, snapshot=None):
+        """
+        Lignes autorisées par les filtres et/ou une liste de lignes,
+        ou None si toute la matrice est candidate.
+        """
+        if filters is None:
+            return None if rows is None else np.asarray(rows, dtype=np.int64)
+        snapshot = snapshot or self._rows
+        mask = filter_mask(self._docs, snapshot.doc_codes, filters)
+        if rows is not None:
+            restricted = np.zeros_like(mask)
+            restricted[np.asarray(rows, dtype=np.int64)] = True
+            mask &= restricted
+        return np.flatnonzero(mask)
+
+    def search(self, query_embedding, top_k, filters=None, rows=None, snapshot=None):
+        """
+        Top-k exact : un seul produit matrice-vecteur suivi d'un argpartition.
+        Retourne (lignes, scores) triés par score décroissant ; les lignes se
+        rapportent à `snapshot` (l'instantané courant par défaut).
+        """
+        snapshot = snapshot or self._rows
+        if snapshot.matrix is None or snapshot.matrix.shape[0] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query_vector = normalize_rows(query_embedding)
+        candidates = self.candidate_rows(filters, rows, snapshot)
+        scores = dot_scores(snapshot.matrix, query_vector, candidates)
+        top = top_k_indices(scores, top_k)
+        top_rows = top if candidates is None else candidates[top]
+        return top_rows, scores[top]
+
+    def search_batch(self, query_embeddings, top_k, filters=None, snapshot=None):
+        """
+        Top-k exact de plusieurs requêtes avec un seul produit matrice-matrice.
+        Retourne une liste de (lignes, scores), une entrée par requête.
+        """
+        snapshot = snapshot or self._rows
+        if snapshot.matrix is None or snapshot.matrix.shape[0] == 0:
+            empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            return [empty for _ in query_embeddings]
+        query_matrix = normalize_rows(query_embeddings)
+        candidates = self.candidate_rows(filters, None, snapshot)
+        scores = dot_scores(snapshot.matrix, query_matrix.T, candidates)
+        results = []
+        for column in range(query_matrix.shape[0]):
+            column_scores = scores[:, column]
+            top = top_k_indices(column_scores, top_k)
+            results.append((top if candidates is None else candidates[top], column_scores[top]))
+        return results
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+    def persist(self, persist_path, fs=None):
+        """
+        Persiste le store dans le dossier de `persist_path`.
+        StorageContext.persist passe le chemin de default__vector_store.json :
+        seul son dossier et son namespace sont utilisés.
+        """
+        persist_dir = os.path.dirname(persist_path) or "."
+        namespace = os.path.basename(persist_path).split("__")[0] or DEFAULT_NAMESPACE
+        self.save(persist_dir, namespace)
+
+    def save(self, persist_dir, namespace=DEFAULT_NAMESPACE):
+        """Écrit les fichiers binaires puis l'en-tête (en dernier, atomiquement)."""
+        os.makedirs(persist_dir, exist_ok=True)
+        paths = _store_paths(persist_dir, namespace)
+        snapshot = self._rows
+        matrix = snapshot.matrix
+        if matrix is None:
+            matrix = np.empty((0, 0), dtype=self.dtype)
+
+        # Sur disque, la table des documents est compactée (documents supprimés retirés)
+        used_codes, doc_codes = np.unique(snapshot.doc_codes, return_inverse=True)
+        docs = [self._docs[code] for code in used_codes]
+
+        _atomic_save_npy(paths["vectors"], np.ascontiguousarray(matrix, dtype=self.dtype))
+        _atomic_save_npy(paths["node_ids"], snapshot.node_ids)
+        _atomic_save_npy(paths["doc_codes"], doc_codes.astype(np.int32))
+        _atomic_save_json(paths["header"], {
+            "version": STORE_VERSION,
+            "dtype": self.dtype,
+            "count": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "normalized": True,
+            "docs": docs,
+        })
+
+    @staticmethod
+    def exists(persist_dir, namespace=DEFAULT_NAMESPACE):
+        """Indique si un store binaire est présent dans le dossier."""
+        return os.path.exists(_store_paths(persist_dir, namespace)["header"])
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, namespace=DEFAULT_NAMESPACE, mmap=True):
+        """
+        Charge un store persisté. Avec mmap=True, la matrice est mappée en
+        lecture seule : aucune copie n'est faite tant que le store n'est pas modifié.
+        """
+        paths = _store_paths(persist_dir, namespace)
+        with open(paths["header"], 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get("version") != STORE_VERSION:
+            raise ValueError(f"Version de store inconnue : {header.get('version')}")
+
+        store = cls(dtype=header["dtype"])
+        mmap_mode = 'r' if mmap else None
+        matrix = np.load(paths["vectors"], mmap_mode=mmap_mode)
+        node_ids = np.load(paths["node_ids"], mmap_mode=mmap_mode)
+        doc_codes = np.load(paths["doc_codes"], mmap_mode=mmap_mode)
+        if not (matrix.shape[0] == node_ids.shape[0] == doc_codes.shape[0] == header["count"]):
+            raise ValueError(f"Store incohérent dans {persist_dir} : tailles des fichiers différentes")
+
+        store._rows = StoreRows(matrix if header["count"] else None, node_ids, doc_codes)
+        store._docs = header["docs"]
+        store._doc_index = {doc["ref_doc_id"]: code for code, doc in enumerate(store._docs)}
+        return store
+
+    @classmethod
+    def from_simple_vector_store(cls, json_path, dtype="float32"):
+        """
+        Convertit un default__vector_store.json (SimpleVectorStore) en MmapVectorStore.
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        store = cls(dtype=dtype)
+        embedding_dict = data.get("embedding_dict", {})
+        text_id_to_ref_doc_id = data.get("text_id_to_ref_doc_id", {})
+        metadata_dict = data.get("metadata_dict") or {}
+
+        node_ids = list(embedding_dict.keys())
+        if not node_ids:
+            return store
+        store.add_embeddings(
+            node_ids,
+            np.array([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32),
+            [text_id_to_ref_doc_id.get(node_id, "None") for node_id in node_ids],
+            [metadata_dict.get(node_id, {}) for node_id in node_ids],
+        )
+        return store
+
+
+def convert_json_store(persist_dir, namespace=DEFAULT_NAMESPACE, dtype="float32"):
+    """
+    Convertit le vector store JSON d'un index persistant vers le format binaire.
+    Le fichier JSON d'origine est conservé.
+    """
+    json_path = os.path.join(persist_dir, f"{namespace}__vector_store.json")
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"Fichier {json_path} non trouvé.")
+    store = MmapVectorStore.from_simple_vector_store(json_path, dtype=dtype)
+    store.save(persist_dir, namespace)
+    return store
+
+
+def load_vector_store(persist_dir, dtype="float32"):
+    """
+    Charge le store binaire d'un index, en le convertissant depuis le JSON
+    au premier démarrage si nécessaire.
+    """
+    if not MmapVectorStore.exists(persist_dir):
+        print("🔄 Conversion du vector store JSON vers le format binaire...")
+        convert_json_store(persist_dir, dtype=dtype)
+    return MmapVectorStore.from_persist_dir(persist_dir)
+
+
+if __name__ == "__main__":
+    from config import INDEX_DIR, VECTOR_DTYPE
+
+    parser = argparse.ArgumentParser(description="Convertit default__vector_store.json au format binaire mmap.")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Dossier de l'index persistant")
+    parser.add_argument("--dtype", default=VECTOR_DTYPE, choices=SUPPORTED_DTYPES)
+    args = parser.parse_args()
+
+    converted = convert_json_store(args.index_dir, dtype=args.dtype)
+    print(f"✅ {len(converted)} vecteurs convertis ({args.dtype}) dans {args.index_dir}")
@@ -82,8 +82,8 @@ async function handleSendMessage() {
     typingIndicator.style.display = 'flex';
     
     try {
-        // Appeler l'API
-        const response = await fetch(`${API_BASE_URL}/query`, {
+        // Appeler l'API en streaming : la réponse s'affiche au fil de la génération
+        const response = await fetchWhenReady(`${API_BASE_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -95,19 +95,38 @@ async function handleSendMessage() {
             throw new Error(`Erreur HTTP: ${response.status}`);
         }
         
-        const data = await response.json();
+        let answer = '';
+        let sources = [];
+        let message = null;
         
-        // Masquer l'indicateur de frappe
-        typingIndicator.style.display = 'none';
-        
-        // Ajouter la réponse
-        addMessage('assistant', data.answer, data.evaluation);
+        await readEventStream(response, (event, data) => {
+            if (event === 'sources') {
+                sources = data.sources;
+            } else if (event === 'token') {
+                // Premier token : remplacer l'indicateur de frappe par la bulle
+                if (message === null) {
+                    typingIndicator.style.display = 'none';
+                    message = addMessage('assistant', '');
+                }
+                answer += data.text;
+                message.bubble.innerHTML = formatText(answer);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (event === 'done') {
+                if (message === null) {
+                    typingIndicator.style.display = 'none';
+                    message = addMessage('assistant', answer);
+                }
+                addSources(message, sources);
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
         
         // Sauvegarder dans l'historique
         conversationHistory.push({
             question,
-            answer: data.answer,
-            evaluation: data.evaluation,
+            answer,
+            sources,
             timestamp: new Date().toISOString()
         });
         
@@ -129,6 +148,78 @@ async function handleSendMessage() {
     }
 }
 
+// Appeler l'API en réessayant tant que le modèle est en cours de chargement (503)
+async function fetchWhenReady(url, options, maxRetries = 30) {
+    for (let attempt = 0; ; attempt++) {
+        const response = await fetch(url, options);
+        if (response.status !== 503 || attempt >= maxRetries) {
+            return response;
+        }
+        const retryAfter = parseFloat(response.headers.get('Retry-After')) || 2;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+}
+
+// Lire un flux Server-Sent Events reçu en réponse à un POST
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Les événements sont séparés par une ligne vide
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
+// Formater le texte (remplacer les \n par des <br>)
+function formatText(text) {
+    return text.replace(/\n/g, '<br>');
+}
+
+// Afficher les sources sous la réponse
+function addSources(message, sources) {
+    if (!sources || sources.length === 0) return;
+    
+    const sourcesDiv = document.createElement('div');
+    sourcesDiv.className = 'message-sources';
+    sourcesDiv.textContent = '📚 Sources : ';
+    
+    // Une seule entrée par URL
+    [...new Set(sources.map(source => source.url).filter(Boolean))].forEach(url => {
+        const link = document.createElement('a');
+        link.href = url;
+        link.target = '_blank';
+        link.rel = 'noopener noreferrer';
+        link.textContent = new URL(url).hostname;
+        link.title = url;
+        sourcesDiv.appendChild(link);
+    });
+    
+    message.content.insertBefore(sourcesDiv, message.meta);
+}
+
 // Ajouter un message au chat
 function addMessage(role, text, evaluation = null, isError = false) {
     const messageDiv = document.createElement('div');
@@ -149,8 +240,7 @@ function addMessage(role, text, evaluation = null, isError = false) {
         bubbleDiv.style.color = '#991B1B';
     }
     
-    // Formater le texte (remplacer les \n par des <br>)
-    bubbleDiv.innerHTML = text.replace(/\n/g, '<br>');
+    bubbleDiv.innerHTML = formatText(text);
     
     const metaDiv = document.createElement('div');
     metaDiv.className = 'message-meta';
@@ -190,6 +280,8 @@ function addMessage(role, text, evaluation = null, isError = false) {
     
     // Scroll vers le bas
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    
+    return { bubble: bubbleDiv, content: contentDiv, meta: metaDiv };
 }
 
 // Effacer la conversation
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """
-Script pour lancer les serveurs Backend et Frontend dans des terminaux separés
+Script pour lancer le Backend (N workers) et le Frontend dans ce terminal
 """
 
-import subprocess
+import argparse
 import os
+import subprocess
 import sys
 import time
 
@@ -13,6 +14,13 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BACKEND_DIR = os.path.join(SCRIPT_DIR, "Backend")
 FRONTEND_DIR = os.path.join(SCRIPT_DIR, "Frontend")
 
+parser = argparse.ArgumentParser(description="Lancement Chat IA Diabète")
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Nombre de workers du Backend")
+parser.add_argument("--port", type=int, default=8000, help="Port du Backend")
+parser.add_argument("--report-interval", type=float, default=60,
+                    help="Secondes entre deux rapports mémoire des workers (0 = désactivé)")
+args = parser.parse_args()
+
 print("=" * 50)
 print("   Lancement Chat IA Diabète")
 print("=" * 50)
@@ -20,37 +28,48 @@ print()
 print("🚀 Démarrage des serveurs...")
 print()
 
+processes = []
 try:
-    # Lancer le Backend dans un nouveau terminal
-    print("📍 Lancement du Backend...")
-    backend_cmd = ['cmd', '/c', 'start', 'cmd', '/k', 'python -m uvicorn main:app --reload --port 8000']
-    subprocess.Popen(
-        backend_cmd,
+    # Backend : processus maître qui charge l'index une fois puis forke les workers
+    print(f"📍 Lancement du Backend ({args.workers} workers)...")
+    processes.append(subprocess.Popen(
+        [sys.executable, "prefork.py", "--workers", str(args.workers), "--port", str(args.port),
+         "--report-interval", str(args.report_interval)],
         cwd=BACKEND_DIR
-    )
-    
-    # Attendre 3 secondes
-    time.sleep(3)
-    
-    # Lancer le Frontend dans un nouveau terminal
+    ))
+
+    # Frontend
     print("📍 Lancement du Frontend...")
-    frontend_cmd = ['cmd', '/c', 'start', 'cmd', '/k', 'python serve.py']
-    subprocess.Popen(
-        frontend_cmd,
-        cwd=FRONTEND_DIR
-    )
-    
+    processes.append(subprocess.Popen([sys.executable, "serve.py"], cwd=FRONTEND_DIR))
+
     print()
     print("✅ Les deux serveurs sont en cours de lancement !")
     print()
-    print("📍 Terminal 1 : Backend FastAPI sur http://localhost:8000")
-    print("📍 Terminal 2 : Frontend sur http://localhost:3001")
+    print(f"📍 Backend FastAPI sur http://localhost:{args.port} (état du chargement : /ready)")
+    print("📍 Frontend sur http://localhost:3001")
     print()
     print("🌐 Ouvrez votre navigateur à : http://localhost:3001/index.html")
     print()
-    print("Pour arrêter les serveurs, fermez les deux fenêtres de terminal.")
+    print("Pour arrêter les serveurs : Ctrl+C")
+    print()
+
+    # Si un des serveurs s'arrête, on arrête l'autre
+    while all(process.poll() is None for process in processes):
+        time.sleep(0.5)
+
+except KeyboardInterrupt:
     print()
-    
+    print("🧹 Arrêt des serveurs...")
 except Exception as e:
     print(f"❌ Erreur : {e}")
     sys.exit(1)
+finally:
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    print("✅ Serveurs arrêtés")